@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from ..models.datastore import Datastore
 from ..models.document import Document
@@ -217,6 +217,37 @@ class BaseConnector(ABC):
         """
         pass
 
+    @abstractmethod
+    async def search_ids(
+        self, datastore_name: str, query: str, feedback_documents: List[str] = None, n_hits=10
+    ) -> Dict[str, float]:
+        """Searches for documents and returns only their ids and scores.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            query (str): Query to search for.
+            n_hits (int): Number of hits to return.
+            feedback_documents (List[str]): List of relevant feedback documents
+
+        Returns:
+            Dict[str, float]: Mapping from the ids of the hits to their scores.
+        """
+        pass
+
+    @abstractmethod
+    async def search_ids_batch(self, datastore_name: str, queries: List[str], n_hits=10) -> List[Dict[str, float]]:
+        """Searches for the documents of several queries at once and returns only their ids and scores.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            queries (List[str]): Queries to search for.
+            n_hits (int): Number of hits to return per query.
+
+        Returns:
+            List[Dict[str, float]]: For each query a mapping from the ids of the hits to their scores.
+        """
+        pass
+
     @abstractmethod
     async def search_for_id(self, datastore_name: str, query: str, document_id: str):
         """Searches for documents and selects the document with the given id from the results.
@@ -8,9 +8,44 @@ class Settings(BaseSettings):
     ES_SEARCH_TIMEOUT: int = Field(30, env="ES_SEARCH_TIMEOUT")
 
     FAISS_PORT: int = Field(5000, env="FAISS_PORT")
+    FAISS_TIMEOUT: float = Field(10, env="FAISS_TIMEOUT")
+    FAISS_POOL_SIZE: int = Field(100, env="FAISS_POOL_SIZE")
+    # Directory with dense indices that are searched in-process instead of by FAISS containers
+    EMBEDDED_INDEX_DIR: str = Field("", env="EMBEDDED_INDEX_DIR")
+    EMBEDDED_INDEX_TYPE: str = Field("flat", env="EMBEDDED_INDEX_TYPE")
+    EMBEDDED_INDEX_NLIST: int = Field(1024, env="EMBEDDED_INDEX_NLIST")
+    EMBEDDED_INDEX_NPROBE: int = Field(32, env="EMBEDDED_INDEX_NPROBE")
+    EMBEDDED_INDEX_HNSW_M: int = Field(32, env="EMBEDDED_INDEX_HNSW_M")
+    EMBEDDED_INDEX_EF_SEARCH: int = Field(128, env="EMBEDDED_INDEX_EF_SEARCH")
+    # Seconds until the lookup whether an index has embedded files is repeated
+    EMBEDDED_INDEX_LOOKUP_TTL: float = Field(60, env="EMBEDDED_INDEX_LOOKUP_TTL")
     UPLOAD_BATCH_SIZE: int = Field(1000, env="UPLOAD_BATCH_SIZE")
+    UPLOAD_BATCH_BYTES: int = Field(10 * 1024 * 1024, env="UPLOAD_BATCH_BYTES")
+    # Number of bulk requests in flight per uploaded file and number of batches parsed ahead
+    UPLOAD_CONCURRENCY: int = Field(4, env="UPLOAD_CONCURRENCY")
+    UPLOAD_QUEUE_SIZE: int = Field(8, env="UPLOAD_QUEUE_SIZE")
+    # Number of urls that are uploaded at the same time
+    UPLOAD_SOURCE_CONCURRENCY: int = Field(4, env="UPLOAD_SOURCE_CONCURRENCY")
+    # Seconds without progress after which a running upload job can be resumed, e.g. after a server restart
+    UPLOAD_JOB_LEASE: int = Field(60, env="UPLOAD_JOB_LEASE")
     MODEL_API_URL: str = Field("", env="MODEL_API_URL")
+    ENCODE_BATCH_SIZE: int = Field(256, env="ENCODE_BATCH_SIZE")
     MAX_RETURN_ITEMS: int = Field(10000, env="MAX_RETURN_ITEMS")
+    # Cache of the fetched documents, a size of 0 disables the cache
+    DOCUMENT_CACHE_SIZE: int = Field(0, env="DOCUMENT_CACHE_SIZE")
+    DOCUMENT_CACHE_TTL: float = Field(300, env="DOCUMENT_CACHE_TTL")
+    DOCUMENT_CACHE_REDIS_URL: str = Field("", env="DOCUMENT_CACHE_REDIS_URL")
+    # Knowledge graph lookups: maximum number of edges per node and of nodes matching a name
+    KG_MAX_DEGREE: int = Field(10000, env="KG_MAX_DEGREE")
+    KG_MAX_NAME_MATCHES: int = Field(100, env="KG_MAX_NAME_MATCHES")
+    # Number of node lookups per msearch request, larger lookups are split into concurrent requests
+    KG_MSEARCH_BATCH_SIZE: int = Field(500, env="KG_MSEARCH_BATCH_SIZE")
+    # Number of expanded nodes after which a subgraph extraction stops expanding further hops
+    KG_SUBGRAPH_MAX_NODES: int = Field(100000, env="KG_SUBGRAPH_MAX_NODES")
+    # In-process cache of the edges of each node, a size of 0 disables the cache. Changes of a graph only invalidate
+    # the cache of the worker that made them, the other workers can serve stale edges until the TTL expires
+    KG_ADJACENCY_CACHE_SIZE: int = Field(0, env="KG_ADJACENCY_CACHE_SIZE")
+    KG_ADJACENCY_CACHE_TTL: float = Field(60, env="KG_ADJACENCY_CACHE_TTL")
 
     # Mongo ROOT
     MONGO_INITDB_ROOT_USERNAME: str = Field("", env="MONGO_INITDB_ROOT_USERNAME")
@@ -1,10 +1,12 @@
+import asyncio
 import logging
-from typing import List
+from typing import Dict, List
 from ..models.document import Document
 
-from ..models.query import QueryResult
+from ..models.query import FusionMethod, QueryResult
 from .base_connector import BaseConnector
 from .faiss import FaissClient
+from .fusion import fuse
 from .model_api import ModelAPIClient
 
 logger = logging.getLogger(__name__)
@@ -17,6 +19,15 @@ class DenseRetrieval:
         self.model_api = model_api
         self.faiss = faiss
 
+    def invalidate_index(self, datastore_name: str, index_name: str):
+        """Drops the cached state of the index after it was created, updated or deleted.
+
+        Args:
+            datastore_name (str): The datastore of the index.
+            index_name (str): The index.
+        """
+        self.faiss.invalidate(datastore_name, index_name)
+
     async def status(self, datastore_name: str, index_name: str, credential_token: str = None) -> bool:
         """Checks the availability of the given index.
         This method queries both the FAISS web service and the Model API server as both are required for retrieval.
@@ -32,7 +43,7 @@ class DenseRetrieval:
         if index is None:
             return False
 
-        status = self.faiss.status(datastore_name, index_name) is not None
+        status = (await self.faiss.status(datastore_name, index_name)) is not None
         if status:
             status &= self.model_api.is_alive(index, credential_token)
         return status
@@ -68,7 +79,7 @@ class DenseRetrieval:
         query_vector = await self.model_api.encode_query(query, index, credential_token)
         logger.debug(f"Received query embedding:{query_vector}")
         # 2. Search for the query in the FAISS store. This will return ids of matched docs.
-        queried = self.faiss.search(datastore_name, index_name, query_vector, top_k)
+        queried = await self.faiss.search(datastore_name, index_name, query_vector, top_k)
         logger.debug(f"Queried Faiss, returned {len(queried)} docs.")
         # 3. Lookup the retrieved doc ids in the ES index.
         docs: List[Document] = await self.conn.get_document_batch(datastore_name, list(queried.keys()))
@@ -79,6 +90,56 @@ class DenseRetrieval:
 
         return sorted(results, key=lambda x: x.score, reverse=True)
 
+    async def hybrid_search(
+        self,
+        datastore_name: str,
+        index_name: str,
+        query: str,
+        top_k: int = 10,
+        credential_token: str = None,
+        fusion: FusionMethod = FusionMethod.rrf,
+        alpha: float = 0.5,
+        rrf_k: int = 60,
+        feedback_documents: List[str] = None,
+    ) -> List[QueryResult]:
+        """Searches for documents with BM25 and the dense index concurrently and fuses both rankings.
+        The documents of the union of both rankings are looked up with a single batch request.
+
+        Args:
+            datastore_name (str): The datastore in which to search.
+            index_name (str): The index to be used for the dense retrieval.
+            query (str): The query string.
+            top_k (int, optional): The number of hits of each retriever and of the fused ranking. Defaults to 10.
+            fusion (FusionMethod, optional): Reciprocal rank fusion or linear combination of the normalized scores.
+                Defaults to FusionMethod.rrf.
+            alpha (float, optional): Weight of the dense scores for the linear combination. Defaults to 0.5.
+            rrf_k (int, optional): Rank constant of the reciprocal rank fusion. Defaults to 60.
+            feedback_documents (List[str], optional): Relevant feedback documents for the BM25 retrieval.
+
+        Returns:
+            list: A list of QueryResults with the fused scores.
+        """
+        index = await self.conn.get_index(datastore_name, index_name)
+        if index is None:
+            raise ValueError("Datastore or index not found.")
+
+        if credential_token is None:
+            raise ValueError("Credential token is None")
+
+        async def dense_search():
+            query_vector = await self.model_api.encode_query(query, index, credential_token)
+            return await self.faiss.search(datastore_name, index_name, query_vector, top_k)
+
+        # 1. Run the BM25 search and the dense search (query encoding and FAISS) concurrently.
+        sparse, dense = await asyncio.gather(
+            self.conn.search_ids(datastore_name, query, feedback_documents=feedback_documents, n_hits=top_k),
+            dense_search(),
+        )
+        logger.debug(f"Hybrid search retrieved {len(sparse)} BM25 and {len(dense)} dense docs.")
+        # 2. Fuse the rankings and lookup the documents of both retrievers in the ES index at once.
+        fused = fuse(sparse, dense, fusion, alpha, rrf_k)
+        return (await self._lookup_batch(datastore_name, [fused], top_k))[0]
+
     async def search_by_vector(
         self, 
         datastore_name: str, 
@@ -104,7 +165,7 @@ class DenseRetrieval:
         # 0. Ensure the query vector has the right dimensionality.
         query_vector = query_vector + [0] * (index.embedding_size - len(query_vector))
         # 1. Search for the query in the FAISS store. This will return ids of matched docs.
-        queried = self.faiss.search(datastore_name, index_name, query_vector, top_k)
+        queried = await self.faiss.search(datastore_name, index_name, query_vector, top_k)
         # 2. Lookup the retrieved doc ids in the ES index.
         docs: List[Document] = await self.conn.get_document_batch(datastore_name, list(queried.keys()))
         results = []
@@ -140,7 +201,7 @@ class DenseRetrieval:
         # 1. Get the query embedding from the model api
         query_vector = await self.model_api.encode_query(query, index, credential_token)
         # 2. Search for the query in the FAISS store. This will return ids of matched docs.
-        queried = self.faiss.explain(
+        queried = await self.faiss.explain(
             datastore_name, 
             index_name, 
             query_vector, 
@@ -165,5 +226,152 @@ class DenseRetrieval:
         if index is None:
             raise ValueError("Datastore or index not found.")
 
-        result = self.faiss.reconstruct(datastore_name, index_name, document_id)
+        result = await self.faiss.reconstruct(datastore_name, index_name, document_id)
         return result["vector"]
+
+    async def _lookup_batch(
+        self, datastore_name: str, rankings: List[Dict[str, float]], top_k: int
+    ) -> List[List[QueryResult]]:
+        """Looks up the top_k documents of several rankings with a single batch request.
+        Documents retrieved for more than one query are only fetched once.
+
+        Args:
+            datastore_name (str): The datastore of the documents.
+            rankings (list): For each query a mapping from document ids to scores.
+            top_k (int): The number of hits to return per query.
+
+        Returns:
+            list: For each query a list of QueryResults sorted by score.
+        """
+        rankings = [dict(sorted(ranking.items(), key=lambda x: x[1], reverse=True)[:top_k]) for ranking in rankings]
+        doc_ids = list(dict.fromkeys(doc_id for ranking in rankings for doc_id in ranking))
+        docs: List[Document] = await self.conn.get_document_batch(datastore_name, doc_ids) if doc_ids else []
+        docs_by_id = {str(doc["id"]): doc for doc in docs}
+        return [
+            [
+                QueryResult(document=docs_by_id[doc_id], score=score, id=doc_id)
+                for doc_id, score in ranking.items()
+                if doc_id in docs_by_id
+            ]
+            for ranking in rankings
+        ]
+
+    async def search_batch(
+        self,
+        datastore_name: str,
+        index_name: str,
+        queries: List[str],
+        top_k: int = 10,
+        credential_token: str = None,
+    ) -> List[List[QueryResult]]:
+        """Searches for the documents matching several query strings.
+        The queries are encoded together, searched with one FAISS request and their documents are looked up at once.
+
+        Args:
+            datastore_name (str): The datastore in which to search.
+            index_name (str): The index to be used.
+            queries (List[str]): The query strings.
+            top_k (int, optional): The number of hits to return per query. Defaults to 10.
+
+        Returns:
+            list: For each query a list of QueryResults.
+        """
+        index = await self.conn.get_index(datastore_name, index_name)
+        if index is None:
+            raise ValueError("Datastore or index not found.")
+
+        if credential_token is None:
+            raise ValueError("Credential token is None")
+
+        query_vectors = await self.model_api.encode_queries(queries, index, credential_token)
+        queried = await self.faiss.search_batch(datastore_name, index_name, query_vectors, top_k)
+        return await self._lookup_batch(datastore_name, queried, top_k)
+
+    async def search_by_vector_batch(
+        self,
+        datastore_name: str,
+        index_name: str,
+        query_vectors: List[List[float]],
+        top_k: int = 10,
+    ) -> List[List[QueryResult]]:
+        """Searches for the documents matching several query vectors.
+
+        Args:
+            datastore_name (str): The datastore in which to search.
+            index_name (str): The index to be used.
+            query_vectors (list): The query vectors.
+            top_k (int, optional): The number of hits to return per query. Defaults to 10.
+
+        Returns:
+            list: For each query vector a list of QueryResults.
+        """
+        index = await self.conn.get_index(datastore_name, index_name)
+        if index is None:
+            raise ValueError("Datastore or index not found.")
+
+        query_vectors = [vector + [0] * (index.embedding_size - len(vector)) for vector in query_vectors]
+        queried = await self.faiss.search_batch(datastore_name, index_name, query_vectors, top_k)
+        return await self._lookup_batch(datastore_name, queried, top_k)
+
+    async def sparse_search_batch(
+        self, datastore_name: str, queries: List[str], top_k: int = 10
+    ) -> List[List[QueryResult]]:
+        """Searches for the documents matching several query strings with BM25 in a single multi search request.
+
+        Args:
+            datastore_name (str): The datastore in which to search.
+            queries (List[str]): The query strings.
+            top_k (int, optional): The number of hits to return per query. Defaults to 10.
+
+        Returns:
+            list: For each query a list of QueryResults.
+        """
+        if await self.conn.get_datastore(datastore_name) is None:
+            raise ValueError("Datastore not found.")
+
+        rankings = await self.conn.search_ids_batch(datastore_name, queries, n_hits=top_k)
+        return await self._lookup_batch(datastore_name, rankings, top_k)
+
+    async def hybrid_search_batch(
+        self,
+        datastore_name: str,
+        index_name: str,
+        queries: List[str],
+        top_k: int = 10,
+        credential_token: str = None,
+        fusion: FusionMethod = FusionMethod.rrf,
+        alpha: float = 0.5,
+        rrf_k: int = 60,
+    ) -> List[List[QueryResult]]:
+        """Searches for the documents matching several query strings with BM25 and the dense index concurrently
+        and fuses the rankings of each query (see hybrid_search).
+
+        Args:
+            datastore_name (str): The datastore in which to search.
+            index_name (str): The index to be used for the dense retrieval.
+            queries (List[str]): The query strings.
+            top_k (int, optional): The number of hits of each retriever and of the fused ranking. Defaults to 10.
+            fusion (FusionMethod, optional): The fusion method. Defaults to FusionMethod.rrf.
+            alpha (float, optional): Weight of the dense scores for the linear combination. Defaults to 0.5.
+            rrf_k (int, optional): Rank constant of the reciprocal rank fusion. Defaults to 60.
+
+        Returns:
+            list: For each query a list of QueryResults with the fused scores.
+        """
+        index = await self.conn.get_index(datastore_name, index_name)
+        if index is None:
+            raise ValueError("Datastore or index not found.")
+
+        if credential_token is None:
+            raise ValueError("Credential token is None")
+
+        async def dense_search():
+            query_vectors = await self.model_api.encode_queries(queries, index, credential_token)
+            return await self.faiss.search_batch(datastore_name, index_name, query_vectors, top_k)
+
+        sparse, dense = await asyncio.gather(
+            self.conn.search_ids_batch(datastore_name, queries, n_hits=top_k),
+            dense_search(),
+        )
+        fused = [fuse(s, d, fusion, alpha, rrf_k) for s, d in zip(sparse, dense)]
+        return await self._lookup_batch(datastore_name, fused, top_k)
@@ -0,0 +1,147 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List
+
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCache:
+    """Caches the sources of documents fetched from the datastore.
+
+    Documents are kept in an in-process LRU cache and optionally in Redis, which is shared by all workers.
+    Entries expire after the TTL. Changed documents are invalidated in both tiers, but the in-process
+    entries of other workers are only dropped when they expire, so the TTL bounds how long they can be stale.
+    """
+
+    def __init__(self, max_size: int = 0, ttl: float = 300, redis_url: str = None):
+        """Initializes a new instance of DocumentCache.
+
+        Args:
+            max_size (int, optional): Maximum number of documents in the in-process cache, 0 disables the cache.
+                Defaults to 0.
+            ttl (float, optional): Seconds until cached documents expire. Defaults to 300.
+            redis_url (str, optional): Url of the Redis server used as second cache tier. Defaults to None.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.redis = None
+        if self.enabled and redis_url:
+            import redis.asyncio
+
+            self.redis = redis.asyncio.Redis.from_url(redis_url)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def _redis_key(datastore_name: str, document_id: str) -> str:
+        return f"document:{datastore_name}:{document_id}"
+
+    async def get_many(self, datastore_name: str, document_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns the cached sources of the given documents.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            document_ids (List[str]): Ids of the documents.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Mapping from the ids of the cached documents to their sources.
+        """
+        now = time.monotonic()
+        found = {}
+        for document_id in document_ids:
+            key = (datastore_name, document_id)
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            expires, source = entry
+            if expires < now:
+                del self.entries[key]
+                continue
+            self.entries.move_to_end(key)
+            found[document_id] = source
+
+        missing = [document_id for document_id in document_ids if document_id not in found]
+        if self.redis is not None and missing:
+            try:
+                stored = await self.redis.mget([self._redis_key(datastore_name, i) for i in missing])
+            except Exception:
+                logger.exception("Reading documents from Redis failed")
+                stored = [None] * len(missing)
+            for document_id, value in zip(missing, stored):
+                if value is not None:
+                    found[document_id] = json.loads(value)
+                    self._put(datastore_name, document_id, found[document_id], now)
+
+        self.hits += len(found)
+        self.misses += len(document_ids) - len(found)
+        return found
+
+    async def put_many(self, datastore_name: str, sources: Dict[str, Dict[str, Any]]):
+        """Caches the sources of documents.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            sources (Dict[str, Dict[str, Any]]): Mapping from the ids of the documents to their sources.
+        """
+        now = time.monotonic()
+        for document_id, source in sources.items():
+            self._put(datastore_name, document_id, source, now)
+        if self.redis is not None and sources:
+            try:
+                pipeline = self.redis.pipeline()
+                for document_id, source in sources.items():
+                    key = self._redis_key(datastore_name, document_id)
+                    pipeline.set(key, json.dumps(source), ex=int(self.ttl) or None)
+                await pipeline.execute()
+            except Exception:
+                logger.exception("Writing documents to Redis failed")
+
+    def _put(self, datastore_name: str, document_id: str, source: Dict[str, Any], now: float):
+        key = (datastore_name, document_id)
+        self.entries[key] = (now + self.ttl, source)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def invalidate(self, datastore_name: str, document_ids: Iterable[str]):
+        """Removes changed documents from the cache.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            document_ids (Iterable[str]): Ids of the changed documents.
+        """
+        document_ids = [str(document_id) for document_id in document_ids]
+        for document_id in document_ids:
+            self.entries.pop((datastore_name, document_id), None)
+        if self.redis is not None and document_ids:
+            try:
+                await self.redis.delete(*[self._redis_key(datastore_name, i) for i in document_ids])
+            except Exception:
+                logger.exception("Deleting documents from Redis failed")
+
+    async def invalidate_datastore(self, datastore_name: str):
+        """Removes all documents of a datastore from the cache.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+        """
+        for key in [key for key in self.entries if key[0] == datastore_name]:
+            del self.entries[key]
+        if self.redis is not None:
+            try:
+                keys = [key async for key in self.redis.scan_iter(match=self._redis_key(datastore_name, "*"))]
+                if keys:
+                    await self.redis.delete(*keys)
+            except Exception:
+                logger.exception("Deleting documents from Redis failed")
+
+    def statistics(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "max_size": self.max_size}
@@ -0,0 +1,361 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from filelock import FileLock
+
+from .config import settings
+from .faiss import FaissClient
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ["flat", "ivf", "hnsw"]
+# Number of embeddings that are scored (and converted to float32) at once by the flat search
+BLOCK_SIZE = 65536
+
+
+def _chunk_index(path: str) -> int:
+    """Returns the chunk index that offline_encoding_for_data_api.py inserts before the file extension."""
+    match = re.search(r"_(\d+)\.h5$", path)
+    return int(match.group(1)) if match else 0
+
+
+def _is_converted(npy_path: str, path: str) -> bool:
+    """Checks whether the .npy file was converted from the current version of the chunk file."""
+    return os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(path)
+
+
+def _memmap_embeddings(path: str) -> np.ndarray:
+    """Memory-maps the embeddings of an HDF5 chunk file.
+
+    Uncompressed contiguous datasets are mapped in place. Compressed datasets are converted once to an .npy file
+    next to the chunk, which is then mapped. Either way all worker processes share the pages of the embeddings.
+    """
+    import h5py
+
+    with h5py.File(path, "r") as f:
+        dataset = f["embeddings"]
+        offset = dataset.id.get_offset()
+        if offset is not None:
+            return np.memmap(path, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+
+        npy_path = path + ".npy"
+        with FileLock(npy_path + ".lock"):
+            if not _is_converted(npy_path, path):
+                logger.info(f"Converting compressed embeddings of {path} to {npy_path}")
+                out = np.lib.format.open_memmap(npy_path + ".tmp", mode="w+", dtype=dataset.dtype, shape=dataset.shape)
+                for start in range(0, dataset.shape[0], BLOCK_SIZE):
+                    out[start : start + BLOCK_SIZE] = dataset[start : start + BLOCK_SIZE]
+                out.flush()
+                del out
+                os.replace(npy_path + ".tmp", npy_path)
+    return np.load(npy_path, mmap_mode="r")
+
+
+def _memmap_ids(path: str) -> np.ndarray:
+    """Memory-maps the ids of an HDF5 chunk file.
+
+    The ids are converted once to an .npy file of fixed-length byte strings next to the chunk, which is then mapped,
+    so that all worker processes share the pages of the ids like those of the embeddings.
+    """
+    import h5py
+
+    npy_path = path + ".ids.npy"
+    with FileLock(npy_path + ".lock"):
+        if not _is_converted(npy_path, path):
+            logger.info(f"Converting the ids of {path} to {npy_path}")
+            with h5py.File(path, "r") as f:
+                dataset = f["ids"]
+                blocks = [slice(start, start + BLOCK_SIZE) for start in range(0, dataset.shape[0], BLOCK_SIZE)]
+                if dataset.dtype.kind == "S":
+                    # without the h5py metadata, which .npy files cannot store
+                    dtype = np.dtype(dataset.dtype.str)
+                else:
+                    # variable-length strings are stored with the length of the longest id
+                    itemsize = max((np.asarray(dataset[block], dtype="S").itemsize for block in blocks), default=1)
+                    dtype = np.dtype(f"S{itemsize}")
+                out = np.lib.format.open_memmap(npy_path + ".tmp", mode="w+", dtype=dtype, shape=dataset.shape)
+                for block in blocks:
+                    out[block] = np.asarray(dataset[block], dtype="S")
+                out.flush()
+                del out
+            os.replace(npy_path + ".tmp", npy_path)
+    return np.load(npy_path, mmap_mode="r")
+
+
+class EmbeddedIndex:
+    """A dense index that is searched inside the datastore-api process.
+
+    The index consists of the HDF5 chunk files written by offline_encoding_for_data_api.py (datasets 'ids' and
+    'embeddings'). The embeddings are memory-mapped and either searched exhaustively ('flat') or with an IVF or HNSW
+    faiss index that is built once from the embeddings and stored next to them. Scores are inner products.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index_type: str = None,
+        nlist: int = None,
+        nprobe: int = None,
+        hnsw_m: int = None,
+        ef_search: int = None,
+    ):
+        """Loads the index in the given directory.
+
+        Settings in an optional 'index.json' in the directory take precedence over the arguments,
+        which default to the EMBEDDED_INDEX_* settings.
+
+        Args:
+            path (str): Directory with the HDF5 chunk files of the index.
+            index_type (str, optional): One of 'flat', 'ivf' or 'hnsw'.
+            nlist (int, optional): Number of IVF clusters.
+            nprobe (int, optional): Number of IVF clusters that are searched.
+            hnsw_m (int, optional): Number of neighbors per HNSW node.
+            ef_search (int, optional): Size of the HNSW candidate list while searching.
+        """
+        config = {}
+        if os.path.exists(os.path.join(path, "index.json")):
+            with open(os.path.join(path, "index.json"), "r") as f:
+                config = json.load(f)
+        self.path = path
+        self.index_type = config.get("type", index_type or settings.EMBEDDED_INDEX_TYPE)
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {self.index_type}. Choose one of {INDEX_TYPES}.")
+        self.nlist = config.get("nlist", nlist or settings.EMBEDDED_INDEX_NLIST)
+        self.nprobe = config.get("nprobe", nprobe or settings.EMBEDDED_INDEX_NPROBE)
+        self.hnsw_m = config.get("hnsw_m", hnsw_m or settings.EMBEDDED_INDEX_HNSW_M)
+        self.ef_search = config.get("ef_search", ef_search or settings.EMBEDDED_INDEX_EF_SEARCH)
+
+        files = sorted(glob.glob(os.path.join(path, "*.h5")), key=_chunk_index)
+        if not files:
+            raise ValueError(f"No HDF5 files found in {path}.")
+        self.embeddings: List[np.ndarray] = []
+        self.ids: List[np.ndarray] = []
+        for file in files:
+            # ids are kept as compact byte strings and only decoded for the hits
+            self.ids.append(_memmap_ids(file))
+            self.embeddings.append(_memmap_embeddings(file))
+        self.offsets = np.cumsum([0] + [len(embeddings) for embeddings in self.embeddings])
+        self.dimension = self.embeddings[0].shape[1]
+
+        self.ann = None
+        if self.index_type != "flat":
+            self.ann = self._load_ann()
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def _blocks(self):
+        """Iterates over the embeddings in float32 blocks with their global start positions."""
+        for offset, embeddings in zip(self.offsets, self.embeddings):
+            for start in range(0, len(embeddings), BLOCK_SIZE):
+                yield offset + start, np.asarray(embeddings[start : start + BLOCK_SIZE], dtype=np.float32)
+
+    def _load_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            raise EnvironmentError(f"Index type {self.index_type} requires faiss (pip install faiss-cpu).")
+
+        if self.index_type == "ivf":
+            ann_path = os.path.join(self.path, f"ivf{self.nlist}.faiss")
+        else:
+            ann_path = os.path.join(self.path, f"hnsw{self.hnsw_m}.faiss")
+        with FileLock(ann_path + ".lock"):
+            if not os.path.exists(ann_path):
+                faiss.write_index(self._build_ann(faiss), ann_path + ".tmp")
+                os.replace(ann_path + ".tmp", ann_path)
+        try:
+            # memory-mapped indices share their pages between the worker processes
+            ann = faiss.read_index(ann_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            ann = faiss.read_index(ann_path)
+
+        if self.index_type == "ivf":
+            faiss.extract_index_ivf(ann).nprobe = self.nprobe
+        else:
+            ann.hnsw.efSearch = self.ef_search
+        return ann
+
+    def _build_ann(self, faiss):
+        logger.info(f"Building {self.index_type} index for {len(self)} embeddings in {self.path}")
+        if self.index_type == "ivf":
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            ann = faiss.IndexIVFFlat(quantizer, self.dimension, self.nlist, faiss.METRIC_INNER_PRODUCT)
+            # train the clusters on a random sample of the embeddings
+            sample = np.sort(np.random.default_rng(0).permutation(len(self))[: self.nlist * 64])
+            ann.train(self._reconstruct_positions(sample))
+        else:
+            ann = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        for _, block in self._blocks():
+            ann.add(block)
+        return ann
+
+    def _locate(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        chunks = np.searchsorted(self.offsets, positions, side="right") - 1
+        return chunks, positions - self.offsets[chunks]
+
+    def _reconstruct_positions(self, positions: np.ndarray) -> np.ndarray:
+        chunks, local = self._locate(positions)
+        return np.stack([self.embeddings[c][i] for c, i in zip(chunks, local)]).astype(np.float32)
+
+    def _flat_search(self, queries: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start, block in self._blocks():
+            scores = queries @ block.T
+            k = min(top_k, scores.shape[1])
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, candidates, axis=1)], axis=1)
+            best_positions = np.concatenate([best_positions, candidates + start], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_positions = np.take_along_axis(best_positions, keep, axis=1)
+        return best_scores, best_positions
+
+    def search(self, query_vectors: List[List[float]], top_k: int = 10) -> List[Dict[str, float]]:
+        """Searches for the nearest documents of several query vectors.
+
+        Args:
+            query_vectors (list): The query vectors.
+            top_k (int, optional): The number of hits per query vector. Defaults to 10.
+
+        Returns:
+            list: For each query vector a dictionary mapping the ids of the hits to their scores.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)[:, : self.dimension]
+        top_k = min(top_k, len(self))
+        if top_k <= 0:
+            return [{} for _ in queries]
+        if self.ann is not None:
+            scores, positions = self.ann.search(np.ascontiguousarray(queries), top_k)
+        else:
+            scores, positions = self._flat_search(queries, top_k)
+
+        results = []
+        for query_scores, query_positions in zip(scores, positions):
+            # faiss pads the results with -1 if it finds less than top_k documents
+            found = query_positions >= 0
+            chunks, local = self._locate(query_positions[found])
+            ids = [self.ids[c][i].decode() for c, i in zip(chunks, local)]
+            hits = sorted(zip(ids, query_scores[found].tolist()), key=lambda x: x[1], reverse=True)
+            results.append(dict(hits))
+        return results
+
+    def reconstruct(self, document_id: str) -> Optional[np.ndarray]:
+        """Returns the embedding of the document or None if the document is not in the index."""
+        document_id = str(document_id).encode()
+        for ids, embeddings in zip(self.ids, self.embeddings):
+            matches = np.flatnonzero(ids == document_id)
+            if len(matches):
+                return np.asarray(embeddings[matches[0]], dtype=np.float32)
+        return None
+
+
+class EmbeddedIndexClient:
+    """Serves dense indices from the datastore-api process instead of FAISS containers.
+
+    Provides the interface of FaissClient. The index of a datastore is loaded from
+    '{EMBEDDED_INDEX_DIR}/{datastore_name}/{index_name}' on its first use.
+    Indices without files in this directory are forwarded to their FAISS container. Whether an index is embedded
+    is looked up at most every EMBEDDED_INDEX_LOOKUP_TTL seconds, or after the index was created, updated or deleted
+    through this process (see invalidate).
+    """
+
+    def __init__(self, index_dir: str = None, fallback: FaissClient = None):
+        """Initializes a new instance of EmbeddedIndexClient.
+
+        Args:
+            index_dir (str, optional): Directory with the indices. Defaults to settings.EMBEDDED_INDEX_DIR.
+            fallback (FaissClient, optional): Client for the indices that are not embedded.
+                Defaults to a new FaissClient.
+        """
+        self.index_dir = index_dir if index_dir is not None else settings.EMBEDDED_INDEX_DIR
+        self.fallback = fallback if fallback is not None else FaissClient()
+        self._indices: Dict[Tuple[str, str], EmbeddedIndex] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # expiry time and result of the lookups of the index files
+        self._lookups: Dict[Tuple[str, str], Tuple[float, bool]] = {}
+
+    def _index_path(self, datastore_name, index_name) -> str:
+        return os.path.join(self.index_dir, datastore_name, index_name)
+
+    def is_embedded(self, datastore_name, index_name) -> bool:
+        key = (datastore_name, index_name)
+        if key in self._indices:
+            return True
+        now = time.monotonic()
+        lookup = self._lookups.get(key)
+        if lookup is None or lookup[0] < now:
+            embedded = bool(self.index_dir) and bool(
+                glob.glob(os.path.join(self._index_path(datastore_name, index_name), "*.h5"))
+            )
+            lookup = self._lookups[key] = (now + settings.EMBEDDED_INDEX_LOOKUP_TTL, embedded)
+        return lookup[1]
+
+    def invalidate(self, datastore_name, index_name):
+        """Drops the loaded index and the lookup of its files, e.g. after new files were uploaded for the index."""
+        self._indices.pop((datastore_name, index_name), None)
+        self._lookups.pop((datastore_name, index_name), None)
+
+    async def _get_index(self, datastore_name, index_name) -> EmbeddedIndex:
+        key = (datastore_name, index_name)
+        if key not in self._indices:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                if key not in self._indices:
+                    loop = asyncio.get_running_loop()
+                    self._indices[key] = await loop.run_in_executor(
+                        None, EmbeddedIndex, self._index_path(datastore_name, index_name)
+                    )
+        return self._indices[key]
+
+    async def close(self):
+        await self.fallback.close()
+
+    async def status(self, datastore_name, index_name) -> Optional[dict]:
+        if not self.is_embedded(datastore_name, index_name):
+            return await self.fallback.status(datastore_name, index_name)
+        try:
+            index = await self._get_index(datastore_name, index_name)
+        except Exception:
+            logger.exception(f"Loading the embedded index {datastore_name}/{index_name} failed")
+            return None
+        return {"index_type": index.index_type, "size": len(index), "dimension": index.dimension}
+
+    async def search(self, datastore_name, index_name, query_vector, top_k=10) -> Dict[str, float]:
+        return (await self.search_batch(datastore_name, index_name, [query_vector], top_k))[0]
+
+    async def search_batch(self, datastore_name, index_name, query_vectors, top_k=10) -> List[Dict[str, float]]:
+        if not self.is_embedded(datastore_name, index_name):
+            return await self.fallback.search_batch(datastore_name, index_name, query_vectors, top_k)
+        index = await self._get_index(datastore_name, index_name)
+        # numpy and faiss release the GIL, so the search does not block the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, index.search, query_vectors, top_k)
+
+    async def explain(self, datastore_name, index_name, query_vector, document_id) -> dict:
+        if not self.is_embedded(datastore_name, index_name):
+            return await self.fallback.explain(datastore_name, index_name, query_vector, document_id)
+        index = await self._get_index(datastore_name, index_name)
+        embedding = index.reconstruct(document_id)
+        if embedding is None:
+            raise ValueError("Document not found.")
+        query = np.asarray(query_vector, dtype=np.float32)[: index.dimension]
+        return {"score": float(query @ embedding)}
+
+    async def reconstruct(self, datastore_name, index_name, document_id) -> dict:
+        if not self.is_embedded(datastore_name, index_name):
+            return await self.fallback.reconstruct(datastore_name, index_name, document_id)
+        index = await self._get_index(datastore_name, index_name)
+        embedding = index.reconstruct(document_id)
+        if embedding is None:
+            raise ValueError("Document not found.")
+        return {"vector": embedding.tolist()}
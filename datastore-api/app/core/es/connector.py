@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 import logging
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import elasticsearch.exceptions
 from elasticsearch import AsyncElasticsearch
@@ -13,6 +13,7 @@ from ...models.index import Index
 from ...models.query import QueryResult
 from ...models.stats import DatastoreStats
 from ..base_connector import BaseConnector
+from ..document_cache import DocumentCache
 from .class_converter import ElasticsearchClassConverter
 
 
@@ -25,14 +26,16 @@ class ElasticsearchConnector(BaseConnector):
     datastore_suffix = "-docs"
     datastore_search_suffix = "-search-indices"
 
-    def __init__(self, host: str, converter = ElasticsearchClassConverter()):
+    def __init__(self, host: str, converter = ElasticsearchClassConverter(), document_cache: DocumentCache = None):
         """Initializes a new instance of ElasticsearchConnector.
 
         Args:
             host (str): Hostname of the Elasticsearch instance.
+            document_cache (DocumentCache, optional): Cache for the fetched documents. Defaults to no cache.
         """
         super().__init__(converter=converter)
         self.es = AsyncElasticsearch(hosts=[host], timeout=settings.ES_SEARCH_TIMEOUT)
+        self.document_cache = document_cache if document_cache is not None else DocumentCache()
 
     # --- Datastore schemas ---
     # Each datastore is represented by two ES indices:
@@ -109,6 +112,7 @@ class ElasticsearchConnector(BaseConnector):
         try:
             resp1 = await self.es.indices.delete(index=self._datastore_docs_index_name(datastore_name))
             resp2 = await self.es.indices.delete(index=self._datastore_search_index_name(datastore_name))
+            await self.document_cache.invalidate_datastore(datastore_name)
             return resp1["acknowledged"] and resp2["acknowledged"]
         except elasticsearch.exceptions.NotFoundError:
             return False
@@ -230,6 +234,13 @@ class ElasticsearchConnector(BaseConnector):
             datastore_name (str): Name of the datastore.
             document_id (str): Id of the document.
         """
+        if self.document_cache.enabled:
+            try:
+                documents = await self.get_document_batch(datastore_name, [document_id])
+            except elasticsearch.exceptions.NotFoundError:
+                return None
+            return documents[0] if documents else None
+
         docs_index = self._datastore_docs_index_name(datastore_name)
         try:
             result = await self.es.get(index=docs_index, id=document_id)
@@ -243,10 +254,31 @@ class ElasticsearchConnector(BaseConnector):
         Args:
             datastore_name (str): Name of the datastore.
             document_ids (List[str]): Ids of the documents.
+
+        Returns:
+            List[Document]: The documents that exist, in the order of the given ids.
         """
         docs_index = self._datastore_docs_index_name(datastore_name)
-        results = await self.es.mget(index=docs_index, body={"ids": document_ids})
-        return [self.converter.convert_to_document(doc["_source"], doc['_id']) for doc in results["docs"]]
+        if not self.document_cache.enabled:
+            results = await self.es.mget(index=docs_index, body={"ids": document_ids})
+            return [
+                self.converter.convert_to_document(doc["_source"], doc['_id'])
+                for doc in results["docs"] if doc.get("found", True)
+            ]
+
+        # only the documents that are not cached are fetched from Elasticsearch
+        document_ids = [str(document_id) for document_id in document_ids]
+        sources = await self.document_cache.get_many(datastore_name, document_ids)
+        missing = list(dict.fromkeys(document_id for document_id in document_ids if document_id not in sources))
+        if missing:
+            results = await self.es.mget(index=docs_index, body={"ids": missing})
+            fetched = {doc["_id"]: doc["_source"] for doc in results["docs"] if doc.get("found", True)}
+            await self.document_cache.put_many(datastore_name, fetched)
+            sources.update(fetched)
+        return [
+            self.converter.convert_to_document(sources[document_id], document_id)
+            for document_id in document_ids if document_id in sources
+        ]
 
     async def add_document(self, datastore_name: str, document_id: str, document: Document) -> Tuple[bool, bool]:
         """Adds a new document.
@@ -265,6 +297,7 @@ class ElasticsearchConnector(BaseConnector):
             id=document_id,
             body=self.converter.convert_from_document(document),
         )
+        await self.document_cache.invalidate(datastore_name, [document_id])
 
         return result["_shards"]["successful"] > 0, result["result"] == "created"
 
@@ -295,6 +328,7 @@ class ElasticsearchConnector(BaseConnector):
                 )
 
         sucesses, errors = await async_bulk(self.es, actions, stats_only=True, raise_on_error=False)
+        await self.document_cache.invalidate(datastore_name, [action["_id"] for action in actions])
         errors += additional_errors
         return sucesses, errors
 
@@ -315,6 +349,7 @@ class ElasticsearchConnector(BaseConnector):
             id=document_id,
             body={"doc": self.converter.convert_from_document(document)},
         )
+        await self.document_cache.invalidate(datastore_name, [document_id])
         return result["_shards"]["successful"] > 0, result["result"] == "created"
 
     async def delete_document(self, datastore_name: str, document_id: str) -> bool:
@@ -327,9 +362,11 @@ class ElasticsearchConnector(BaseConnector):
         docs_index = self._datastore_docs_index_name(datastore_name)
         try:
             result = await self.es.delete(index=docs_index, id=document_id)
-            return result["result"] == "deleted"
         except elasticsearch.exceptions.NotFoundError:
-            return False
+            result = None
+        # invalidated after the delete, so that concurrent reads cannot cache the document again
+        await self.document_cache.invalidate(datastore_name, [document_id])
+        return result is not None and result["result"] == "deleted"
 
     async def has_document(self, datastore_name: str, document_id: str) -> bool:
         """Checks if a document exists.
@@ -343,6 +380,41 @@ class ElasticsearchConnector(BaseConnector):
 
     # --- Search ---
 
+    @staticmethod
+    def _search_body(query: str, feedback_documents: List[str] = None, n_hits=10) -> dict:
+        """Builds the BM25 query, optionally boosting documents similar to the feedback documents."""
+        if not feedback_documents:
+            return {
+                "query": {
+                    "multi_match": {
+                        "query": query,
+                    }
+                },
+                "size": n_hits,
+            }
+        return {
+            "query": {
+                "bool": {
+                    "must": {
+                        "multi_match": {
+                            "query": query
+                        }
+                    },
+                    "should" : [
+                        {
+                            "more_like_this": {
+                                "like": feedback_documents,
+                                "min_term_freq": 1,
+                                "max_query_terms": 20,
+                                "fields": ["title", "text"]
+                            }
+                        }
+                    ]
+                }
+            },
+            "size": n_hits
+        }
+
     async def search(self, datastore_name: str, query: str, feedback_documents: List[str] = None, n_hits=10) -> List[QueryResult]:
         """Searches for documents.
 
@@ -353,43 +425,61 @@ class ElasticsearchConnector(BaseConnector):
             feedback_documents (List[str]): List of relevant feedback documents
         """
         docs_index = self._datastore_docs_index_name(datastore_name)
-        if not feedback_documents:
-            search_body = {
-                "query": {
-                    "multi_match": {
-                        "query": query,
-                    }
-                },
-                "size": n_hits,
-            }
-        else:
-            docs_index = self._datastore_docs_index_name(datastore_name)
-            search_body = {
-                "query": {
-                    "bool": {
-                        "must": {
-                            "multi_match": {
-                                "query": query
-                            }
-                        },
-                        "should" : [
-                            {
-                                "more_like_this": {
-                                    "like": feedback_documents,
-                                    "min_term_freq": 1,
-                                    "max_query_terms": 20,
-                                    "fields": ["title", "text"]
-                                }
-                            }
-                        ]
-                    }
-                },
-                "size": n_hits
-            }
+        search_body = self._search_body(query, feedback_documents, n_hits)
         result = await self.es.search(index=docs_index, body=search_body)
 
         return self.converter.convert_to_query_results(result)
 
+    async def search_ids(
+        self, datastore_name: str, query: str, feedback_documents: List[str] = None, n_hits=10
+    ) -> Dict[str, float]:
+        """Searches for documents and returns only their ids and scores.
+        The document sources are not transferred, so that they can be fetched together with other hits later.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            query (str): Query to search for.
+            n_hits (int): Number of hits to return.
+            feedback_documents (List[str]): List of relevant feedback documents
+
+        Returns:
+            Dict[str, float]: Mapping from the ids of the hits to their scores.
+        """
+        docs_index = self._datastore_docs_index_name(datastore_name)
+        search_body = self._search_body(query, feedback_documents, n_hits)
+        search_body["_source"] = False
+        result = await self.es.search(index=docs_index, body=search_body)
+
+        return {hit["_id"]: hit["_score"] for hit in result["hits"]["hits"]}
+
+    async def search_ids_batch(self, datastore_name: str, queries: List[str], n_hits=10) -> List[Dict[str, float]]:
+        """Searches for the documents of several queries with a single multi search request.
+
+        Args:
+            datastore_name (str): Name of the datastore.
+            queries (List[str]): Queries to search for.
+            n_hits (int): Number of hits to return per query.
+
+        Returns:
+            List[Dict[str, float]]: For each query a mapping from the ids of the hits to their scores.
+        """
+        if not queries:
+            return []
+        docs_index = self._datastore_docs_index_name(datastore_name)
+        search_bodies = []
+        for query in queries:
+            search_body = self._search_body(query, n_hits=n_hits)
+            search_body["_source"] = False
+            search_bodies.extend([{}, search_body])
+        result = await self.es.msearch(index=docs_index, body=search_bodies)
+
+        rankings = []
+        for response in result["responses"]:
+            if "error" in response:
+                raise EnvironmentError(f"Elasticsearch search failed: {response['error']}")
+            rankings.append({hit["_id"]: hit["_score"] for hit in response["hits"]["hits"]})
+        return rankings
+
     async def search_for_id(self, datastore_name: str, query: str, document_id: str):
         """Searches for documents and selects the document with the given id from the results.
 
@@ -1,6 +1,9 @@
+import asyncio
 import logging
-from typing import List, Optional
-import requests
+from typing import Dict, List, Optional
+
+import aiohttp
+
 from .config import settings
 from ..models.query import QueryResult
 
@@ -9,55 +12,93 @@ logger = logging.getLogger(__name__)
 
 
 class FaissClient:
-    """Wraps access to the FAISS server."""
+    """Wraps access to the FAISS server.
+
+    Every index is served by its own FAISS container. The client keeps one aiohttp session
+    with a keep-alive connection pool per container, so that searches do not block the event loop
+    and do not open a new connection for every request.
+    """
+
+    def __init__(self, timeout: float = None, pool_size: int = None):
+        """Initializes a new instance of FaissClient.
+
+        Args:
+            timeout (float, optional): Total timeout of a request in seconds. Defaults to settings.FAISS_TIMEOUT.
+            pool_size (int, optional): Maximum number of connections per FAISS container.
+                Defaults to settings.FAISS_POOL_SIZE.
+        """
+        self.timeout = aiohttp.ClientTimeout(total=timeout if timeout is not None else settings.FAISS_TIMEOUT)
+        self.pool_size = pool_size if pool_size is not None else settings.FAISS_POOL_SIZE
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
 
     @staticmethod
     def build_faiss_url(datastore_name, index_name):
         url = 'http://' + '_'.join(['faiss', datastore_name, index_name]) + f':{settings.FAISS_PORT}'
         return url
 
-    def status(self, datastore_name, index_name) -> Optional[dict]:
-        url = f"{self.build_faiss_url(datastore_name, index_name)}/index_list"
-        response = requests.get(url)
-        if response.status_code != 200:
-            logger.info(response.text)
+    def _session(self, faiss_url) -> aiohttp.ClientSession:
+        """Returns the pooled session of the FAISS container."""
+        session = self._sessions.get(faiss_url)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size), timeout=self.timeout
+            )
+            self._sessions[faiss_url] = session
+        return session
+
+    def invalidate(self, datastore_name, index_name):
+        """Nothing to drop, the FAISS containers load their indices themselves."""
+
+    async def close(self):
+        """Closes the connection pools of all FAISS containers."""
+        sessions, self._sessions = list(self._sessions.values()), {}
+        await asyncio.gather(*(session.close() for session in sessions))
+
+    async def _request(self, datastore_name, index_name, method, path, **kwargs):
+        faiss_url = self.build_faiss_url(datastore_name, index_name)
+        try:
+            async with self._session(faiss_url).request(method, faiss_url + path, **kwargs) as response:
+                if response.status != 200:
+                    logger.info(await response.text())
+                    raise EnvironmentError(f"Faiss server returned {response.status}.")
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            logger.info(f"Request to faiss at {faiss_url}{path} failed: {err!r}")
+            raise EnvironmentError("Faiss server not reachable.") from err
+
+    async def status(self, datastore_name, index_name) -> Optional[dict]:
+        try:
+            return await self._request(datastore_name, index_name, "GET", "/index_list")
+        except EnvironmentError:
             return None
 
-        queried = response.json()
-        return queried
+    async def search(self, datastore_name, index_name, query_vector, top_k=10) -> List[QueryResult]:
+        return (await self.search_batch(datastore_name, index_name, [query_vector], top_k))[0]
 
-    def search(self, datastore_name, index_name, query_vector, top_k=10) -> List[QueryResult]:
-        url = f"{self.build_faiss_url(datastore_name, index_name)}/search"
-        data = {"k": top_k, "vectors": [query_vector]}
-        logger.debug(f"querying faiss at {url}") 
-        response = requests.post(url, json=data)
-        if response.status_code != 200:
-            logger.info(response.text)
-            raise EnvironmentError(f"Faiss server returned {response.status_code}.")
-        
-        logger.debug(f"received response from datastore api:\n{response.content}")
-        
-        queried = response.json()[0]
-        return queried
+    async def search_batch(self, datastore_name, index_name, query_vectors, top_k=10) -> List[Dict[str, float]]:
+        """Searches for the nearest documents of several query vectors with a single request.
 
-    def explain(self, datastore_name, index_name, query_vector, document_id) -> QueryResult:
-        url = f"{self.build_faiss_url(datastore_name, index_name)}/explain"
-        data = {"vector": query_vector, "id": document_id}
-        response = requests.post(url, json=data)
-        if response.status_code != 200:
-            logger.info(response.text)
-            raise EnvironmentError(f"Faiss server returned {response.status_code}.")
+        Args:
+            datastore_name (str): The datastore in which to search.
+            index_name (str): The index to be used.
+            query_vectors (list): The query vectors.
+            top_k (int, optional): The number of hits per query vector. Defaults to 10.
 
-        queried = response.json()
+        Returns:
+            list: For each query vector a dictionary mapping the ids of the hits to their scores.
+        """
+        logger.debug(f"querying faiss at {self.build_faiss_url(datastore_name, index_name)} "
+                     f"with {len(query_vectors)} vectors")
+        queried = await self._request(
+            datastore_name, index_name, "POST", "/search", json={"k": top_k, "vectors": query_vectors}
+        )
+        logger.debug(f"received response from faiss:\n{queried}")
         return queried
 
-    def reconstruct(self, datastore_name, index_name, document_id) -> List[float]:
-        url = f"{self.build_faiss_url(datastore_name, index_name)}/reconstruct"
-        params = {"id": document_id}
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            logger.info(response.text)
-            raise EnvironmentError(f"Faiss server returned {response.status_code}.")
+    async def explain(self, datastore_name, index_name, query_vector, document_id) -> QueryResult:
+        data = {"vector": query_vector, "id": document_id}
+        return await self._request(datastore_name, index_name, "POST", "/explain", json=data)
 
-        queried = response.json()
-        return queried
+    async def reconstruct(self, datastore_name, index_name, document_id) -> List[float]:
+        params = {"id": document_id}
+        return await self._request(datastore_name, index_name, "GET", "/reconstruct", params=params)
@@ -0,0 +1,78 @@
+from typing import Dict, List
+
+from ..models.query import FusionMethod
+
+
+def reciprocal_rank_fusion(rankings: List[Dict[str, float]], k: int = 60) -> Dict[str, float]:
+    """Fuses several rankings with reciprocal rank fusion.
+
+    Every document scores the sum of 1 / (k + rank) over all rankings it appears in. Only the ranks are used,
+    so that the scales of the BM25 and dense scores do not matter.
+
+    Args:
+        rankings (List[Dict[str, float]]): Mappings from document ids to the scores of each retriever.
+        k (int, optional): Constant dampening the influence of the top ranks. Defaults to 60.
+
+    Returns:
+        Dict[str, float]: Mapping from the document ids to the fused scores.
+    """
+    fused = {}
+    for ranking in rankings:
+        ranked_ids = sorted(ranking, key=ranking.get, reverse=True)
+        for rank, doc_id in enumerate(ranked_ids, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def _min_max_normalize(scores: Dict[str, float]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {doc_id: 1.0 for doc_id in scores}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in scores.items()}
+
+
+def linear_fusion(sparse: Dict[str, float], dense: Dict[str, float], alpha: float = 0.5) -> Dict[str, float]:
+    """Fuses a sparse and a dense ranking with a linear combination of their min-max normalized scores.
+
+    Documents missing in one of the rankings score 0 for that ranking.
+
+    Args:
+        sparse (Dict[str, float]): Mapping from document ids to the BM25 scores.
+        dense (Dict[str, float]): Mapping from document ids to the dense scores.
+        alpha (float, optional): Weight of the dense scores, the sparse scores are weighted with 1 - alpha.
+            Defaults to 0.5.
+
+    Returns:
+        Dict[str, float]: Mapping from the document ids to the fused scores.
+    """
+    sparse, dense = _min_max_normalize(sparse), _min_max_normalize(dense)
+    return {
+        doc_id: (1 - alpha) * sparse.get(doc_id, 0.0) + alpha * dense.get(doc_id, 0.0)
+        for doc_id in sparse.keys() | dense.keys()
+    }
+
+
+def fuse(
+    sparse: Dict[str, float],
+    dense: Dict[str, float],
+    fusion: FusionMethod = FusionMethod.rrf,
+    alpha: float = 0.5,
+    rrf_k: int = 60,
+) -> Dict[str, float]:
+    """Fuses a sparse and a dense ranking with the given fusion method.
+
+    Args:
+        sparse (Dict[str, float]): Mapping from document ids to the BM25 scores.
+        dense (Dict[str, float]): Mapping from document ids to the dense scores.
+        fusion (FusionMethod, optional): The fusion method. Defaults to FusionMethod.rrf.
+        alpha (float, optional): Weight of the dense scores for the linear combination. Defaults to 0.5.
+        rrf_k (int, optional): Rank constant of the reciprocal rank fusion. Defaults to 60.
+
+    Returns:
+        Dict[str, float]: Mapping from the document ids to the fused scores.
+    """
+    if fusion == FusionMethod.linear:
+        return linear_fusion(sparse, dense, alpha)
+    return reciprocal_rank_fusion([sparse, dense], rrf_k)
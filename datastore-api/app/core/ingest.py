@@ -0,0 +1,364 @@
+import asyncio
+import gzip
+import heapq
+import io
+import itertools
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from .base_connector import BaseConnector
+from .config import settings
+from ..models.document import Document
+from ..models.upload import UploadJob, UploadJobStatus
+
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+CHUNK_SIZE = 1 << 20
+# Minimum number of seconds between two progress updates of an upload job in MongoDB
+JOB_SAVE_INTERVAL = 1.0
+# Maximum number of seconds between two updates of a running upload job, must be well below UPLOAD_JOB_LEASE
+JOB_HEARTBEAT_INTERVAL = 10.0
+
+# Upload jobs running in this process by id
+_running_jobs: Dict[str, asyncio.Task] = {}
+
+
+class UploadSourceError(Exception):
+    """Raised if the documents of an upload source cannot be read."""
+
+
+class UploadJobClaimed(Exception):
+    """Raised if an upload job was resumed by another run, e.g. on another server, while it was running."""
+
+
+@dataclass
+class IngestResult:
+    """Outcome of uploading the documents of one source."""
+
+    successful_uploads: int = 0
+    errors: int = 0
+    # number of lines from the start of the source whose documents are all uploaded
+    lines_committed: int = 0
+    message: Optional[str] = None
+
+
+class _ChunkStream(io.RawIOBase):
+    """Adapts an iterator of byte chunks to a readable binary stream."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Iterates over the lines of a stream of byte chunks, decompressing gzip and zstd streams on the fly.
+
+    Args:
+        chunks (Iterable[bytes]): The raw bytes of the file.
+
+    Returns:
+        Iterator[bytes]: The lines of the (decompressed) file.
+    """
+    chunks = iter(chunks)
+    # the first chunks may be shorter than the magic number of the compression format
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= 4:
+            break
+    stream = io.BufferedReader(_ChunkStream(itertools.chain([head], chunks)), CHUNK_SIZE)
+    magic = head[:4]
+    if magic.startswith(GZIP_MAGIC):
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream), CHUNK_SIZE)
+    elif magic == ZSTD_MAGIC:
+        import zstandard
+
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream), CHUNK_SIZE)
+    return iter(stream)
+
+
+def file_chunks(file) -> Iterator[bytes]:
+    """Reads an uploaded file in chunks."""
+    return iter(partial(file.read, CHUNK_SIZE), b"")
+
+
+def url_chunks(url: str) -> Iterator[bytes]:
+    """Downloads a file in chunks.
+
+    Raises:
+        UploadSourceError: If the file cannot be retrieved.
+    """
+    try:
+        response = requests.get(url, stream=True)
+    except requests.exceptions.RequestException:
+        raise UploadSourceError(f"Failed to connect to {url}.")
+    if response.status_code != 200:
+        response.close()
+        raise UploadSourceError(f"Failed to retrieve documents from {url}.")
+    try:
+        yield from response.iter_content(CHUNK_SIZE)
+    except requests.exceptions.RequestException:
+        raise UploadSourceError(f"Failed to connect to {url}.")
+    finally:
+        response.close()
+
+
+async def ingest(
+    conn: BaseConnector,
+    datastore_name: str,
+    source_name: str,
+    open_chunks: Callable[[], Iterable[bytes]],
+    skip_lines: int = 0,
+    on_progress: Callable[[IngestResult], Awaitable[None]] = None,
+) -> IngestResult:
+    """Uploads the documents of a jsonl file (optionally gzip or zstd compressed) to the datastore.
+
+    A worker thread reads, decompresses and parses the file into batches, which are limited by the number of
+    documents (UPLOAD_BATCH_SIZE) and their size in bytes (UPLOAD_BATCH_BYTES). Up to UPLOAD_CONCURRENCY batches
+    are uploaded at the same time while the next batches are parsed. The upload stops at the first document
+    that cannot be decoded or the first batch with errors.
+
+    Args:
+        conn (BaseConnector): The connector of the datastore.
+        datastore_name (str): Name of the datastore.
+        source_name (str): Name of the file or url used in the messages.
+        open_chunks (Callable[[], Iterable[bytes]]): Function opening the file as iterator of byte chunks.
+            It is called in the worker thread.
+        skip_lines (int, optional): Number of lines at the start of the file that are already uploaded. Defaults to 0.
+        on_progress (Callable, optional): Coroutine function called with the intermediate result after each batch.
+
+    Returns:
+        IngestResult: The number of uploaded documents and errors and an error message if the upload failed.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=settings.UPLOAD_QUEUE_SIZE)
+    stop = threading.Event()
+    result = IngestResult(lines_committed=skip_lines)
+    # batches that finished before all previous batches, as heap of (first line, end line)
+    finished = []
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        batch, batch_bytes, first_line = [], 0, skip_lines
+        try:
+            for i, line in enumerate(iter_lines(open_chunks())):
+                if stop.is_set():
+                    return
+                if i < skip_lines:
+                    continue
+                if line.strip():
+                    try:
+                        batch.append(Document(__root__=json.loads(line)))
+                    except Exception:
+                        put((first_line, i, batch))
+                        put(UploadSourceError(f"Unable to correctly decode document {i} in {source_name}."))
+                        return
+                    batch_bytes += len(line)
+                if len(batch) >= settings.UPLOAD_BATCH_SIZE or batch_bytes >= settings.UPLOAD_BATCH_BYTES:
+                    put((first_line, i + 1, batch))
+                    batch, batch_bytes, first_line = [], 0, i + 1
+            if batch:
+                put((first_line, i + 1, batch))
+        except UploadSourceError as err:
+            put(err)
+        except Exception:
+            logger.exception(f"Reading documents from {source_name} failed")
+            put(UploadSourceError(f"Unable to read documents from {source_name}."))
+        finally:
+            put(None)
+
+    async def consume():
+        while True:
+            item = await queue.get()
+            if item is None:
+                # let the other consumers stop as well
+                await queue.put(None)
+                return
+            if isinstance(item, UploadSourceError):
+                result.message = result.message or str(item)
+                stop.set()
+                continue
+            first_line, end_line, batch = item
+            if stop.is_set():
+                continue
+            if batch:
+                successes, errors = await conn.add_document_batch(datastore_name, batch)
+                result.successful_uploads += successes
+                if errors > 0:
+                    result.errors += errors
+                    result.message = result.message or f"Unable to upload {errors} documents from {source_name}."
+                    stop.set()
+                    continue
+            heapq.heappush(finished, (first_line, end_line))
+            while finished and finished[0][0] == result.lines_committed:
+                result.lines_committed = heapq.heappop(finished)[1]
+            if on_progress is not None:
+                await on_progress(result)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        await asyncio.gather(*(consume() for _ in range(settings.UPLOAD_CONCURRENCY)))
+    finally:
+        stop.set()
+        # unblock the producer if the consumers were cancelled
+        while not producer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+    return result
+
+
+async def ingest_many(
+    conn: BaseConnector,
+    datastore_name: str,
+    sources: List[str],
+    open_chunks: Callable[[str], Iterable[bytes]],
+    skip_lines: List[int] = None,
+    on_progress: Callable[[int, IngestResult], Awaitable[None]] = None,
+) -> List[IngestResult]:
+    """Uploads the documents of several sources, UPLOAD_SOURCE_CONCURRENCY sources at the same time.
+
+    Args:
+        conn (BaseConnector): The connector of the datastore.
+        datastore_name (str): Name of the datastore.
+        sources (List[str]): The sources, e.g. urls.
+        open_chunks (Callable[[str], Iterable[bytes]]): Function opening a source as iterator of byte chunks.
+        skip_lines (List[int], optional): For each source the number of lines that are already uploaded.
+        on_progress (Callable, optional): Coroutine function called with the index of the source and
+            its intermediate result after each batch.
+
+    Returns:
+        List[IngestResult]: The result of each source.
+    """
+    semaphore = asyncio.Semaphore(settings.UPLOAD_SOURCE_CONCURRENCY)
+    skip_lines = skip_lines or [0] * len(sources)
+
+    async def run(i):
+        async with semaphore:
+            progress = partial(on_progress, i) if on_progress is not None else None
+            result = await ingest(
+                conn, datastore_name, sources[i], partial(open_chunks, sources[i]), skip_lines[i], progress
+            )
+            if on_progress is not None:
+                await on_progress(i, result)
+            return result
+
+    return await asyncio.gather(*(run(i) for i in range(len(sources))))
+
+
+def is_job_running(job_id: str) -> bool:
+    return job_id in _running_jobs
+
+
+def start_upload_job(conn: BaseConnector, mongo, job: UploadJob):
+    """Runs the upload job in the background. Sources that are not done are (re)started from their committed lines.
+
+    Args:
+        conn (BaseConnector): The connector of the datastore.
+        mongo (MongoClient): The client storing the progress of the job.
+        job (UploadJob): The job.
+    """
+    task = asyncio.create_task(_run_upload_job(conn, mongo, job))
+    _running_jobs[job.id] = task
+    task.add_done_callback(lambda _: _running_jobs.pop(job.id, None))
+
+
+async def _run_upload_job(conn: BaseConnector, mongo, job: UploadJob):
+    pending = [source for source in job.sources if not source.done]
+    # counts of the previous runs of the job
+    base_counts = [(source.successful_uploads, source.errors) for source in pending]
+    last_save = 0.0
+    claimed = False
+
+    async def save(force=False):
+        nonlocal last_save, claimed
+        if claimed:
+            raise UploadJobClaimed()
+        if not force and time.monotonic() - last_save < JOB_SAVE_INTERVAL:
+            return
+        last_save = time.monotonic()
+        job.successful_uploads = sum(source.successful_uploads for source in job.sources)
+        job.errors = sum(source.errors for source in job.sources)
+        job.updated_at = datetime.utcnow()
+        if not await mongo.save_upload_job(job):
+            claimed = True
+            raise UploadJobClaimed()
+
+    async def on_progress(i, result: IngestResult):
+        source = pending[i]
+        source.successful_uploads = base_counts[i][0] + result.successful_uploads
+        source.errors = base_counts[i][1] + result.errors
+        source.lines_committed = result.lines_committed
+        source.message = result.message
+        await save()
+
+    job.status = UploadJobStatus.running
+    job.message = ""
+    for source in pending:
+        source.message = None
+    try:
+        await save(force=True)
+        try:
+            upload = asyncio.ensure_future(
+                ingest_many(
+                    conn,
+                    job.datastore_name,
+                    [source.url for source in pending],
+                    url_chunks,
+                    skip_lines=[source.lines_committed for source in pending],
+                    on_progress=on_progress,
+                )
+            )
+            try:
+                # keep the lease of the job while batches are slow
+                while not (await asyncio.wait({upload}, timeout=JOB_HEARTBEAT_INTERVAL))[0]:
+                    await save(force=True)
+            finally:
+                upload.cancel()
+            results = upload.result()
+            for source, result in zip(pending, results):
+                source.done = result.message is None
+            failed = [source for source in job.sources if not source.done]
+            if failed:
+                job.status = UploadJobStatus.failed
+                job.message = "; ".join(source.message or f"Upload from {source.url} failed." for source in failed)
+            else:
+                job.status = UploadJobStatus.completed
+        except UploadJobClaimed:
+            raise
+        except Exception as err:
+            logger.exception(f"Upload job {job.id} failed")
+            job.status = UploadJobStatus.failed
+            job.message = str(err)
+        await save(force=True)
+    except UploadJobClaimed:
+        logger.warning(f"Upload job {job.id} was resumed by another run, stopping this run")
+        return
+    logger.info(f"Upload job {job.id} {job.status.value}: {job.successful_uploads} documents uploaded")
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import logging
+from collections import defaultdict
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import elasticsearch.exceptions
@@ -15,6 +17,7 @@ from ...models.query import QueryResult
 from ...models.stats import DatastoreStats
 from .class_converter import ElasticsearchClassConverter
 
+from ...core.document_cache import DocumentCache
 from ...core.es.connector import ElasticsearchConnector
 from .class_converter import KnowledgeGraphClassConverter
 
@@ -27,13 +30,65 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
     datastore_suffix = "-kg-docs"
     datastore_search_suffix = "-kg-search-indices"    
 
-    def __init__(self, host: str):
+    def __init__(self, host: str, adjacency_cache: DocumentCache = None):
         """Initializes a new instance of KnowledgeGraphConnector.
 
         Args:
             host (str): Hostname of the Elasticsearch instance.
+            adjacency_cache (DocumentCache, optional): Cache for the edges of each node. Defaults to no cache.
         """
         super().__init__(converter=KnowledgeGraphClassConverter(), host=host)
+        self.adjacency_cache = adjacency_cache if adjacency_cache is not None else DocumentCache()
+        # incremented by every change of a graph, lookups that overlap with a change do not cache their edges
+        self._adjacency_generation = defaultdict(int)
+
+    async def _invalidate_adjacency(self, kg_name: str):
+        """Drops the cached edges of the graph after it was changed.
+
+        Elasticsearch search is near-real-time, so the index is refreshed first. Otherwise, the next lookup could
+        cache the edges from before the change again. The endpoints of deleted edges are unknown, so any change
+        drops the cached edges of the whole graph. Only the cache of this worker is invalidated, the other workers
+        serve their cached edges until they expire after KG_ADJACENCY_CACHE_TTL.
+        """
+        self._adjacency_generation[kg_name] += 1
+        if not self.adjacency_cache.enabled:
+            return
+        try:
+            await self.es.indices.refresh(index=self._datastore_docs_index_name(kg_name))
+        except elasticsearch.exceptions.NotFoundError:
+            pass
+        for field in ("in_id", "out_id"):
+            await self.adjacency_cache.invalidate_datastore(f"{kg_name}/{field}")
+
+    async def delete_datastore(self, datastore_name: str) -> bool:
+        try:
+            return await super().delete_datastore(datastore_name)
+        finally:
+            await self._invalidate_adjacency(datastore_name)
+
+    async def add_document(self, datastore_name: str, document_id: str, document: Document) -> Tuple[bool, bool]:
+        try:
+            return await super().add_document(datastore_name, document_id, document)
+        finally:
+            await self._invalidate_adjacency(datastore_name)
+
+    async def add_document_batch(self, datastore_name: str, documents: Iterable[Document]) -> Tuple[int, int]:
+        try:
+            return await super().add_document_batch(datastore_name, documents)
+        finally:
+            await self._invalidate_adjacency(datastore_name)
+
+    async def update_document(self, datastore_name: str, document_id: str, document: Document) -> Tuple[bool, bool]:
+        try:
+            return await super().update_document(datastore_name, document_id, document)
+        finally:
+            await self._invalidate_adjacency(datastore_name)
+
+    async def delete_document(self, datastore_name: str, document_id: str) -> bool:
+        try:
+            return await super().delete_document(datastore_name, document_id)
+        finally:
+            await self._invalidate_adjacency(datastore_name)
 
 
     async def get_kgs(self) -> List[Datastore]:
@@ -138,12 +193,79 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
                         }
                     }
                 }
-            }
+            },
+            "_source": False,
         }  # 'must' for AND clause
-        results = await self.es.search(index=docs_index, body=body, size=10000)
+        results = await self.es.search(index=docs_index, body=body, size=settings.KG_MAX_NAME_MATCHES)
         nids = [hit['_id'] for hit in results["hits"]["hits"]]
         return nids
 
+    async def _msearch_edges(self, kg_name: str, terms: List[Dict[str, str]]) -> List[Dict[str, Dict]]:
+        index = self._datastore_docs_index_name(kg_name)
+        body = []
+        for term in terms:
+            body.append({"index": index})
+            body.append(
+                {
+                    "query": {"bool": {"filter": [{"term": {field: value}} for field, value in term.items()]}},
+                    "size": settings.KG_MAX_DEGREE,
+                }
+            )
+        result = await self.es.msearch(body=body)
+        adjacency = []
+        for response in result["responses"]:
+            if "error" in response:
+                raise EnvironmentError(f"Elasticsearch search failed: {response['error']}")
+            adjacency.append(
+                {hit["_id"]: dict(hit["_source"], **{"_id": hit["_id"]}) for hit in response["hits"]["hits"]}
+            )
+        return adjacency
+
+    async def _search_edges(self, kg_name: str, terms: List[Dict[str, str]]) -> List[Dict[str, Dict]]:
+        """Returns the edges matching each of the given term filters.
+
+        The filters are looked up with msearch requests of KG_MSEARCH_BATCH_SIZE filters, which are sent concurrently,
+        so that all filters take a single round trip.
+
+        Args:
+            kg_name (str): Name of the knowledge graph.
+            terms (List[Dict[str, str]]): Term filters on the fields of the edges, e.g. {"in_id": nid}.
+
+        Returns:
+            List[Dict[str, Dict]]: The edges by edge id for each filter.
+        """
+        batch_size = settings.KG_MSEARCH_BATCH_SIZE
+        batches = [terms[i : i + batch_size] for i in range(0, len(terms), batch_size)]
+        responses = await asyncio.gather(*(self._msearch_edges(kg_name, batch) for batch in batches))
+        return [edges for batch_edges in responses for edges in batch_edges]
+
+    async def adjacent_edges(self, kg_name: str, nids: Iterable[str], field: str = "in_id") -> Dict[str, Dict[str, Dict]]:
+        """Returns the edges of the given nodes.
+
+        Cached nodes are served from the adjacency cache (see _invalidate_adjacency for its consistency). The other nodes are looked up with _search_edges.
+        The returned edges are shared with the cache and must not be modified.
+
+        Args:
+            kg_name (str): Name of the knowledge graph.
+            nids (Iterable[str]): Ids of the nodes.
+            field (str, optional): "in_id" for the edges starting at the nodes or "out_id" for the edges ending
+                at the nodes. Defaults to "in_id".
+
+        Returns:
+            Dict[str, Dict[str, Dict]]: Mapping from the node ids to their edges by edge id.
+        """
+        nids = list(dict.fromkeys(nids))
+        cache_name = f"{kg_name}/{field}"
+        adjacency = await self.adjacency_cache.get_many(cache_name, nids)
+        missing = [nid for nid in nids if nid not in adjacency]
+        if missing:
+            generation = self._adjacency_generation[kg_name]
+            fetched = dict(zip(missing, await self._search_edges(kg_name, [{field: nid} for nid in missing])))
+            if generation == self._adjacency_generation[kg_name]:
+                await self.adjacency_cache.put_many(cache_name, fetched)
+            adjacency.update(fetched)
+        return {nid: adjacency[nid] for nid in nids}
+
     async def edges_from_msearch(self, kg_name, nids):
         """Returns all edges names about a knowledge graph.
 
@@ -151,35 +273,7 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
             kg_name (str):      Name of the knowledge graph.
             nids (List[str]):   Node-pairs.
         """
-        index = f'{kg_name}{self.datastore_suffix}'
-
-        body = []
-        for nid in nids:
-            body.append({'index': index})
-            body.append({
-                "query": {
-                    "bool": {
-                        "filter": {
-                            "bool" : {
-                                "should" : [
-                                    {"term" : { "in_id" : nid } },
-                                    # {"term" : { "out_id" : nid } },
-                                ]
-                            }
-                        }
-                    }
-                },
-                "size": 10000
-            })
-    
-        response = await self.es.msearch(body=body)
-
-        results = {}
-        for nid, response in zip(nids, response['responses']):
-            edges = {hit['_id']: dict(hit['_source'], **{'_id': hit['_id']}) for hit in response["hits"]["hits"]}
-
-            results[nid] = edges
-        return results
+        return await self.adjacent_edges(kg_name, nids, "in_id")
 
     async def edges_in_out_msearch(self, kg_name, nids):
         """Returns all edges which go either in or out from a knowledge graph.
@@ -188,35 +282,10 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
             kg_name (str):      Name of the knowledge graph.
             nids (List[str]):   List of nodes.
         """
-
-        index = f'{kg_name}{self.datastore_suffix}'
-
-        body = []
-        for nid in nids:
-            body.append({'index': index})
-            body.append({
-                "query": {
-                    "bool": {
-                        "filter": {
-                            "bool" : {
-                                "should" : [
-                                    {"term" : { "in_id" : nid } },
-                                    {"term" : { "out_id" : nid } },
-                                ]
-                            }
-                        }
-                    }
-                },
-                "size": 10000
-            })
-    
-        response = await self.es.msearch(body=body)
-
-        results = {}
-        for nid, response in zip(nids, response['responses']):
-            edges = {hit['_id']: dict(hit['_source'], **{'_id': hit['_id']}) for hit in response["hits"]["hits"]}
-            results[nid] = edges
-        return results
+        edges_out, edges_in = await asyncio.gather(
+            self.adjacent_edges(kg_name, nids, "in_id"), self.adjacent_edges(kg_name, nids, "out_id")
+        )
+        return {nid: {**edges_out[nid], **edges_in[nid]} for nid in edges_out}
 
     async def extract_nodes(self,kg_name, nids):
         """Returns all nodes which go in or out a given node.
@@ -245,66 +314,38 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
             kg_name (str):                  Name of the knowledge graph.
             nid_pair (List[str,str]):      Node_id-pair.
         """
-        index = f'{kg_name}{self.datastore_suffix}'
-        body = []
-        qid = nid_pair[0]
-        aid = nid_pair[1]
-        body.append({'index': index})
-        body.append({
-            "query": {
-                "bool": {
-                    "filter": {
-                        "bool" : {
-                            "should" : [
-                                {"term" : { "in_id" : qid } },
-                                {"term" : { "in_id" : aid } },
-                                {"term" : { "out_id" : aid } },
-                                {"term" : { "out_id" : qid } },
-                            ]
-                        }
-                    }
-                }
-            },
-            "size": 10000
-        })
-    
-        response = await self.es.msearch(body=body)
-
-        edges = {hit['_id']: dict(hit['_source'], **{'_id': hit['_id']}) for hit in response['responses'][0]["hits"]["hits"]}
-
-        qid_list=[]
-        aid_list=[]
-        rest=[]
-        for edge in edges.values():
-            if edge['in_id']==qid:
-                qid_list.append(edge['out_id'])
-            elif edge['out_id']==qid:
-                qid_list.append(edge['in_id'])
-            elif edge['in_id']==aid:
-                aid_list.append(edge['out_id'])
-            elif edge['out_id']==aid:
-                aid_list.append(edge['in_id'])
-            else:
-                rest.append(edge)
-        extra_nodes = []
-        for qids in qid_list:
-            if qids in aid_list:
-                extra_nodes.append(qids)
-
-        return set(extra_nodes)
+        return (await self.get_nodes_for_nodepairs(kg_name, [nid_pair]))[0]
 
     async def get_nodes_for_nodepairs(self, kg_name, nid_pairs:Tuple[str, str]):
         """Returns all nodes in between a list of given node_id-pairs.
 
+        The edges of all nodes are retrieved at once.
+
         Args:
             kg_name (str):                  Name of the knowledge graph.
             nid_pair (List[[str,str]]):     List of node_id-pairs.
         """
+        nid_pairs = [tuple(nid_pair) for nid_pair in nid_pairs]
+        node_edges = await self.edges_in_out_msearch(kg_name, [nid for nid_pair in nid_pairs for nid in nid_pair])
         results=[]
-        for in_id, out_id in nid_pairs:
-            results.append(await self.get_nodes_for_nodepair(kg_name, [in_id, out_id]))
+        for qid, aid in nid_pairs:
+            edges = {**node_edges[qid], **node_edges[aid]}
+            qid_list=[]
+            aid_list=[]
+            for edge in edges.values():
+                if edge['in_id']==qid:
+                    qid_list.append(edge['out_id'])
+                elif edge['out_id']==qid:
+                    qid_list.append(edge['in_id'])
+                elif edge['in_id']==aid:
+                    aid_list.append(edge['out_id'])
+                elif edge['out_id']==aid:
+                    aid_list.append(edge['in_id'])
+            aid_set = set(aid_list)
+            results.append({qids for qids in qid_list if qids in aid_set})
 
         return results
+
     async def get_edge_msearch(self, kg_name, nids_pairs: List[Tuple[str, str]]):
         """Returns all edges for a given node-pair.
 
@@ -312,38 +353,24 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
             kg_name (str):                          Name of the knowledge graph.
             nids_pairs (List[Tuple[str, str]]):     Node-pair which is supposed to be retrieved.
         """
-        index = f'{kg_name}{self.datastore_suffix}'
-        body = []
-        for in_id, out_id in nids_pairs:
-            body.append({'index': index})
-            body.append({
-                "query": {
-                    "bool": {
-                        "filter": {
-                            "bool" : {
-                                "must" : [
-                                    {"term" : { "in_id" : in_id } },
-                                    {"term" : { "out_id" : out_id } },
-                                ]
-                            }
-                        }
-                    }
-                }
-            })
-        responses = await self.es.msearch(body=body)
+        nids_pairs = [tuple(nids_pair) for nids_pair in nids_pairs]
+        # the edges of nodes with a cached adjacency are filtered from it, the adjacency of uncached nodes is not
+        # fetched because hub nodes have up to KG_MAX_DEGREE edges
+        edges_out = await self.adjacency_cache.get_many(f"{kg_name}/in_id", list({in_id for in_id, _ in nids_pairs}))
+        missing = list(dict.fromkeys(nids_pair for nids_pair in nids_pairs if nids_pair[0] not in edges_out))
+        pair_edges = await self._search_edges(kg_name, [{"in_id": in_id, "out_id": out_id} for in_id, out_id in missing])
+        pair_edges = dict(zip(missing, pair_edges))
+        # edges are assigned to the pairs regardless of their direction
+        pair_positions = defaultdict(list)
+        for i, nids_pair in enumerate(nids_pairs):
+            pair_positions[frozenset(nids_pair)].append(i)
         found_edges = [{} for _ in nids_pairs]
-        for response in responses['responses']:
-            edges = {hit['_id']: dict(hit['_source'], **{'_id': hit['_id']}) for hit in response["hits"]["hits"]}
+        for in_id, out_id in nids_pairs:
+            edges = edges_out[in_id] if in_id in edges_out else pair_edges[(in_id, out_id)]
             for edge in edges.values():
-                edge_in = edge['in_id']
-                edge_out = edge['out_id']
-                edge_in_out=[edge_in, edge_out]
-                if edge_in != edge_out:
-                    for i,in_out_id in enumerate(nids_pairs):
-                        node_in_id = list(in_out_id)[0]
-                        node_out_id = list(in_out_id)[1]
-                        if node_in_id in edge_in_out and node_out_id in edge_in_out:
-                            found_edges[i] = {edge['_id']:edge}           
+                if edge['out_id'] == out_id and edge['in_id'] != edge['out_id']:
+                    for i in pair_positions[frozenset((in_id, out_id))]:
+                        found_edges[i] = {edge['_id']:edge}
         return found_edges
 
     async def get_relation(self, kg_name, nids_pairs: List[Tuple[str, str]]):
@@ -382,52 +409,67 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
                 logger.info("Not FOUND")
         return objs
 
-    async def extract_subgraph(self, kg_name, nids: List[str], hops=2):
+    async def extract_subgraph(self, kg_name, nids: List[str], hops=2, max_nodes: int = None):
         """Returns a subgraph as a Set of nodes and edges.
 
+        The subgraph contains the edges on the paths of at most `hops` edges which start and end at the given
+        nodes. The nodes are expanded hop by hop, so that the edges of each hop are retrieved in one batched
+        round trip, and paths are then closed with the distances of the nodes to and from the given nodes.
+
         Args:
             kg_name (str):      Name of the knowledge graph.
             nids (List[node]):  List of nodes.
             hops (int):         Number of hops.
+            max_nodes (int):    Number of expanded nodes after which no further hops are expanded, the subgraph
+                                is incomplete in this case. Defaults to KG_SUBGRAPH_MAX_NODES.
         """
         assert hops >= 1
-        # nids = sorted(list(set(nids)))
+        max_nodes = max_nodes or settings.KG_SUBGRAPH_MAX_NODES
         nids = set(nids)
 
-        nid2edges = await self.edges_from_msearch(kg_name, nids)
-        paths = []
-        for edges in nid2edges.values():
-            for edge in edges.values():
-                paths.append([edge])
-
-        paths_closed = []  # Represent the paths with both ends in nids
-        for _ in range(1, hops):
-            # Get the frontier node for each path
-            # If a froniter node reaches one of the nids, 
-            # the path will be included in the final results
-            frontier =  [path[-1]['out_id'] for path in paths]
-            for out_id, path in zip(frontier, paths):
-                if out_id in nids:
-                    paths_closed.append(path)
-
-            # Search along all the paths
-            nid2edges = await self.edges_from_msearch(kg_name, set(frontier))
-            paths_extended = []
-            for i, nid in enumerate(frontier):
-                edges = nid2edges[nid]
-                path = paths[i]
-                paths_extended.extend([path + [e] for e in edges.values()])  # One step forward
-            paths = paths_extended
-        # Check again the frontier nodes
-        frontier =  [path[-1]['out_id'] for path in paths]
-        for out_id, path in zip(frontier, paths):
-            if out_id in nids:
-                paths_closed.append(path)
-
-        edges = {}
-        for path in paths_closed:
-            for edge in path:
-                edges[edge['_id']] = edge
+        # Number of hops from the given nodes to each expanded node
+        distance_from = {nid: 0 for nid in nids}
+        candidates = {}  # All edges starting at an expanded node
+        frontier = list(nids)
+        for hop in range(hops):
+            nid2edges = await self.edges_from_msearch(kg_name, frontier)
+            next_frontier = []
+            for nid in frontier:
+                for edge in nid2edges[nid].values():
+                    candidates[edge['_id']] = edge
+                    if hop + 1 < hops and edge['out_id'] not in distance_from:
+                        distance_from[edge['out_id']] = hop + 1
+                        next_frontier.append(edge['out_id'])
+            frontier = next_frontier
+            if not frontier:
+                break
+            if len(distance_from) > max_nodes:
+                logger.warning(
+                    f"Stopped expanding the subgraph of {kg_name} after {hop + 1} hops at {len(distance_from)} nodes"
+                )
+                break
+
+        # Number of hops from each node back to the given nodes, following the retrieved edges backwards
+        edges_to = defaultdict(list)
+        for edge in candidates.values():
+            edges_to[edge['out_id']].append(edge)
+        distance_to = {nid: 0 for nid in nids}
+        level = list(nids)
+        for hop in range(1, hops):
+            next_level = []
+            for nid in level:
+                for edge in edges_to[nid]:
+                    if edge['in_id'] not in distance_to:
+                        distance_to[edge['in_id']] = hop
+                        next_level.append(edge['in_id'])
+            level = next_level
+
+        edges = {
+            edge_id: edge
+            for edge_id, edge in candidates.items()
+            if edge['out_id'] in distance_to
+            and distance_from[edge['in_id']] + 1 + distance_to[edge['out_id']] <= hops
+        }
 
         for edge in edges.values():
             nids.add(edge['in_id'])
@@ -461,35 +503,37 @@ class KnowledgeGraphConnector(ElasticsearchConnector):
                         }
                     }
                 },
-                "size": 10000
+                "_source": False,
+                "size": settings.KG_MAX_NAME_MATCHES
             })  # 'must' for AND clause
         responses = await self.es.msearch(body=body)
-        logger.info(responses)
         results = []        
         for response in responses['responses']:
             nids = [hit['_id'] for hit in response["hits"]["hits"]]
             results.append(nids)
         return results
 
-    async def extract_subgraph_by_names(self, kg_name, nodes, hops=2):
+    async def extract_subgraph_by_names(self, kg_name, nodes, hops=2, max_nodes: int = None):
         """Returns a subgraph as a Set of nodes and edges.
 
         Args:
             kg_name (str):      Name of the knowledge graph.
             names (List[str]):  List of names of the nodes.
             hops (int):         Number of hops.
+            max_nodes (int):    Maximum number of expanded nodes.
         """
         nids = set()
         for _nids in await self.get_node_by_name_msearch(kg_name, nodes):
             nids.update(_nids)
-        return await self.extract_subgraph(kg_name, nids, hops)
+        return await self.extract_subgraph(kg_name, nids, hops, max_nodes)
 
-    async def extract_subgraph_by_ids(self, kg_name, nodes, hops=2):
+    async def extract_subgraph_by_ids(self, kg_name, nodes, hops=2, max_nodes: int = None):
         """Returns a subgraph as a Set of nodes and edges.
 
         Args:
             kg_name (str):      Name of the knowledge graph.
             nids (List[str]):   List of ids of the nodes.
             hops (int):         Number of hops.
+            max_nodes (int):    Maximum number of expanded nodes.
         """
-        return await self.extract_subgraph(kg_name, nodes, hops)
+        return await self.extract_subgraph(kg_name, nodes, hops, max_nodes)
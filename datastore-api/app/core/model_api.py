@@ -6,16 +6,23 @@ import logging
 import time
 import os
 from io import BytesIO
+from typing import List
 
 import aiohttp
+import msgpack
 import numpy as np
 import requests
 from aiohttp.client import ClientSession
 from square_auth.client_credentials import ClientCredentials
 
+from .config import settings
 from ..models.index import Index
 logger = logging.getLogger(__name__)
 
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Maximum timeout in seconds that the task_result endpoint of the model API accepts
+MAX_TASK_RESULT_WAIT = 60
+
 client_credentials = ClientCredentials()
 
 class ModelAPIClient:
@@ -52,24 +59,68 @@ class ModelAPIClient:
         except Exception:
             return False
 
-    def _decode_embeddings(self, encoded_string: str):
-        encoded_string = encoded_string.encode()
-        arr_binary = base64.decodebytes(encoded_string)
+    def _decode_embeddings(self, encoded_string):
+        """
+        Decodes the embeddings returned by the model API, either as raw
+        .npy bytes (msgpack responses) or as base64 string (JSON responses).
+        """
+        if isinstance(encoded_string, bytes):
+            arr_binary = encoded_string
+        else:
+            arr_binary = base64.decodebytes(encoded_string.encode())
         arr = np.load(BytesIO(arr_binary))
         return arr
 
     async def encode_query(self, query: str, index: Index, credential_token: str):
+        if index.query_encoder_model is None:
+            return None
+        return (await self.encode_queries([query], index, credential_token))[0]
+
+    async def encode_queries(self, queries: List[str], index: Index, credential_token: str):
+        """
+        Encodes several queries with the query encoder of the index. The
+        queries are sent in chunks of settings.ENCODE_BATCH_SIZE, so that a
+        single prediction request embeds many queries at once.
+        Args:
+            queries (List[str]): the queries to encode
+            index (Index): the index whose query encoder is used
+            credential_token (str): the token of the client credentials
+        Returns:
+            the query vectors padded to the embedding size of the index or
+            None if the index has no query encoder
+        """
         if index.query_encoder_model is None:
             return None
         if not self.base_url:
             raise EnvironmentError("Model API not available.")
 
+        batch_size = settings.ENCODE_BATCH_SIZE
+        chunks = await asyncio.gather(
+            *(
+                self._encode_chunk(queries[i : i + batch_size], index)
+                for i in range(0, len(queries), batch_size)
+            )
+        )
+        embeddings = [embedding for chunk in chunks for embedding in chunk]
+        # The vector returned here may be shorter than the stored document vector.
+        # In that case, we fill the remaining values with zeros.
+        if embeddings and index.embedding_size - len(embeddings[0]) > 0:
+            logger.warning(
+                "Embedded query vector is shorter than the configured size."
+            )
+        return [
+            embedding.tolist() + [0] * (index.embedding_size - len(embedding))
+            for embedding in embeddings
+        ]
+
+    async def _encode_chunk(self, queries: List[str], index: Index):
         data = {
-            "input": [query],
+            "input": queries,
             "adapter_name": index.query_encoder_adapter,
             "task_kwargs": {
                 "embedding_mode": index.embedding_mode
-            }
+            },
+            "binary_outputs": True,
         }
 
         response = await self.predict(
@@ -81,14 +132,8 @@ class ModelAPIClient:
 
         embeddings = self._decode_embeddings(
             response["model_outputs"]["embeddings"]
-        ).flatten()
-        # The vector returned here may be shorter than the stored document vector.
-        # In that case, we fill the remaining values with zeros.
-        if index.embedding_size - len(embeddings) > 0:
-            logger.warning(
-                "Embedded query vector is shorter than the configured size."
-            )
-        return embeddings.tolist() + [0] * (index.embedding_size - len(embeddings))
+        )
+        return embeddings.reshape(len(queries), -1)
 
     async def _wait_for_task(
         self,
@@ -98,38 +143,54 @@ class ModelAPIClient:
         poll_interval=None,
     ):
         """
-        Handling waiting for a task to finish. While the task has
-        not finished request the result from the task_result
-        endpoint and check whether it is finished
+        Handling waiting for a task to finish. The task_result endpoint
+        is requested with wait=true, so the model API holds the request
+        open until the task finished or the poll_interval expired.
+        The result is requested as msgpack so that binary model outputs
+        are transferred without base64 encoding.
         Args:
              task_id (str): the id of the task
              max_attempts (int, optional): the maximum number of
                 attempts to get the result. If this is None the
                 self.max_attempts is used. The default is None.
-             poll_interval (int, optional): the interval between the
-                attempts to poll the results. If this is None
+             poll_interval (int, optional): the maximum time in seconds
+                the model API waits for the result in each attempt, at
+                most MAX_TASK_RESULT_WAIT. If this is None
                 self.poll_intervall is used. Defaults to None.
+        Raises:
+             aiohttp.ClientResponseError: if the model API answers with
+                an error status
+             TimeoutError: if the task did not finish within max_attempts
         """
         if max_attempts is None:
             max_attempts = self.max_attempts
         if poll_interval is None:
             poll_interval = self.poll_interval
-        attempts = 0
-        result = None
-        while attempts < max_attempts:
-            attempts += 1
+        poll_interval = min(poll_interval, MAX_TASK_RESULT_WAIT)
+        for _ in range(max_attempts):
+            start = time.perf_counter()
             async with session.get(
                 url=f"{self.square_api_url}/main/task_result/{task_id}",
-                headers={"Authorization": f"Bearer {client_credentials()}"},
+                params={"wait": "true", "timeout": poll_interval},
+                headers={
+                    "Authorization": f"Bearer {client_credentials()}",
+                    "Accept": f"{MSGPACK_MEDIA_TYPE}, application/json",
+                },
                 verify_ssl=self.verify_ssl,
             ) as response:
-                resp = await response.text()
-
                 if response.status == 200:
-                    result = ast.literal_eval(json.dumps(resp))
-                    break
-                time.sleep(poll_interval)
-        return json.loads(result)["result"]
+                    if response.content_type == MSGPACK_MEDIA_TYPE:
+                        return msgpack.unpackb(await response.read(), strict_map_key=False)["result"]
+                    return json.loads(await response.text())["result"]
+                # 202 means that the task is still processing
+                response.raise_for_status()
+            # model APIs without support for waiting answer immediately
+            remaining = poll_interval - (time.perf_counter() - start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        raise TimeoutError(
+            f"Task {task_id} of the model API did not finish after {max_attempts} attempts"
+        )
 
     async def predict(self, model_identifier, prediction_method, input_data):
         """
@@ -1,10 +1,15 @@
 import logging
+from datetime import datetime
+from typing import Optional
+
 import jwt
 from pydantic import ValidationError
 import pymongo
 from fastapi import Request, HTTPException
 from fastapi.security.http import HTTPBearer, HTTPAuthorizationCredentials
 
+from ..models.upload import UploadJob, UploadJobStatus
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,6 +25,7 @@ class MongoClient:
         }
         self.client = pymongo.MongoClient(**client_access)
         self.user_datastore_bindings = self.client.user_datastore.bindings
+        self.upload_jobs = self.client.user_datastore.upload_jobs
         self.item_keys = {
             'datastore': 'datastore_name', 
             'index': 'index_name'
@@ -63,6 +69,37 @@ class MongoClient:
         if not await self.binding_exists(request, item_value, item_type):
             raise HTTPException(status_code=403, detail='No permission')
     
+    async def create_upload_job(self, job: UploadJob):
+        self.upload_jobs.insert_one({'_id': job.id, **job.dict()})
+
+    async def save_upload_job(self, job: UploadJob) -> bool:
+        """Stores the progress of the job. Returns False if another run claimed the job in the meantime."""
+        result = self.upload_jobs.replace_one({'_id': job.id, 'run_id': job.run_id}, {'_id': job.id, **job.dict()})
+        return result.matched_count > 0
+
+    async def claim_upload_job(self, job: UploadJob, run_id: str) -> Optional[UploadJob]:
+        """Hands the job over to a new run, if the job is unchanged since it was read.
+
+        Returns:
+            Optional[UploadJob]: The claimed job or None if the job was updated or claimed concurrently.
+        """
+        found = self.upload_jobs.find_one_and_update(
+            {'_id': job.id, 'run_id': job.run_id, 'status': job.status.value, 'updated_at': job.updated_at},
+            {'$set': {'run_id': run_id, 'status': UploadJobStatus.running.value, 'updated_at': datetime.utcnow()}},
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if found is None:
+            return None
+        found.pop('_id')
+        return UploadJob(**found)
+
+    async def get_upload_job(self, job_id: str) -> Optional[UploadJob]:
+        found = self.upload_jobs.find_one({'_id': job_id})
+        if found is None:
+            return None
+        found.pop('_id')
+        return UploadJob(**found)
+
     async def _decode_user_id(self, request: Request):
         http_bearer = HTTPBearer()
         auth_credentials: HTTPAuthorizationCredentials = await http_bearer(request)
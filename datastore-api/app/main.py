@@ -6,6 +6,7 @@ from .core.startup import startup_event_handler
 from .core.config import settings
 # from .core.auth import verify_api_key  # deprecated
 from .routers import api
+from .routers.dependencies import get_search_client
 
 from square_auth.auth import Auth
 auth = Auth()
@@ -34,3 +35,8 @@ app = get_app()
 @app.on_event("startup")
 async def startup_event():
     await startup_event_handler()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_search_client().faiss.close()
@@ -9,6 +9,12 @@ class QueryResult(BaseModel):
     score: float
     id: str
 
+
+class FusionMethod(str, Enum):
+    """Method to fuse the BM25 and dense rankings of a hybrid search."""
+    rrf = "rrf"
+    linear = "linear"
+
 regions = {
 "da-DK": "da-DK",
 "de-AT": "de-AT",
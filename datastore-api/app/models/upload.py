@@ -1,4 +1,6 @@
-from typing import List
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -20,3 +22,37 @@ class UploadResponse(BaseModel):
     message: str
     successful_uploads: int
     errors: int = 0
+
+
+class UploadJobStatus(str, Enum):
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class UploadSourceProgress(BaseModel):
+    """Progress of uploading the documents from one url of an upload job."""
+    url: str
+    successful_uploads: int = 0
+    errors: int = 0
+    # lines from the start of the file whose documents are all uploaded, a resumed job continues from here
+    lines_committed: int = 0
+    done: bool = False
+    message: Optional[str] = None
+
+
+class UploadJob(BaseModel):
+    """Upload of the documents from a set of urls that runs in the background."""
+    id: str
+    datastore_name: str
+    status: UploadJobStatus = UploadJobStatus.running
+    sources: List[UploadSourceProgress]
+    successful_uploads: int = 0
+    errors: int = 0
+    message: str = ""
+    created_at: datetime
+    # updated at least every few seconds while the job runs, a running job without updates for UPLOAD_JOB_LEASE
+    # seconds is considered to be interrupted
+    updated_at: datetime
+    # id of the run that owns the job, only this run stores progress
+    run_id: Optional[str] = None
@@ -3,6 +3,8 @@ from functools import lru_cache
 from ..core.base_connector import BaseConnector
 from ..core.config import settings
 from ..core.dense_retrieval import DenseRetrieval
+from ..core.document_cache import DocumentCache
+from ..core.embedded_index import EmbeddedIndexClient
 from ..core.es.connector import ElasticsearchConnector
 from ..core.kgs.connector import KnowledgeGraphConnector
 from ..core.faiss import FaissClient
@@ -16,11 +18,15 @@ client_credentials = ClientCredentials()  # For getting tokens and enable access
 # IMPORTANT: When altering this, make sure to also alter the corresponding mock in conftest.py!
 @lru_cache()
 def get_storage_connector() -> BaseConnector:
-    return ElasticsearchConnector(settings.ES_URL)
+    document_cache = DocumentCache(
+        settings.DOCUMENT_CACHE_SIZE, settings.DOCUMENT_CACHE_TTL, settings.DOCUMENT_CACHE_REDIS_URL or None
+    )
+    return ElasticsearchConnector(settings.ES_URL, document_cache=document_cache)
 
 @lru_cache()
 def get_kg_storage_connector() -> ElasticsearchConnector:
-    return KnowledgeGraphConnector(settings.ES_URL)
+    adjacency_cache = DocumentCache(settings.KG_ADJACENCY_CACHE_SIZE, settings.KG_ADJACENCY_CACHE_TTL)
+    return KnowledgeGraphConnector(settings.ES_URL, adjacency_cache=adjacency_cache)
 
 
 # IMPORTANT: When altering this, make sure to also alter the corresponding mock in conftest.py!
@@ -30,6 +36,8 @@ def get_search_client() -> DenseRetrieval:
         settings.MODEL_API_URL
     )
     faiss = FaissClient()
+    if settings.EMBEDDED_INDEX_DIR:
+        faiss = EmbeddedIndexClient(settings.EMBEDDED_INDEX_DIR, fallback=faiss)
     return DenseRetrieval(get_storage_connector(), model_api, faiss)
 
 @lru_cache()
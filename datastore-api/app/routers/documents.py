@@ -1,16 +1,18 @@
-import json
 import logging
-from typing import Iterable, List, Union
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Iterable, List, Optional, Tuple
 
-import requests
 from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile, status
 from fastapi.param_functions import Body, Path
 from fastapi.responses import StreamingResponse
 
 from ..core.config import settings
+from ..core.ingest import file_chunks, ingest, ingest_many, is_job_running, start_upload_job, url_chunks
 from ..models.document import Document
 from ..models.httperror import HTTPError
-from ..models.upload import UploadResponse, UploadUrlSet
+from ..models.upload import UploadJob, UploadJobStatus, UploadResponse, UploadSourceProgress, UploadUrlSet
 from .dependencies import get_storage_connector, get_mongo_client
 from ..core.mongo import MongoClient
 
@@ -22,42 +24,16 @@ binding_item_type = 'datastore'
 
 
 async def upload_document_file(
-    conn, datastore_name: str, file_name: str, file_iterator: Iterable
-) -> Union[int, UploadResponse]:
-    total_docs = 0
-    upload_batch = []
-    for i, line in enumerate(file_iterator):
-        try:
-            doc_data = json.loads(line)
-            upload_batch.append(Document(__root__=doc_data))
-        except Exception:
-            return total_docs, UploadResponse(
-                message=f"Unable to correctly decode document {i} in {file_name}.",
-                successful_uploads=total_docs,
-            )
-        # if batch is full, upload and reset
-        if len(upload_batch) == settings.UPLOAD_BATCH_SIZE:
-            successes, errors = await conn.add_document_batch(datastore_name, upload_batch)
-            if errors > 0:
-                return total_docs, UploadResponse(
-                    message=f"Unable to upload {errors} documents from {file_name}.",
-                    successful_uploads=total_docs,
-                )
-            total_docs += successes
-            upload_batch = []
-
-    # upload remaining
-    if len(upload_batch) > 0:
-        successes, errors = await conn.add_document_batch(datastore_name, upload_batch)
-        if errors > 0:
-            return total_docs, UploadResponse(
-                message=f"Unable to upload {errors} documents from {file_name}.",
-                successful_uploads=total_docs,
-                errors=errors,
-            )
-        total_docs += successes
-
-    return total_docs, None
+    conn, datastore_name: str, file_name: str, open_chunks: Callable[[], Iterable[bytes]]
+) -> Tuple[int, Optional[UploadResponse]]:
+    result = await ingest(conn, datastore_name, file_name, open_chunks)
+    if result.message is not None:
+        return result.successful_uploads, UploadResponse(
+            message=result.message,
+            successful_uploads=result.successful_uploads,
+            errors=result.errors,
+        )
+    return result.successful_uploads, None
 
 
 @router.post(
@@ -86,7 +62,9 @@ async def upload_documents(
 
     await mongo.autonomous_access_checking(request, datastore_name, binding_item_type)
 
-    uploaded_docs, upload_response = await upload_document_file(conn, datastore_name, file.filename, file.file)
+    uploaded_docs, upload_response = await upload_document_file(
+        conn, datastore_name, file.filename, partial(file_chunks, file.file)
+    )
     if upload_response is not None:
         response.status_code = 400
         return upload_response
@@ -121,31 +99,115 @@ async def upload_documents_from_urls(
 
     await mongo.autonomous_access_checking(request, datastore_name, binding_item_type)
 
-    total_docs = 0  # total uploaded items across all files
-
-    for url in urlset.urls:
-        try:
-            r = requests.get(url, stream=True)
-            if r.status_code != 200:
-                api_response.status_code = 400
-                return UploadResponse(
-                    message=f"Failed to retrieve documents from {url}.",
-                    successful_uploads=total_docs,
-                )
-
-            uploaded_docs, upload_response = await upload_document_file(conn, datastore_name, url, r.iter_lines())
-            if upload_response is not None:
-                api_response.status_code = 400
-                return upload_response
-            total_docs += uploaded_docs
-            r.close()
-        except requests.exceptions.RequestException:
+    results = await ingest_many(conn, datastore_name, urlset.urls, url_chunks)
+    total_docs = sum(result.successful_uploads for result in results)  # total uploaded items across all files
+    for result in results:
+        if result.message is not None:
             api_response.status_code = 400
-            return UploadResponse(message=f"Failed to connect to {url}.", successful_uploads=total_docs)
+            return UploadResponse(message=result.message, successful_uploads=total_docs, errors=result.errors)
 
     return UploadResponse(message=f"Successfully uploaded {total_docs} documents.", successful_uploads=total_docs)
 
 
+@router.post(
+    "/upload_jobs",
+    summary="Upload documents from files at the given urls to the datastore in the background",
+    description="Starts a background job uploading the documents. Its progress can be polled and a failed \
+            job can be resumed from the last uploaded batch of each file.",
+    response_model=UploadJob,
+    status_code=202,
+    responses={
+        202: {"model": UploadJob, "description": "The started upload job."},
+        404: {"model": HTTPError, "description": "The datastore does not exist."},
+    },
+)
+async def start_upload_job_from_urls(
+    request: Request,
+    datastore_name: str = Path(..., description="The name of the datastore"),
+    urlset: UploadUrlSet = Body(..., description="The urls containing the documents to upload"),
+    conn = Depends(get_storage_connector),
+    mongo: MongoClient = Depends(get_mongo_client)
+):
+    datastore = await conn.get_datastore(datastore_name)
+    if datastore is None:
+        raise HTTPException(status_code=404, detail="Datastore not found.")
+
+    await mongo.autonomous_access_checking(request, datastore_name, binding_item_type)
+
+    now = datetime.utcnow()
+    job = UploadJob(
+        id=uuid.uuid4().hex,
+        datastore_name=datastore_name,
+        sources=[UploadSourceProgress(url=url) for url in urlset.urls],
+        created_at=now,
+        updated_at=now,
+        run_id=uuid.uuid4().hex,
+    )
+    await mongo.create_upload_job(job)
+    start_upload_job(conn, mongo, job)
+    return job
+
+
+@router.get(
+    "/upload_jobs/{job_id}",
+    summary="Get the progress of an upload job",
+    response_model=UploadJob,
+    responses={
+        200: {"model": UploadJob, "description": "The upload job."},
+        404: {"model": HTTPError, "description": "The upload job does not exist."},
+    },
+)
+async def get_upload_job(
+    request: Request,
+    datastore_name: str = Path(..., description="The name of the datastore"),
+    job_id: str = Path(..., description="The id of the upload job"),
+    mongo: MongoClient = Depends(get_mongo_client)
+):
+    await mongo.autonomous_access_checking(request, datastore_name, binding_item_type)
+
+    job = await mongo.get_upload_job(job_id)
+    if job is None or job.datastore_name != datastore_name:
+        raise HTTPException(status_code=404, detail="Upload job not found.")
+    return job
+
+
+@router.post(
+    "/upload_jobs/{job_id}/resume",
+    summary="Resume a failed or interrupted upload job",
+    description="Restarts the files that are not completely uploaded after their last uploaded batch",
+    response_model=UploadJob,
+    status_code=202,
+    responses={
+        202: {"model": UploadJob, "description": "The resumed upload job."},
+        404: {"model": HTTPError, "description": "The upload job does not exist."},
+        409: {"model": HTTPError, "description": "The upload job is running, completed or resumed concurrently."},
+    },
+)
+async def resume_upload_job(
+    request: Request,
+    datastore_name: str = Path(..., description="The name of the datastore"),
+    job_id: str = Path(..., description="The id of the upload job"),
+    conn = Depends(get_storage_connector),
+    mongo: MongoClient = Depends(get_mongo_client)
+):
+    await mongo.autonomous_access_checking(request, datastore_name, binding_item_type)
+
+    job = await mongo.get_upload_job(job_id)
+    if job is None or job.datastore_name != datastore_name:
+        raise HTTPException(status_code=404, detail="Upload job not found.")
+    if job.status == UploadJobStatus.completed:
+        raise HTTPException(status_code=409, detail=f"Upload job is {job.status.value}.")
+    # jobs of a restarted server remain "running" and can be resumed once their progress is not updated anymore
+    lease_expired = job.updated_at < datetime.utcnow() - timedelta(seconds=settings.UPLOAD_JOB_LEASE)
+    if job.status == UploadJobStatus.running and (is_job_running(job_id) or not lease_expired):
+        raise HTTPException(status_code=409, detail=f"Upload job is {job.status.value}.")
+    job = await mongo.claim_upload_job(job, uuid.uuid4().hex)
+    if job is None:
+        raise HTTPException(status_code=409, detail="Upload job was resumed or updated concurrently.")
+    start_upload_job(conn, mongo, job)
+    return job
+
+
 @router.post(
     "",
     summary="Upload a batch of documents",
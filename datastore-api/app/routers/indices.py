@@ -79,7 +79,8 @@ async def put_index(
     index_request: IndexRequest = Body(..., description="The index configuration as IndexRequest"),
     conn: ElasticsearchConnector = Depends(get_storage_connector),
     response: Response = None,
-    mongo: MongoClient = Depends(get_mongo_client)
+    mongo: MongoClient = Depends(get_mongo_client),
+    dense_retrieval=Depends(get_search_client),
 ):
     index = await conn.get_index(datastore_name, index_name)
     if index is None:
@@ -97,6 +98,7 @@ async def put_index(
 
     if success:
         await conn.commit_changes()
+        dense_retrieval.invalidate_index(datastore_name, index_name)
         return new_index
     else:
         raise HTTPException(status_code=400)
@@ -144,7 +146,8 @@ async def delete_index(
     datastore_name: str = Path(..., description="The name of the datastore"),
     index_name: str = Path(..., description="The name of the index"),
     conn: ElasticsearchConnector = Depends(get_storage_connector),
-    mongo: MongoClient = Depends(get_mongo_client)
+    mongo: MongoClient = Depends(get_mongo_client),
+    dense_retrieval=Depends(get_search_client),
 ):
     if not (await conn.get_index(datastore_name, index_name)):
         raise HTTPException(status_code=404)
@@ -155,6 +158,7 @@ async def delete_index(
     if success:
         await mongo.delete_binding(request, index_name, binding_item_type)
         await conn.commit_changes()
+        dense_retrieval.invalidate_index(datastore_name, index_name)
         return Response(status_code=204)
     else:
         raise HTTPException(status_code=404)
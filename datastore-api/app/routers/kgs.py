@@ -345,10 +345,11 @@ async def subgraph_by_names(
     kg_name: str = Path(..., description="The knowledge graph name"),
     nids: set = Body(..., description="List of node names."),
     hops: int = Body(2, description="Number of hops to retrieve."),
+    max_nodes: int = Body(None, description="Number of expanded nodes after which no further hops are expanded."),
     conn=Depends(get_kg_storage_connector),
 ):
     # Need to handle if wrong kg_name was gave as an input
-    subgraph = await conn.extract_subgraph_by_names(kg_name, nodes=nids, hops=hops)
+    subgraph = await conn.extract_subgraph_by_names(kg_name, nodes=nids, hops=hops, max_nodes=max_nodes)
     if subgraph is not None:
         return subgraph
     else:
@@ -372,10 +373,11 @@ async def subgraph_by_ids(
     kg_name: str = Path(..., description="The knowledge graph name"),
     nids: set = Body(..., description="List of node ids."),
     hops: int = Body(2, description="Number of hops to retrieve."),
+    max_nodes: int = Body(None, description="Number of expanded nodes after which no further hops are expanded."),
     conn=Depends(get_kg_storage_connector),
 ):
     # Need to handle if wrong kg_name was gave as an input
-    subgraph = await conn.extract_subgraph_by_ids(kg_name, nodes=nids, hops=hops)
+    subgraph = await conn.extract_subgraph_by_ids(kg_name, nodes=nids, hops=hops, max_nodes=max_nodes)
     if subgraph is not None:
         return subgraph
     else:
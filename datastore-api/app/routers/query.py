@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.param_functions import Body, Path, Query
 
 from ..models.httperror import HTTPError
-from ..models.query import QueryResult, Region
+from ..models.query import FusionMethod, QueryResult, Region
 from .dependencies import get_search_client, get_storage_connector, client_credentials, get_bing_search_client
 
 router = APIRouter(tags=["Query"])
@@ -16,7 +16,8 @@ logger = logging.getLogger(__name__)
     "/search",
     summary="Search the documentstore with given query and return top-k documents",
     description="Searches the given datastore with the search strategy specified by the given index \
-            and if necessery encodes the query with the specified encoder",
+            and if necessery encodes the query with the specified encoder. If a fusion method is given as well, \
+            BM25 and the dense index are searched concurrently and their rankings are fused",
     response_description="The top-K documents",
     response_model=List[QueryResult],
     responses={
@@ -33,6 +34,13 @@ async def search(
     feedback_documents: List[str] = Query(
         None, description="Relevant feedback documents from previous query."),
     region: Region = Query(None, description="Region of the query when using the bing_search datastore."),
+    fusion: Optional[FusionMethod] = Query(
+        None,
+        description="Hybrid search: fuse the BM25 ranking with the ranking of the given index "
+        "by reciprocal rank fusion ('rrf') or by a linear combination of the normalized scores ('linear').",
+    ),
+    alpha: float = Query(0.5, ge=0, le=1, description="Weight of the dense scores for the linear fusion."),
+    rrf_k: int = Query(60, ge=1, description="Rank constant of the reciprocal rank fusion."),
     conn=Depends(get_storage_connector),
     dense_retrieval=Depends(get_search_client),
     credential_token=Depends(client_credentials),
@@ -50,6 +58,24 @@ async def search(
             raise HTTPException(status_code=404, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+    # do hybrid retrieval
+    elif index_name and fusion:
+        try:
+            return await dense_retrieval.hybrid_search(
+                datastore_name,
+                index_name,
+                query,
+                top_k,
+                credential_token,
+                fusion=fusion,
+                alpha=alpha,
+                rrf_k=rrf_k,
+                feedback_documents=feedback_documents,
+            )
+        except ValueError as ex:
+            raise HTTPException(status_code=404, detail=str(ex))
+        except Exception as other_ex:
+            raise HTTPException(status_code=500, detail=str(other_ex))
     # do dense retrieval
     elif index_name:
         try:
@@ -98,6 +124,89 @@ async def search_by_vector(
         raise HTTPException(status_code=500, detail=str(other_ex))
 
 
+@router.post(
+    "/search_batch",
+    summary="Search the documentstore with several queries and return the top-k documents of each query",
+    description="Batched version of /search. The queries are encoded with one Model API request, \
+            searched with one FAISS request (or one Elasticsearch multi search for BM25) \
+            and the documents of all queries are fetched at once",
+    response_description="The top-K documents of each query",
+    response_model=List[List[QueryResult]],
+    responses={
+        200: {"model": List[List[QueryResult]], "description": "The top-K documents of each query"},
+        404: {"model": HTTPError, "description": "The datastore or index does not exist"},
+        500: {"model": HTTPError, "description": "Model API error"},
+    },
+)
+async def search_batch(
+    datastore_name: str = Path(..., description="Name of the datastore."),
+    index_name: Optional[str] = Body(None, description="Index name."),
+    queries: List[str] = Body(..., description="The query strings."),
+    top_k: int = Body(40, description="Number of documents to retrieve per query."),
+    fusion: Optional[FusionMethod] = Body(
+        None, description="Hybrid search: fuse the BM25 ranking with the ranking of the given index."
+    ),
+    alpha: float = Body(0.5, ge=0, le=1, description="Weight of the dense scores for the linear fusion."),
+    rrf_k: int = Body(60, ge=1, description="Rank constant of the reciprocal rank fusion."),
+    dense_retrieval=Depends(get_search_client),
+    credential_token=Depends(client_credentials),
+):
+    logger.debug(
+        f"Searching datastore {datastore_name} on index {index_name} "
+        f"with {len(queries)} queries and top_k {top_k}."
+    )
+    try:
+        # do hybrid retrieval
+        if index_name and fusion:
+            return await dense_retrieval.hybrid_search_batch(
+                datastore_name,
+                index_name,
+                queries,
+                top_k,
+                credential_token,
+                fusion=fusion,
+                alpha=alpha,
+                rrf_k=rrf_k,
+            )
+        # do dense retrieval
+        elif index_name:
+            return await dense_retrieval.search_batch(datastore_name, index_name, queries, top_k, credential_token)
+        # do sparse retrieval
+        else:
+            return await dense_retrieval.sparse_search_batch(datastore_name, queries, top_k)
+    except ValueError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except Exception as other_ex:
+        raise HTTPException(status_code=500, detail=str(other_ex))
+
+
+@router.post(
+    "/search_by_vector_batch",
+    summary="Search a datastore with several query vectors and return the top-k documents of each vector",
+    description="Batched version of /search_by_vector with one FAISS request for all query vectors",
+    response_description="The top-K documents of each query vector",
+    response_model=List[List[QueryResult]],
+    responses={
+        200: {"model": List[List[QueryResult]], "description": "The top-K documents of each query vector"},
+        404: {"model": HTTPError, "description": "The datastore or index does not exist"},
+        500: {"model": HTTPError, "description": "Model API error"},
+    },
+)
+async def search_by_vector_batch(
+    datastore_name: str = Path(..., description="Name of the datastore."),
+    index_name: str = Body(..., description="Index name."),
+    query_vectors: List[List[float]] = Body(..., description="Query vectors."),
+    top_k: int = Body(40, description="Number of documents to retrieve per query vector."),
+    dense_retrieval=Depends(get_search_client),
+):
+    try:
+        return await dense_retrieval.search_by_vector_batch(datastore_name, index_name, query_vectors, top_k)
+    except ValueError as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
+    except Exception as other_ex:
+        raise HTTPException(status_code=500, detail=str(other_ex))
+
+
 @router.get(
     "/score",
     summary="Score the document with given query",
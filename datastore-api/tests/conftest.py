@@ -343,3 +343,75 @@ def client(es_container, mock_search_client, mongo_client, token) -> TestClient:
     app.dependency_overrides[get_mongo_client] = lambda: mongo_client
     client = TestClient(app)
     return client
+
+
+class FakeElasticsearch:
+    """In-memory Elasticsearch for the connector tests. Like Elasticsearch, writes are visible to gets right away,
+    but only searchable after a refresh."""
+
+    class _Indices:
+        def __init__(self, es):
+            self.es = es
+
+        async def refresh(self, index):
+            self.es.objects.update(self.es.unrefreshed)
+            self.es.unrefreshed.clear()
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.unrefreshed = {}
+        self.indices = self._Indices(self)
+        self.msearch_calls = 0
+        self.msearch_terms = []
+        self.mget_ids = []
+        # called before a delete lands, e.g. to read the document concurrently
+        self.before_delete = None
+
+    def _get(self, id):
+        return self.unrefreshed.get(id, self.objects.get(id))
+
+    async def msearch(self, body):
+        self.msearch_calls += 1
+        responses = []
+        for query in body[1::2]:
+            terms = [term["term"] for term in query["query"]["bool"]["filter"]]
+            self.msearch_terms.append(terms)
+            hits = [
+                {"_id": i, "_source": obj}
+                for i, obj in self.objects.items()
+                if obj["type"] == "edge" and all(obj[field] == value for term in terms for field, value in term.items())
+            ]
+            responses.append({"hits": {"hits": hits[: query.get("size", 10)]}})
+        return {"responses": responses}
+
+    async def mget(self, index, body):
+        self.mget_ids.append(body["ids"])
+        docs = []
+        for i in body["ids"]:
+            source = self._get(i)
+            docs.append({"_id": i, "found": False} if source is None else {"_id": i, "found": True, "_source": source})
+        return {"docs": docs}
+
+    async def index(self, index, id, body):
+        self.unrefreshed[id] = body
+        return {"_shards": {"successful": 1}, "result": "created"}
+
+    async def update(self, index, id, body):
+        self.unrefreshed[id] = {**self._get(id), **body["doc"]}
+        return {"_shards": {"successful": 1}, "result": "updated"}
+
+    async def delete(self, index, id):
+        if self.before_delete is not None:
+            await self.before_delete()
+        self.objects.pop(id, None)
+        self.unrefreshed.pop(id, None)
+        return {"_shards": {"successful": 1}, "result": "deleted"}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_elasticsearch():
+    """Factory for in-memory Elasticsearch clients, see FakeElasticsearch."""
+    return FakeElasticsearch
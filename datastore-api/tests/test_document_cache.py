@@ -0,0 +1,57 @@
+import asyncio
+from unittest.mock import patch
+
+from app.core.document_cache import DocumentCache
+from app.core.es.connector import ElasticsearchConnector
+from app.models.document import Document
+
+
+def test_cache_lru_and_ttl():
+    cache = DocumentCache(max_size=2, ttl=10)
+
+    async def run():
+        await cache.put_many("wiki", {"1": {"text": "a"}, "2": {"text": "b"}})
+        await cache.get_many("wiki", ["1"])
+        await cache.put_many("wiki", {"3": {"text": "c"}})
+        return await cache.get_many("wiki", ["1", "2", "3"])
+
+    assert asyncio.run(run()) == {"1": {"text": "a"}, "3": {"text": "c"}}
+
+    with patch("app.core.document_cache.time.monotonic", return_value=1e12):
+        assert asyncio.run(cache.get_many("wiki", ["1", "3"])) == {}
+
+
+def test_connector_fetches_only_uncached_documents(fake_elasticsearch):
+    es = fake_elasticsearch({"1": {"text": "a"}, "2": {"text": "b"}})
+    conn = ElasticsearchConnector("http://localhost:9200", document_cache=DocumentCache(max_size=10))
+    conn.es = es
+
+    async def run():
+        first = await conn.get_document_batch("wiki", ["1", "2", "3"])
+        second = await conn.get_document_batch("wiki", ["2", "1"])
+        await conn.update_document("wiki", "1", Document({"id": "1", "text": "new"}))
+        third = await conn.get_document("wiki", "1")
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert [doc.id for doc in first] == ["1", "2"]
+    assert [doc["text"] for doc in second] == ["b", "a"]
+    assert third["text"] == "new"
+    assert es.mget_ids == [["1", "2", "3"], ["1"]]
+
+
+def test_connector_does_not_serve_deleted_documents(fake_elasticsearch):
+    es = fake_elasticsearch({"1": {"text": "a"}, "2": {"text": "b"}})
+    conn = ElasticsearchConnector("http://localhost:9200", document_cache=DocumentCache(max_size=10))
+    conn.es = es
+
+    async def run():
+        await conn.get_document_batch("wiki", ["1", "2"])
+        # a request reads the document while it is deleted
+        es.before_delete = lambda: conn.get_document_batch("wiki", ["1"])
+        deleted = await conn.delete_document("wiki", "1")
+        return deleted, await conn.get_document_batch("wiki", ["1", "2"])
+
+    deleted, documents = asyncio.run(run())
+    assert deleted
+    assert [doc.id for doc in documents] == ["2"]
@@ -0,0 +1,101 @@
+import asyncio
+import glob
+import json
+from unittest.mock import patch
+
+import h5py
+import numpy as np
+import pytest
+
+from app.core.embedded_index import EmbeddedIndex, EmbeddedIndexClient
+from app.core.faiss import FaissClient
+from tests.utils import async_mock_callable
+
+
+@pytest.fixture
+def embeddings():
+    return np.random.default_rng(0).normal(size=(300, 16)).astype(np.float32)
+
+
+@pytest.fixture
+def index_dir(tmp_path, embeddings):
+    """Writes the embeddings as two chunks like offline_encoding_for_data_api.py, the second one compressed."""
+    path = tmp_path / "wiki" / "dpr"
+    path.mkdir(parents=True)
+    ids = np.array([str(i) for i in range(len(embeddings))], dtype="S")
+    with h5py.File(path / "embeddings_0.h5", "w") as f:
+        f.create_dataset("ids", data=ids[:200])
+        f.create_dataset("embeddings", data=embeddings[:200])
+    with h5py.File(path / "embeddings_1.h5", "w") as f:
+        f.create_dataset("ids", data=ids[200:], compression="gzip")
+        f.create_dataset("embeddings", data=embeddings[200:], compression="gzip")
+    return tmp_path
+
+
+def test_flat_search(index_dir, embeddings):
+    index = EmbeddedIndex(str(index_dir / "wiki" / "dpr"), index_type="flat")
+    queries = embeddings[[5, 250]] + 0.01
+    results = index.search(queries.tolist(), top_k=3)
+
+    expected = np.argsort(-(queries @ embeddings.T), axis=1)[:, :3]
+    assert [list(result.keys()) for result in results] == [[str(i) for i in row] for row in expected]
+    assert list(results[1].values())[0] == pytest.approx(float(queries[1] @ embeddings[expected[1, 0]]), rel=1e-5)
+
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_ann_search(index_dir, embeddings, index_type):
+    pytest.importorskip("faiss")
+    path = index_dir / "wiki" / "dpr"
+    (path / "index.json").write_text(json.dumps({"type": index_type, "nlist": 4, "nprobe": 4}))
+    index = EmbeddedIndex(str(path))
+    assert index.index_type == index_type
+
+    results = index.search(embeddings[[7, 280]].tolist(), top_k=5)
+    assert [list(result.keys())[0] for result in results] == ["7", "280"]
+    # the built index is stored and reused
+    assert len(list(path.glob("*.faiss"))) == 1
+
+
+def test_client_falls_back_to_faiss(index_dir, embeddings):
+    client = EmbeddedIndexClient(str(index_dir), fallback=FaissClient())
+
+    async def run():
+        embedded = await client.search("wiki", "dpr", embeddings[42].tolist(), top_k=1)
+        explained = await client.explain("wiki", "dpr", embeddings[42].tolist(), "42")
+        reconstructed = await client.reconstruct("wiki", "dpr", "210")
+        with patch.object(FaissClient, "search_batch", new_callable=async_mock_callable([{"1": 0.5}])):
+            forwarded = await client.search("wiki", "other", [0.0] * 16, top_k=1)
+        return embedded, explained, reconstructed, forwarded
+
+    embedded, explained, reconstructed, forwarded = asyncio.run(run())
+    assert list(embedded.keys()) == ["42"]
+    assert explained["score"] == pytest.approx(float(embeddings[42] @ embeddings[42]), rel=1e-5)
+    assert reconstructed["vector"] == pytest.approx(embeddings[210].tolist())
+    assert forwarded == {"1": 0.5}
+
+
+def test_ids_are_memory_mapped(index_dir, embeddings):
+    path = index_dir / "wiki" / "dpr"
+    # offline encodings may store the ids as variable-length strings
+    with h5py.File(path / "embeddings_2.h5", "w") as f:
+        f.create_dataset("ids", data=["300", "long-id-301"], dtype=h5py.string_dtype())
+        f.create_dataset("embeddings", data=embeddings[:2] * 2)
+    index = EmbeddedIndex(str(path), index_type="flat")
+
+    assert all(isinstance(ids, np.memmap) for ids in index.ids)
+    assert list(index.search(embeddings[[0, 1]].tolist(), top_k=1)[1]) == ["long-id-301"]
+    assert index.reconstruct("210") == pytest.approx(embeddings[210])
+
+
+def test_client_caches_the_lookup_of_index_files(index_dir):
+    client = EmbeddedIndexClient(str(index_dir), fallback=FaissClient())
+    with patch("app.core.embedded_index.glob.glob", wraps=glob.glob) as lookup:
+        assert not client.is_embedded("wiki", "new")
+        (index_dir / "wiki" / "new").mkdir()
+        (index_dir / "wiki" / "new" / "embeddings_0.h5").touch()
+        assert not client.is_embedded("wiki", "new")
+        assert lookup.call_count == 1
+
+        client.invalidate("wiki", "new")
+        assert client.is_embedded("wiki", "new")
+        assert lookup.call_count == 2
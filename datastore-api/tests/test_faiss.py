@@ -0,0 +1,52 @@
+import asyncio
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.core.faiss import FaissClient
+
+
+async def _search(request):
+    data = await request.json()
+    return web.json_response([{str(i): float(vector[0])} for i, vector in enumerate(data["vectors"])])
+
+
+async def _slow(request):
+    await asyncio.sleep(1)
+    return web.json_response({})
+
+
+def _run_with_faiss_server(test):
+    async def run():
+        app = web.Application()
+        app.router.add_post("/search", _search)
+        app.router.add_get("/index_list", _slow)
+        async with TestServer(app) as server:
+            url = str(server.make_url("")).rstrip("/")
+            with patch.object(FaissClient, "build_faiss_url", return_value=url):
+                client = FaissClient(timeout=0.2, pool_size=4)
+                try:
+                    return await test(client)
+                finally:
+                    await client.close()
+
+    return asyncio.run(run())
+
+
+def test_search_batch():
+    async def test(client):
+        results = await client.search_batch("datastore", "index", [[1.0], [2.0]], top_k=1)
+        result = await client.search("datastore", "index", [3.0], top_k=1)
+        return results, result
+
+    results, result = _run_with_faiss_server(test)
+    assert results == [{"0": 1.0}, {"1": 2.0}]
+    assert result == {"0": 3.0}
+
+
+def test_status_timeout():
+    async def test(client):
+        return await client.status("datastore", "index")
+
+    assert _run_with_faiss_server(test) is None
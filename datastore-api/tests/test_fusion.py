@@ -0,0 +1,29 @@
+import pytest
+
+from app.core.fusion import linear_fusion, reciprocal_rank_fusion
+
+
+def test_reciprocal_rank_fusion():
+    sparse = {"a": 12.0, "b": 8.0, "c": 1.0}
+    dense = {"c": 0.9, "a": 0.8, "d": 0.1}
+    fused = reciprocal_rank_fusion([sparse, dense], k=60)
+
+    assert fused["a"] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused["b"] == pytest.approx(1 / 62)
+    assert sorted(fused, key=fused.get, reverse=True) == ["a", "c", "b", "d"]
+
+
+def test_linear_fusion():
+    sparse = {"a": 20.0, "b": 10.0}
+    dense = {"b": 0.5, "c": 0.3}
+    fused = linear_fusion(sparse, dense, alpha=0.25)
+
+    assert fused["a"] == pytest.approx(0.75)
+    assert fused["b"] == pytest.approx(0.25)
+    assert fused["c"] == pytest.approx(0.0)
+
+
+def test_linear_fusion_single_hit():
+    fused = linear_fusion({"a": 3.0}, {}, alpha=0.5)
+    assert fused == {"a": pytest.approx(0.5)}
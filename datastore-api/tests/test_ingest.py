@@ -0,0 +1,170 @@
+import asyncio
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+import zstandard
+from requests_mock import Mocker
+
+from app.core.config import settings
+from app.core.ingest import _run_upload_job, ingest, ingest_many, url_chunks
+from app.models.upload import UploadJob, UploadJobStatus, UploadSourceProgress
+
+
+class _FakeConnector:
+    def __init__(self, failing_ids=()):
+        self.batches = []
+        self.failing_ids = set(failing_ids)
+
+    async def add_document_batch(self, datastore_name, documents):
+        documents = list(documents)
+        await asyncio.sleep(0.001)
+        self.batches.append([doc.id for doc in documents])
+        errors = sum(doc.id in self.failing_ids for doc in documents)
+        return len(documents) - errors, errors
+
+
+class _FakeMongo:
+    def __init__(self, claimed_after=None):
+        self.saved = []
+        # number of saves after which another run claims the job
+        self.claimed_after = claimed_after
+
+    async def save_upload_job(self, job):
+        if self.claimed_after is not None and len(self.saved) >= self.claimed_after:
+            return False
+        self.saved.append(job.copy(deep=True))
+        return True
+
+
+def _jsonl(n, start=0):
+    return b"".join(json.dumps({"id": str(i), "text": "x" * 50}).encode() + b"\n" for i in range(start, start + n))
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_BATCH_SIZE", 4)
+    monkeypatch.setattr(settings, "UPLOAD_BATCH_BYTES", 1000)
+    monkeypatch.setattr(settings, "UPLOAD_CONCURRENCY", 3)
+    monkeypatch.setattr(settings, "UPLOAD_QUEUE_SIZE", 2)
+
+
+@pytest.mark.parametrize(
+    "compress", [lambda data: data, gzip.compress, lambda data: zstandard.ZstdCompressor().compress(data)]
+)
+def test_ingest(compress):
+    conn = _FakeConnector()
+    data = compress(_jsonl(10) + b"\n")
+    chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+    result = asyncio.run(ingest(conn, "wiki", "0.jsonl", lambda: iter(chunks)))
+
+    assert result.message is None
+    assert result.successful_uploads == 10
+    assert result.lines_committed == 11
+    assert sorted(doc_id for batch in conn.batches for doc_id in batch) == [str(i) for i in range(10)]
+    assert max(len(batch) for batch in conn.batches) == 4
+
+
+def test_ingest_batches_by_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_BATCH_BYTES", 140)
+    conn = _FakeConnector()
+    asyncio.run(ingest(conn, "wiki", "0.jsonl", lambda: iter([_jsonl(6)])))
+    assert [len(batch) for batch in conn.batches] == [2, 2, 2]
+
+
+def test_ingest_stops_at_invalid_document():
+    conn = _FakeConnector()
+    data = _jsonl(6) + b"{broken\n" + _jsonl(4, start=6)
+    result = asyncio.run(ingest(conn, "wiki", "0.jsonl", lambda: iter([data])))
+
+    assert result.message == "Unable to correctly decode document 6 in 0.jsonl."
+    assert result.successful_uploads == 6
+    assert result.lines_committed == 6
+
+
+def test_ingest_resumes_after_committed_lines():
+    conn = _FakeConnector()
+    result = asyncio.run(ingest(conn, "wiki", "0.jsonl", lambda: iter([_jsonl(10)]), skip_lines=8))
+    assert conn.batches == [["8", "9"]]
+    assert result.lines_committed == 10
+
+
+def test_ingest_many_urls(requests_mock: Mocker):
+    requests_mock.get("http://docs/0.jsonl", content=_jsonl(5))
+    requests_mock.get("http://docs/1.jsonl.gz", content=gzip.compress(_jsonl(5, start=5)))
+    requests_mock.get("http://docs/2.jsonl", status_code=404)
+    conn = _FakeConnector()
+    results = asyncio.run(
+        ingest_many(conn, "wiki", ["http://docs/0.jsonl", "http://docs/1.jsonl.gz", "http://docs/2.jsonl"], url_chunks)
+    )
+
+    assert [result.successful_uploads for result in results] == [5, 5, 0]
+    assert results[2].message == "Failed to retrieve documents from http://docs/2.jsonl."
+
+
+def test_upload_job_resume(requests_mock: Mocker):
+    requests_mock.get("http://docs/0.jsonl", content=_jsonl(10))
+    conn, mongo = _FakeConnector(failing_ids={"9"}), _FakeMongo()
+    now = datetime.utcnow()
+    job = UploadJob(
+        id="job", datastore_name="wiki", sources=[UploadSourceProgress(url="http://docs/0.jsonl")],
+        created_at=now, updated_at=now,
+    )
+
+    asyncio.run(_run_upload_job(conn, mongo, job))
+    assert job.status == UploadJobStatus.failed
+    assert job.sources[0].lines_committed == 8
+    assert mongo.saved[-1].status == UploadJobStatus.failed
+
+    conn.failing_ids = set()
+    conn.batches = []
+    asyncio.run(_run_upload_job(conn, mongo, job))
+    assert job.status == UploadJobStatus.completed
+    assert conn.batches == [["8", "9"]]
+    assert job.sources[0].done
+
+
+def _job(url="http://docs/0.jsonl"):
+    now = datetime.utcnow()
+    return UploadJob(
+        id="job", datastore_name="wiki", sources=[UploadSourceProgress(url=url)], created_at=now, updated_at=now,
+    )
+
+
+def test_upload_job_stops_when_claimed(requests_mock: Mocker, monkeypatch):
+    monkeypatch.setattr("app.core.ingest.JOB_SAVE_INTERVAL", 0)
+    monkeypatch.setattr(settings, "UPLOAD_CONCURRENCY", 1)
+    requests_mock.get("http://docs/0.jsonl", content=_jsonl(40))
+    conn, mongo = _FakeConnector(), _FakeMongo(claimed_after=2)
+    job = _job()
+
+    asyncio.run(_run_upload_job(conn, mongo, job))
+    # the run stops after its progress could not be saved and does not overwrite the job of the other run
+    assert len(conn.batches) < 10
+    assert len(mongo.saved) == 2
+    assert all(saved.status == UploadJobStatus.running for saved in mongo.saved)
+
+
+def _slow(add_document_batch):
+    async def slow_add_document_batch(datastore_name, documents):
+        await asyncio.sleep(0.05)
+        return await add_document_batch(datastore_name, documents)
+
+    return slow_add_document_batch
+
+
+def test_upload_job_heartbeat(requests_mock: Mocker, monkeypatch):
+    monkeypatch.setattr("app.core.ingest.JOB_SAVE_INTERVAL", 1000)
+    monkeypatch.setattr("app.core.ingest.JOB_HEARTBEAT_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "UPLOAD_CONCURRENCY", 1)
+    requests_mock.get("http://docs/0.jsonl", content=_jsonl(8))
+    conn, mongo = _FakeConnector(), _FakeMongo()
+    conn.add_document_batch = _slow(conn.add_document_batch)
+    job = _job()
+
+    asyncio.run(_run_upload_job(conn, mongo, job))
+    assert job.status == UploadJobStatus.completed
+    # besides the first and the final save, the job was updated while the batches were uploaded
+    assert len(mongo.saved) > 2
+    assert [saved.updated_at for saved in mongo.saved] == sorted(saved.updated_at for saved in mongo.saved)
@@ -0,0 +1,158 @@
+import asyncio
+import random
+
+import pytest
+
+from app.core.document_cache import DocumentCache
+from app.core.kgs.connector import KnowledgeGraphConnector
+from app.models.document import Document
+
+
+def _random_graph(n_nodes, n_edges, seed):
+    rng = random.Random(seed)
+    objects = {f"n{i}": {"name": f"node {i}", "type": "node"} for i in range(n_nodes)}
+    for i in range(n_edges):
+        objects[f"e{i}"] = {
+            "name": "related_to",
+            "type": "edge",
+            "in_id": f"n{rng.randrange(n_nodes)}",
+            "out_id": f"n{rng.randrange(n_nodes)}",
+            "weight": 1.0,
+        }
+    return objects
+
+
+def _closed_path_edges(objects, nids, hops):
+    # enumerates all paths like the original path expansion
+    edges = [dict(obj, _id=i) for i, obj in objects.items() if obj["type"] == "edge"]
+    paths = [[edge] for edge in edges if edge["in_id"] in nids]
+    found = set()
+    for _ in range(hops):
+        found.update(edge["_id"] for path in paths if path[-1]["out_id"] in nids for edge in path)
+        paths = [path + [edge] for path in paths for edge in edges if edge["in_id"] == path[-1]["out_id"]]
+    return found
+
+
+@pytest.fixture
+def connector(fake_elasticsearch):
+    def connector(objects, cache_size=0):
+        conn = KnowledgeGraphConnector("http://localhost:9200", adjacency_cache=DocumentCache(max_size=cache_size))
+        conn.es = fake_elasticsearch(objects)
+        return conn
+
+    return connector
+
+
+def test_extract_subgraph_matches_path_expansion(connector):
+    objects = _random_graph(30, 80, seed=0)
+    conn = connector(objects)
+    for hops in (1, 2, 3):
+        nids = {"n0", "n1", "n2", "n3"}
+        nodes, edges = asyncio.run(conn.extract_subgraph("conceptnet", nids, hops))
+        assert set(edges) == _closed_path_edges(objects, nids, hops)
+        assert set(nodes) == nids | {edge[end] for edge in edges.values() for end in ("in_id", "out_id")}
+
+
+def test_extract_subgraph_uses_one_round_trip_per_hop(connector):
+    objects = _random_graph(30, 80, seed=1)
+    conn = connector(objects)
+    asyncio.run(conn.extract_subgraph("conceptnet", ["n0", "n1"], hops=3))
+    assert conn.es.msearch_calls <= 3
+
+
+def test_adjacency_cache_and_invalidation(connector):
+    objects = _random_graph(10, 20, seed=2)
+    conn = connector(objects, cache_size=100)
+
+    async def run():
+        first = await conn.edges_in_out_msearch("conceptnet", ["n0", "n1"])
+        calls = conn.es.msearch_calls
+        second = await conn.edges_in_out_msearch("conceptnet", ["n1", "n0"])
+        assert conn.es.msearch_calls == calls
+        assert first == second
+        edge = {"id": "new", "name": "is_a", "type": "edge", "in_id": "n0", "out_id": "n1", "weight": 1.0}
+        await conn.add_document("conceptnet", "new", Document(edge))
+        return await conn.edges_in_out_msearch("conceptnet", ["n0"])
+
+    assert "new" in asyncio.run(run())["n0"]
+
+
+def test_written_edges_are_read_back(connector):
+    objects = _random_graph(10, 20, seed=3)
+    conn = connector(objects, cache_size=100)
+
+    async def run():
+        await conn.edges_in_out_msearch("conceptnet", ["n0", "n1"])
+        edges = []
+        for i, (in_id, out_id) in enumerate([("n0", "n1"), ("n1", "n0"), ("n0", "n0")]):
+            edge = {"id": f"new{i}", "name": "is_a", "type": "edge", "in_id": in_id, "out_id": out_id, "weight": 1.0}
+            await conn.add_document("conceptnet", edge["id"], Document(edge))
+            edges.append(edge["id"])
+            # the first lookup after the write caches the new edges, the second one is served from the cache
+            for _ in range(2):
+                adjacency = await conn.edges_in_out_msearch("conceptnet", ["n0", "n1"])
+                assert set(edges) <= set(adjacency["n0"])
+        return adjacency
+
+    adjacency = asyncio.run(run())
+    assert set(adjacency["n1"]) >= {"new0", "new1"}
+
+
+def test_lookup_overlapping_a_write_is_not_cached(connector):
+    objects = _random_graph(10, 20, seed=4)
+    conn = connector(objects, cache_size=100)
+    msearch = conn.es.msearch
+
+    async def msearch_during_write(body):
+        # the edges are searched before the write, which completes while the lookup is in flight
+        result = await msearch(body)
+        edge = {"id": "new", "name": "is_a", "type": "edge", "in_id": "n0", "out_id": "n1", "weight": 1.0}
+        conn.es.msearch = msearch
+        await conn.add_document("conceptnet", "new", Document(edge))
+        return result
+
+    async def run():
+        conn.es.msearch = msearch_during_write
+        stale = await conn.edges_from_msearch("conceptnet", ["n0"])
+        fresh = await conn.edges_from_msearch("conceptnet", ["n0"])
+        return stale, fresh
+
+    stale, fresh = asyncio.run(run())
+    assert "new" not in stale["n0"]
+    assert "new" in fresh["n0"]
+
+
+def test_get_nodes_for_nodepairs(connector):
+    objects = {
+        "e1": {"type": "edge", "in_id": "q", "out_id": "x"},
+        "e2": {"type": "edge", "in_id": "x", "out_id": "a"},
+        "e3": {"type": "edge", "in_id": "y", "out_id": "q"},
+        "e4": {"type": "edge", "in_id": "a", "out_id": "z"},
+    }
+    conn = connector(objects)
+    result = asyncio.run(conn.get_nodes_for_nodepairs("conceptnet", [["q", "a"], ["q", "z"]]))
+    assert result == [{"x"}, set()]
+    assert conn.es.msearch_calls == 2
+
+
+def test_get_edge_msearch_filters_pairs_of_uncached_nodes(connector):
+    objects = {
+        "e1": {"type": "edge", "in_id": "q", "out_id": "a"},
+        "e2": {"type": "edge", "in_id": "q", "out_id": "x"},
+        "e3": {"type": "edge", "in_id": "a", "out_id": "q"},
+    }
+    conn = connector(objects, cache_size=100)
+
+    async def run():
+        cold = await conn.get_edge_msearch("conceptnet", [("q", "a"), ("x", "q")])
+        # the adjacency of q is not fetched, only the edges of the pairs
+        assert conn.es.msearch_terms == [[{"in_id": "q"}, {"out_id": "a"}], [{"in_id": "x"}, {"out_id": "q"}]]
+        await conn.edges_from_msearch("conceptnet", ["q", "x"])
+        calls = conn.es.msearch_calls
+        warm = await conn.get_edge_msearch("conceptnet", [("q", "a"), ("x", "q")])
+        assert conn.es.msearch_calls == calls
+        return cold, warm
+
+    cold, warm = asyncio.run(run())
+    assert [set(edges) for edges in cold] == [{"e1"}, set()]
+    assert warm == cold
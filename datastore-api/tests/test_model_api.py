@@ -0,0 +1,77 @@
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import aiohttp
+import pytest
+
+from app.core import model_api
+from app.core.model_api import ModelAPIClient
+
+
+class _FakeResponse:
+    def __init__(self, status, body=None):
+        self.status = status
+        self.content_type = "application/json"
+        self.body = body
+
+    async def text(self):
+        return json.dumps(self.body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(MagicMock(), (), status=self.status)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class _FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.params = []
+
+    def get(self, url, params, headers, verify_ssl):
+        self.params.append(params)
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def credentials():
+    with patch.object(model_api, "client_credentials", lambda: "token"):
+        yield
+
+
+def _wait(session, **kwargs):
+    client = ModelAPIClient("http://model-api")
+    return asyncio.run(client._wait_for_task("123", session=session, **kwargs))
+
+
+def test_wait_for_task_clamps_the_timeout():
+    session = _FakeSession(
+        [_FakeResponse(202), _FakeResponse(200, {"status": "Finished", "result": {"labels": [1]}})]
+    )
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+
+    with patch.object(model_api.asyncio, "sleep", new=sleep):
+        assert _wait(session, poll_interval=3600) == {"labels": [1]}
+    assert [params["timeout"] for params in session.params] == [model_api.MAX_TASK_RESULT_WAIT] * 2
+    assert len(slept) == 1 and slept[0] <= model_api.MAX_TASK_RESULT_WAIT
+
+
+def test_wait_for_task_raises_error_statuses():
+    session = _FakeSession([_FakeResponse(500)])
+    with pytest.raises(aiohttp.ClientResponseError):
+        _wait(session, poll_interval=0)
+
+
+def test_wait_for_task_raises_timeout():
+    session = _FakeSession([_FakeResponse(202), _FakeResponse(202)])
+    with pytest.raises(TimeoutError):
+        _wait(session, max_attempts=2, poll_interval=0)
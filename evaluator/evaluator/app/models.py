@@ -69,6 +69,9 @@ class PredictionResult(MongoModel):
     dataset_name: str = Field(..., description="Name of the dataset")
     last_updated_at: datetime = Field()
     calculation_time: float = Field(..., description="Calculation time in seconds")
+    throughput: Optional[float] = Field(
+        None, description="Number of predicted datapoints per second"
+    )
     predictions: List[Prediction] = Field(...)
 
 
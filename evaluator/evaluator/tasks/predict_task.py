@@ -1,7 +1,10 @@
 import datetime
+import hashlib
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List
 
 import requests
@@ -30,7 +33,20 @@ from .celery import app as celery_app
 logger = get_task_logger(__name__)
 base_url = os.getenv("SQUARE_API_URL", "https://square.ukp-lab.de/api")
 batch_size = int(os.getenv("BATCH_SIZE", 1000))
+# number of batches sent to the skill at the same time
+concurrency = int(os.getenv("PREDICT_CONCURRENCY", 4))
+max_retries = int(os.getenv("PREDICT_MAX_RETRIES", 3))
+retry_backoff = float(os.getenv("PREDICT_RETRY_BACKOFF", 2.0))
+request_timeout = float(os.getenv("PREDICT_TIMEOUT", 600))
 QUEUE = os.getenv("QUEUE", "evaluation")
+# fields of a skill that change its predictions. Checkpoints of other values are not resumed
+SKILL_VERSION_FIELDS = (
+    "url",
+    "skill_type",
+    "skill_settings",
+    "default_skill_args",
+    "meta_skill",
+)
 
 
 @celery_app.task
@@ -65,6 +81,70 @@ def predict(
         raise e
 
 
+def predict_batch(
+    session: requests.Session, url: str, batch: List[Dict], context_type: str
+) -> List[Prediction]:
+    """Queries the skill with a batch of datapoints and returns their predictions.
+
+    Connection errors, timeouts and responses with status 429 or 5xx are retried up to
+    `PREDICT_MAX_RETRIES` times with exponential backoff.
+    """
+    query_request = {
+        "query": [
+            datapoint["question"] for datapoint in batch if "question" in datapoint
+        ],
+        "skill_args": {
+            "context": [
+                datapoint[context_type]
+                for datapoint in batch
+                if context_type in datapoint
+            ]
+        },
+        "num_results": 1,
+    }
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(
+                url, data=json.dumps(query_request), timeout=request_timeout
+            )
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            error = requests.HTTPError(
+                f"{response.status_code} Error for url: {url}", response=response
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt == max_retries:
+            raise error
+        delay = retry_backoff * 2**attempt
+        logger.warning(f"Query failed ({error}), retrying in {delay} seconds")
+        time.sleep(delay)
+
+    response.raise_for_status()
+    prediction_response = response.json()["predictions"]
+    return [
+        Prediction(
+            id=datapoint["id"],
+            output=output["prediction_output"]["output"],
+            output_score=output["prediction_output"]["output_score"],
+        )
+        for datapoint, output in zip(batch, prediction_response)
+    ]
+
+
+def get_skill_version(session: requests.Session, skill_id: str) -> str:
+    """Returns a hash of the skill configuration that determines its predictions."""
+    response = session.get(
+        f"{base_url}/skill-manager/skill/{skill_id}", timeout=request_timeout
+    )
+    response.raise_for_status()
+    skill = response.json()
+    skill_config = {field: skill.get(field) for field in SKILL_VERSION_FIELDS}
+    return hashlib.sha1(
+        json.dumps(skill_config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
 def do_predict(
     skill_id: str,
     dataset_name: str,
@@ -87,10 +167,6 @@ def do_predict(
     # format the dataset into universal format for its skill-type
     dataset = dataset_handler.to_generic_format(dataset, dataset_metadata)
 
-    headers = {"Authorization": f"Bearer {token}"}
-    predictions: List[Prediction] = []
-    start_time = datetime.datetime.now()
-
     if dataset_metadata.skill_type == "extractive-qa":
         context_type = "context"
     elif dataset_metadata.skill_type == "multiple-choice":
@@ -102,49 +178,88 @@ def do_predict(
             f"Predictions on '{skill_type}' datasets is currently not supported.",
         )
 
-    for i in range(0, len(dataset), batch_size):
-        query_request = {
-            "query": [
-                datapoint["question"]
-                for datapoint in dataset[i : min(i + batch_size, len(dataset))]
-                if "question" in datapoint
-            ],
-            "skill_args": {
-                "context": [
-                    datapoint[context_type]
-                    for datapoint in dataset[i : min(i + batch_size, len(dataset))]
-                    if context_type in datapoint
-                ]
-            },
-            "num_results": 1,
-        }
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    url = f"{base_url}/skill-manager/skill/{skill_id}/query"
 
-        response = requests.post(
-            f"{base_url}/skill-manager/skill/{skill_id}/query",
-            headers=headers,
-            data=json.dumps(query_request),
+    # batches predicted by a previous, interrupted run of the task with the same skill configuration
+    checkpoint_filter = {
+        "skill_id": ObjectId(skill_id),
+        "skill_version": get_skill_version(session, skill_id),
+        "dataset_name": dataset_name,
+        "batch_size": batch_size,
+        "dataset_size": len(dataset),
+    }
+    batch_predictions: Dict[int, List[Prediction]] = {
+        checkpoint["start"]: [Prediction(**p) for p in checkpoint["predictions"]]
+        for checkpoint in mongo_client.client.evaluator.prediction_checkpoints.find(
+            checkpoint_filter
+        )
+    }
+    if batch_predictions:
+        logger.info(
+            f"Resuming prediction with {len(batch_predictions)} finished batches"
         )
 
-        response.raise_for_status()
-        prediction_response = response.json()["predictions"]
-
-        for datapoint, output in zip(dataset, prediction_response):
-            predictions.append(
-                Prediction(
-                    id=datapoint["id"],
-                    output=output["prediction_output"]["output"],
-                    output_score=output["prediction_output"]["output_score"],
+    start_time = datetime.datetime.now()
+    pending = [
+        i for i in range(0, len(dataset), batch_size) if i not in batch_predictions
+    ]
+    total = sum(len(dataset[i : i + batch_size]) for i in pending)
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(
+                predict_batch, session, url, dataset[i : i + batch_size], context_type
+            ): i
+            for i in pending
+        }
+        try:
+            for future in as_completed(futures):
+                start = futures[future]
+                batch_predictions[start] = future.result()
+                mongo_client.client.evaluator.prediction_checkpoints.replace_one(
+                    {**checkpoint_filter, "start": start},
+                    {
+                        **checkpoint_filter,
+                        "start": start,
+                        "predictions": [p.dict() for p in batch_predictions[start]],
+                    },
+                    upsert=True,
                 )
-            )
+                done += len(batch_predictions[start])
+                elapsed = (datetime.datetime.now() - start_time).total_seconds()
+                logger.info(
+                    f"Predicted {done}/{total} datapoints "
+                    f"({done / max(elapsed, 1e-9):.1f} datapoints/s)"
+                )
+        except Exception:
+            # the finished batches are checkpointed, do not send the remaining ones
+            for future in futures:
+                future.cancel()
+            raise
+
+    predictions: List[Prediction] = [
+        prediction
+        for start in sorted(batch_predictions)
+        for prediction in batch_predictions[start]
+    ]
 
     calculation_time = (datetime.datetime.now() - start_time).total_seconds()
-    logger.info(f"Prediction finished after {calculation_time} seconds")
+    throughput = done / calculation_time if calculation_time > 0 else None
+    logger.info(
+        f"Prediction finished after {calculation_time} seconds "
+        f"({throughput or 0:.1f} datapoints/s)"
+    )
 
     prediction_result = PredictionResult(
         skill_id=ObjectId(skill_id),
         dataset_name=dataset_name,
         last_updated_at=datetime.datetime.now(),
         calculation_time=calculation_time,
+        throughput=throughput,
         predictions=predictions,
     )
 
@@ -154,6 +269,8 @@ def do_predict(
         upsert=True,
     )
 
+    mongo_client.client.evaluator.prediction_checkpoints.delete_many(checkpoint_filter)
+
     mongo_client.client.evaluator.evaluations.update_many(
         evaluation_filter,
         {
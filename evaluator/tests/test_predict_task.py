@@ -0,0 +1,214 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from evaluator.tasks import predict_task
+
+SKILL = {
+    "id": "62eb8f7765872e7b65ea5c8a",
+    "url": "http://skill",
+    "skill_type": "span-extraction",
+    "skill_settings": {"requires_context": True},
+    "default_skill_args": {"adapter": "squad"},
+    "meta_skill": False,
+}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error", response=self)
+
+
+def _predictions(query_request):
+    return FakeResponse(
+        200,
+        {
+            "predictions": [
+                {
+                    "prediction_output": {
+                        "output": f"answer {question}",
+                        "output_score": 1.0,
+                    }
+                }
+                for question in query_request["query"]
+            ]
+        },
+    )
+
+
+class FakeSession:
+    def __init__(self, responses=None, skill=SKILL, failing=()):
+        # responses of the first query requests, the remaining requests are answered
+        self.responses = list(responses or [])
+        self.skill = skill
+        # questions whose batches always fail
+        self.failing = set(failing)
+        self.headers = {}
+        self.queries = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def get(self, url, timeout):
+        return FakeResponse(200, self.skill)
+
+    def post(self, url, data, timeout):
+        query_request = json.loads(data)
+        self.queries.append(query_request["query"])
+        if self.failing.intersection(query_request["query"]):
+            return FakeResponse(503)
+        if self.responses:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return _predictions(query_request)
+
+
+class FakeCollection:
+    def __init__(self, documents=None):
+        self.documents = list(documents or [])
+
+    def _matches(self, document, filter):
+        return all(document.get(key) == value for key, value in filter.items())
+
+    def find(self, filter):
+        return [d for d in self.documents if self._matches(d, filter)]
+
+    def replace_one(self, filter, document, upsert=False):
+        self.delete_many(filter)
+        self.documents.append(document)
+
+    def delete_many(self, filter):
+        self.documents = [d for d in self.documents if not self._matches(d, filter)]
+
+    def update_many(self, filter, update):
+        pass
+
+
+def _batch(n):
+    return [{"id": str(i), "question": f"q{i}", "context": "c"} for i in range(n)]
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleep = MagicMock()
+    monkeypatch.setattr(predict_task.time, "sleep", sleep)
+    return sleep
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    evaluator = SimpleNamespace(
+        evaluations=FakeCollection(),
+        predictions=FakeCollection(),
+        prediction_checkpoints=FakeCollection(),
+    )
+    monkeypatch.setattr(
+        predict_task,
+        "mongo_client",
+        SimpleNamespace(client=SimpleNamespace(evaluator=evaluator)),
+    )
+    return evaluator
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    dataset = _batch(5)
+    dataset_handler = MagicMock()
+    dataset_handler.to_generic_format.return_value = dataset
+    monkeypatch.setattr(predict_task, "DatasetHandler", lambda: dataset_handler)
+    monkeypatch.setattr(
+        predict_task,
+        "get_dataset_metadata",
+        lambda name: SimpleNamespace(skill_type="extractive-qa"),
+    )
+    monkeypatch.setattr(predict_task, "batch_size", 2)
+    # the batches are sent one after another
+    monkeypatch.setattr(predict_task, "concurrency", 1)
+    return dataset
+
+
+@pytest.mark.parametrize(
+    "failure",
+    [FakeResponse(429), FakeResponse(503), requests.ConnectionError("refused")],
+    ids=["429", "503", "connection"],
+)
+def test_predict_batch_retries(failure, no_sleep):
+    session = FakeSession([failure, failure])
+    predictions = predict_task.predict_batch(
+        session, "http://skill", _batch(2), "context"
+    )
+
+    assert [prediction.output for prediction in predictions] == [
+        "answer q0",
+        "answer q1",
+    ]
+    assert len(session.queries) == 3
+    assert [call.args[0] for call in no_sleep.call_args_list] == [
+        predict_task.retry_backoff,
+        2 * predict_task.retry_backoff,
+    ]
+
+
+def test_predict_batch_gives_up(monkeypatch):
+    monkeypatch.setattr(predict_task, "max_retries", 2)
+    session = FakeSession([FakeResponse(500)] * 3)
+    with pytest.raises(requests.HTTPError):
+        predict_task.predict_batch(session, "http://skill", _batch(2), "context")
+    assert len(session.queries) == 3
+
+
+def test_predict_batch_does_not_retry_client_errors():
+    session = FakeSession([FakeResponse(400)])
+    with pytest.raises(requests.HTTPError):
+        predict_task.predict_batch(session, "http://skill", _batch(2), "context")
+    assert len(session.queries) == 1
+
+
+def _run(monkeypatch, session):
+    monkeypatch.setattr(predict_task.requests, "Session", lambda: session)
+    return predict_task.do_predict(SKILL["id"], "squad", token="token")
+
+
+def test_do_predict_resumes_from_checkpoints(monkeypatch, mongo, dataset):
+    # a previous run failed at the second batch
+    with pytest.raises(requests.HTTPError):
+        _run(monkeypatch, FakeSession(failing={"q2"}))
+    assert [d["start"] for d in mongo.prediction_checkpoints.documents] == [0]
+
+    session = FakeSession()
+    _run(monkeypatch, session)
+    # only the batches without checkpoint are sent again
+    assert session.queries == [["q2", "q3"], ["q4"]]
+    predictions = mongo.predictions.documents[0]["predictions"]
+    assert [p["id"] for p in predictions] == [str(i) for i in range(5)]
+    assert [p["output"] for p in predictions] == [f"answer q{i}" for i in range(5)]
+    assert mongo.prediction_checkpoints.documents == []
+
+
+def test_do_predict_ignores_checkpoints_of_other_skill_versions(
+    monkeypatch, mongo, dataset
+):
+    with pytest.raises(requests.HTTPError):
+        _run(monkeypatch, FakeSession(failing={"q2"}))
+    stale = list(mongo.prediction_checkpoints.documents)
+    assert len(stale) == 1
+
+    # the skill was updated, so all batches are predicted again
+    session = FakeSession(skill={**SKILL, "default_skill_args": {"adapter": "quoref"}})
+    _run(monkeypatch, session)
+    assert session.queries == [["q0", "q1"], ["q2", "q3"], ["q4"]]
+    # only the checkpoints of the finished run are deleted
+    assert mongo.prediction_checkpoints.documents == stale
@@ -1,20 +1,38 @@
+import asyncio
+import base64
 import logging
 import os
+import time
 
+import msgpack
+from model_inference.app.core.request_coalescing import get_request_coalescer
 from model_inference.app.models.prediction import AsyncTaskResult
 from model_inference.app.models.request import PredictionRequest, Task
 from model_inference.app.models.statistics import ModelStatistics, UpdateModel
+from celery.exceptions import TimeoutError as CeleryTimeoutError
 from celery.result import AsyncResult
-from fastapi import APIRouter, HTTPException
-from starlette.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Request
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from model_inference.tasks.attribution_cache import load_statistics as load_attribution_cache_statistics
 from model_inference.tasks.config.model_config import ModelConfig
-from model_inference.tasks.tasks import prediction_task
+from model_inference.tasks.embedding_cache import load_statistics as load_embedding_cache_statistics
+from model_inference.tasks.embedding_cache import load_latest_statistics
+from model_inference.tasks.tasks import batched_prediction_task, prediction_task
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 QUEUE = os.getenv("QUEUE", os.getenv("MODEL_NAME", None))
+# Upper bound for how long a single /task_result request with wait=true is held open
+MAX_TASK_RESULT_WAIT = float(os.getenv("MAX_TASK_RESULT_WAIT", 60))
+# Number of /task_result requests that wait in a threadpool thread for the pub/sub notification of the result
+# backend. Further requests poll the result asynchronously, so that long-polls cannot starve the threadpool
+MAX_TASK_RESULT_WAITERS = int(os.getenv("MAX_TASK_RESULT_WAITERS", 16))
+TASK_RESULT_POLL_INTERVAL = 0.1
+task_result_waiters = asyncio.Semaphore(MAX_TASK_RESULT_WAITERS)
+MSGPACK_MEDIA_TYPE = "application/msgpack"
 
 
 def check_valid_request(request):
@@ -23,6 +41,40 @@ def check_valid_request(request):
     return True, None
 
 
+def get_prediction_task(model_config: ModelConfig):
+    """
+    Select the celery task for the model. Workers with a micro-batch window
+    consume the batched task that merges compatible requests.
+    """
+    if model_config.micro_batch_window_ms > 0:
+        return batched_prediction_task
+    return prediction_task
+
+
+async def queue_prediction(
+    identifier: str, prediction_request: PredictionRequest, task: Task, model_config: ModelConfig
+) -> str:
+    """
+    Queues the prediction task for the request and returns its id. If request coalescing is enabled, identical
+    requests are attached to the already queued task instead.
+    """
+    args = (prediction_request.dict(), task, model_config.to_dict())
+    queue = identifier.replace("/", "-")
+    coalescer = get_request_coalescer()
+    if not coalescer.enabled:
+        return get_prediction_task(model_config).apply_async(args, queue=queue).id
+
+    key = coalescer.request_key(identifier, task, args[0], args[2])
+    task_id, attached = await run_in_threadpool(
+        coalescer.submit,
+        key,
+        lambda task_id: get_prediction_task(model_config).apply_async(args, queue=queue, task_id=task_id),
+    )
+    if attached:
+        logger.info(f"Attached request to queued task {task_id}")
+    return task_id
+
+
 @router.post(
     "/{identifier}/sequence-classification",
     response_model=AsyncTaskResult,
@@ -42,16 +94,9 @@ async def sequence_classification(
     if not valid:
         return HTTPException(status_code=422, detail=msg)
     model_config = ModelConfig.load_from_file(identifier)
-    res = prediction_task.apply_async(
-        (
-            prediction_request.dict(),
-            Task.sequence_classification,
-            model_config.to_dict(),
-        ),
-        queue=identifier.replace("/", "-"),
-    )
+    task_id = await queue_prediction(identifier, prediction_request, Task.sequence_classification, model_config)
 
-    return AsyncTaskResult(message="Queued sequence classification", task_id=res.id)
+    return AsyncTaskResult(message="Queued sequence classification", task_id=task_id)
 
 
 @router.post(
@@ -73,11 +118,8 @@ async def token_classification(
     if not valid:
         return HTTPException(status_code=422, detail=msg)
     model_config = ModelConfig.load_from_file(identifier)
-    res = prediction_task.apply_async(
-        (prediction_request.dict(), Task.token_classification, model_config.to_dict()),
-        queue=identifier.replace("/", "-"),
-    )
-    return AsyncTaskResult(message="Queued token classification", task_id=res.id)
+    task_id = await queue_prediction(identifier, prediction_request, Task.token_classification, model_config)
+    return AsyncTaskResult(message="Queued token classification", task_id=task_id)
 
 
 @router.post("/{identifier}/embedding", response_model=AsyncTaskResult, name="embedding")
@@ -93,11 +135,8 @@ async def embedding(identifier: str, prediction_request: PredictionRequest, hf_u
     if not valid:
         return HTTPException(status_code=422, detail=msg)
     model_config = ModelConfig.load_from_file(identifier)
-    res = prediction_task.apply_async(
-        (prediction_request.dict(), Task.embedding, model_config.to_dict()),
-        queue=identifier.replace("/", "-"),
-    )
-    return AsyncTaskResult(message="Queued embedding", task_id=res.id)
+    task_id = await queue_prediction(identifier, prediction_request, Task.embedding, model_config)
+    return AsyncTaskResult(message="Queued embedding", task_id=task_id)
 
 
 @router.post(
@@ -119,11 +158,8 @@ async def question_answering(
     if not valid:
         return HTTPException(status_code=422, detail=msg)
     model_config = ModelConfig.load_from_file(identifier)
-    res = prediction_task.apply_async(
-        (prediction_request.dict(), Task.question_answering, model_config.to_dict()),
-        queue=identifier.replace("/", "-"),
-    )
-    return AsyncTaskResult(message="Queued question answering", task_id=res.id)
+    task_id = await queue_prediction(identifier, prediction_request, Task.question_answering, model_config)
+    return AsyncTaskResult(message="Queued question answering", task_id=task_id)
 
 
 @router.post("/{identifier}/generation", response_model=AsyncTaskResult, name="generation")
@@ -141,20 +177,80 @@ async def generation(
     if not valid:
         return HTTPException(status_code=422, detail=msg)
     model_config = ModelConfig.load_from_file(identifier)
-    res = prediction_task.apply_async(
-        (prediction_request.dict(), Task.generation, model_config.to_dict()),
-        queue=identifier.replace("/", "-"),
-    )
-    return AsyncTaskResult(message="Queued generation", task_id=res.id)
+    task_id = await queue_prediction(identifier, prediction_request, Task.generation, model_config)
+    return AsyncTaskResult(message="Queued generation", task_id=task_id)
+
+
+def wait_for_task(task_id: str, timeout: float) -> bool:
+    """
+    Blocks until the result backend reports the task as finished or the timeout expired.
+    The redis result backend notifies waiting clients via pub/sub, so this resolves
+    as soon as the worker stored the result. The AsyncResult is created in the calling
+    thread because the celery app keeps one result backend per thread.
+    Returns:
+        whether the task is finished
+    """
+    task = AsyncResult(task_id)
+    try:
+        task.get(timeout=timeout, propagate=False)
+    except CeleryTimeoutError:
+        pass
+    return task.ready()
+
+
+async def poll_task(task: AsyncResult, timeout: float) -> bool:
+    """
+    Polls the result backend without blocking a thread until the task is finished or the timeout expired
+    Returns:
+        whether the task is finished
+    """
+    deadline = time.monotonic() + timeout
+    while not task.ready():
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(TASK_RESULT_POLL_INTERVAL)
+    return True
+
+
+def _binary_to_base64(value):
+    """
+    Replaces the raw .npy bytes of binary model outputs by base64 strings so that the result can be sent as JSON
+    """
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("latin1")
+    if isinstance(value, dict):
+        return {k: _binary_to_base64(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_binary_to_base64(v) for v in value]
+    return value
 
 
 @router.get("/task_result/{task_id}")
-async def get_task_results(task_id: str):
+async def get_task_results(
+    request: Request,
+    task_id: str,
+    wait: bool = Query(False, description="Hold the request open until the task is finished or the timeout expired"),
+    timeout: float = Query(
+        10, gt=0, le=MAX_TASK_RESULT_WAIT, description="Maximum number of seconds to wait if wait is true"
+    ),
+):
     task = AsyncResult(task_id)
+    if wait and not task.ready():
+        if task_result_waiters.locked():
+            await poll_task(task, timeout)
+        else:
+            async with task_result_waiters:
+                await run_in_threadpool(wait_for_task, task_id, timeout)
     if not task.ready():
         return JSONResponse(status_code=202, content={"task_id": str(task_id), "status": "Processing"})
     result = task.get()
-    return {"task_id": str(task_id), "status": "Finished", "result": result}
+    content = {"task_id": str(task_id), "status": "Finished", "result": result}
+    if MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return Response(content=msgpack.packb(content, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE)
+    if isinstance(result, dict) and result.get("model_output_is_binary"):
+        content["result"] = _binary_to_base64(result)
+        content["result"]["model_output_is_binary"] = False
+    return content
 
 
 @router.get("/{identifier}/stats", response_model=ModelStatistics, name="statistics")
@@ -193,10 +289,23 @@ async def update(identifier: str, updated_param: UpdateModel, hf_username: str =
         and model_config.disable_gpu != updated_param.disable_gpu
     ):
         raise HTTPException(status_code=400, detail="Can't change gpu setting for the model")
+    if updated_param.onnx_execution_mode not in [None, "sequential", "parallel"]:
+        raise HTTPException(status_code=400, detail="onnx_execution_mode has to be 'sequential' or 'parallel'")
     model_config.disable_gpu = updated_param.disable_gpu
     model_config.batch_size = updated_param.batch_size
     model_config.max_input_size = updated_param.max_input
     model_config.return_plaintext_arrays = updated_param.return_plaintext_arrays
+    # the ONNX session options are only changed if they are set. Workers recreate their sessions on the next request
+    for session_option in [
+        "onnx_intra_op_num_threads",
+        "onnx_inter_op_num_threads",
+        "onnx_execution_mode",
+        "onnx_enable_cpu_mem_arena",
+        "onnx_execution_providers",
+        "onnx_optimized_model_path",
+    ]:
+        if getattr(updated_param, session_option) is not None:
+            setattr(model_config, session_option, getattr(updated_param, session_option))
     logger.info(model_config)
     model_config.save(identifier)
     logger.info(model_config)
@@ -212,4 +321,11 @@ def get_statistics(identifier):
     model_config = ModelConfig.load_from_file(identifier)
     model_config.update(identifier)
     logger.info(model_config)
-    return model_config.to_statistics()
+    statistics = model_config.to_statistics()
+    statistics.embedding_cache = load_embedding_cache_statistics(identifier)
+    statistics.attribution_cache = load_attribution_cache_statistics(identifier)
+    accuracy_report = load_latest_statistics(identifier, "accuracy_report")
+    # reports of an earlier CPU optimization of the model are not served
+    if accuracy_report and accuracy_report.get("cpu_optimization") == model_config.cpu_optimization:
+        statistics.cpu_optimization_report = accuracy_report
+    return statistics
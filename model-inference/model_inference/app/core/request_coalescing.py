@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Tuple
+
+import redis
+from celery.result import AsyncResult
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCoalescer:
+    """
+    Attaches identical prediction requests to the task that was already queued for the first of them, so that
+    traffic spikes of the same request cause a single forward pass. The hashes of the requests are mapped to their
+    task ids in Redis, which is shared by all API processes.
+    Optionally, the results of finished tasks are reused by identical requests for a short time.
+    """
+
+    def __init__(self, ttl: float = 0, result_ttl: float = 0, redis_url: str = None):
+        """
+        Args:
+             ttl: seconds after queueing during which identical requests are attached to the task, 0 disables
+                the coalescing
+             result_ttl: seconds after a task finished during which identical requests get its result, 0 disables
+                the result cache
+             redis_url: url of the Redis server storing the task ids of the requests
+        """
+        self.ttl = ttl
+        self.result_ttl = result_ttl
+        self.redis = None
+        if self.enabled:
+            self.redis = redis.Redis.from_url(redis_url)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def request_key(identifier: str, task: str, prediction_request: dict, model_config: dict) -> str:
+        """
+        Hashes everything that determines the result of a request: the model and its configuration, the task,
+        the input and the kwargs
+        """
+        payload = json.dumps([identifier, task, prediction_request, model_config], sort_keys=True, default=str)
+        return f"coalesce:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+    def _is_reusable(self, task_id: str) -> bool:
+        task = AsyncResult(task_id)
+        if not task.ready():
+            return True
+        if self.result_ttl <= 0 or not task.successful():
+            return False
+        date_done = task.date_done
+        if date_done is None:
+            return False
+        if date_done.tzinfo is None:
+            date_done = date_done.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - date_done).total_seconds() <= self.result_ttl
+
+    def submit(self, key: str, enqueue: Callable[[str], None]) -> Tuple[str, bool]:
+        """
+        Returns the id of the task for the request with the given key. Unless an identical request is queued
+        (or finished within the result ttl), the request is enqueued as new task.
+        Args:
+             key: the key of the request from request_key
+             enqueue: function queueing the request with the given task id
+        Returns:
+            the task id and whether the request was attached to an existing task
+        """
+        task_id = str(uuid.uuid4())
+        expire = math.ceil(self.ttl + self.result_ttl)
+        try:
+            if not self.redis.set(key, task_id, nx=True, ex=expire):
+                existing = self.redis.get(key)
+                if existing is not None and self._is_reusable(existing.decode()):
+                    return existing.decode(), True
+                self.redis.set(key, task_id, ex=expire)
+        except redis.RedisError:
+            logger.exception("Request coalescing failed, queueing the request")
+            enqueue(task_id)
+            return task_id, False
+
+        try:
+            enqueue(task_id)
+        except Exception:
+            # identical requests must not wait for a task that was never queued
+            try:
+                self.redis.delete(key)
+            except redis.RedisError:
+                pass
+            raise
+        return task_id, False
+
+
+_coalescer = None
+
+
+def get_request_coalescer() -> RequestCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        from model_inference.tasks.celery import app as celery_app
+
+        _coalescer = RequestCoalescer(
+            ttl=float(os.getenv("REQUEST_COALESCING_TTL", 0)),
+            result_ttl=float(os.getenv("RESULT_CACHE_TTL", 0)),
+            redis_url=os.getenv("REQUEST_COALESCING_REDIS_URL") or celery_app.conf.result_backend,
+        )
+    return _coalescer
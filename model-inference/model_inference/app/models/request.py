@@ -83,7 +83,9 @@ class PredictionRequest(BaseModel):
         "- 'method': explanation method such as 'simple_grads, integrated_grads,"
         "smooth_grads, attention or scaled_attention':<br>"
         "- 'top_k': number of word attributions to return:<br>"
-        "- 'mode: One of 'question', 'context', 'all'. Returns respective attributions. ",
+        "- 'mode: One of 'question', 'context', 'all'. Returns respective attributions. <br>"
+        "- 'steps': number of interpolation steps of integrated_grads, default 10 <br>"
+        "- 'num_samples': number of noise samples of smooth_grads, default 10 ",
     )
     attack_kwargs: dict = Field(
         default={},
@@ -98,3 +100,9 @@ class PredictionRequest(BaseModel):
         description="Only necessary for Adapter. "
                     "The fully specified name of the to-be-used adapter from adapterhub.ml",
     )
+    binary_outputs: bool = Field(
+        default=False,
+        description="Return the arrays in 'model_outputs' as raw .npy bytes. Only has an effect if the model "
+        "stores its results with msgpack (RESULT_SERIALIZER=msgpack) and the task result is requested with the "
+        "header 'Accept: application/msgpack', otherwise the arrays are base64-encoded.",
+    )
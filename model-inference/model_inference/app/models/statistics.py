@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic import BaseModel
 
@@ -19,7 +19,22 @@ class ModelStatistics(BaseModel):
     model_path: Optional[str] = None
     decoder_path: Optional[str] = None
     onnx_use_quantized: Optional[bool] = None
+    cpu_optimization: Optional[str] = None  # 'none', 'int8' or 'bf16' for Transformer and Adapter models
+    # max_abs_diff, mean_cosine_similarity and argmax_agreement of the CPU optimized model against the fp32 model
+    cpu_optimization_report: Optional[Dict] = None
     is_encoder_decoder: Optional[bool] = None
+    onnx_intra_op_num_threads: Optional[int] = None  # ONNX Runtime session options
+    onnx_inter_op_num_threads: Optional[int] = None
+    onnx_execution_mode: Optional[str] = None
+    onnx_enable_cpu_mem_arena: Optional[bool] = None
+    onnx_execution_providers: Optional[str] = None
+    onnx_optimized_model_path: Optional[str] = None
+    micro_batch_window_ms: Optional[int] = None  # time window for collecting requests into micro-batches
+    micro_batch_max_requests: Optional[int] = None
+    embedding_cache_size: Optional[int] = None  # maximum number of cached embeddings per worker process
+    embedding_cache: Optional[Dict] = None  # hits, misses, hit_rate, size and evictions of the embedding cache
+    attribution_cache_size: Optional[int] = None  # maximum number of cached word attributions per worker process
+    attribution_cache: Optional[Dict] = None  # hits, misses, hit_rate, size and evictions of the attribution cache
 
 
 class UpdateModel(BaseModel):
@@ -30,3 +45,9 @@ class UpdateModel(BaseModel):
     batch_size: Optional[int] = None
     max_input: Optional[int] = None
     return_plaintext_arrays: Optional[bool] = None
+    onnx_intra_op_num_threads: Optional[int] = None
+    onnx_inter_op_num_threads: Optional[int] = None
+    onnx_execution_mode: Optional[str] = None
+    onnx_enable_cpu_mem_arena: Optional[bool] = None
+    onnx_execution_providers: Optional[str] = None
+    onnx_optimized_model_path: Optional[str] = None
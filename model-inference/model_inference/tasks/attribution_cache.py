@@ -0,0 +1,135 @@
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from .config.model_config import IDENTIFIER, model_config
+from .embedding_cache import STATISTICS_WRITE_INTERVAL, save_statistics
+from .embedding_cache import load_statistics as load_cache_statistics
+from .models.request import PredictionRequest
+
+
+# Parameters of the explanation methods that change the attributions
+METHOD_KWARGS = {"integrated_grads": ("steps",), "smooth_grads": ("num_samples",)}
+
+
+def _to_json(value):
+    if torch.is_tensor(value):
+        return value.tolist()
+    return value
+
+
+class AttributionCache:
+    """
+    In-process LRU cache for the raw word attributions of explain and attack requests. Switching the visualization
+    (e.g. top_k or mode) or attacking an explained input reuses the attributions instead of recomputing the
+    gradients. The token gradients are stored with the attributions because hotflip needs them.
+    """
+
+    def __init__(self, max_size: int = 0, identifier: str = IDENTIFIER):
+        """
+        Args:
+             max_size: the maximum number of cached requests, 0 disables the cache
+             identifier: the identifier of the model under which the statistics are stored
+        """
+        self.max_size = max_size
+        self.identifier = identifier
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_write = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def key(self, request: PredictionRequest, method: str, **kwargs) -> str:
+        """
+        Computes the cache key of the attributions. The key covers everything that changes the attributions:
+        model, adapter, preprocessing, model kwargs, input, explanation method and its parameters and the
+        targets of the gradients (labels or answer span), but not top_k and mode which are applied afterwards.
+        """
+        method_kwargs = request.explain_kwargs or request.attack_kwargs or {}
+        content = json.dumps(
+            [
+                model_config.model_name,
+                request.adapter_name,
+                request.preprocessing_kwargs,
+                request.model_kwargs,
+                request.input,
+                method,
+                {name: method_kwargs.get(name) for name in METHOD_KWARGS.get(method, ())},
+                {name: _to_json(value) for name, value in kwargs.items()},
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return "attribution:" + hashlib.sha1(content.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[List, Optional[List[torch.Tensor]]]]:
+        """
+        Returns:
+             a copy of the cached attributions and the cached token gradients or None if the key is not cached
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        self.write_statistics()
+        attributions, gradients = entry
+        return copy.deepcopy(attributions), gradients
+
+    def put(self, key: str, attributions: List, gradients: Optional[List[torch.Tensor]]):
+        """
+        Args:
+             key: the key from key()
+             attributions: the attributions of each input
+             gradients: the token gradients of the input embeddings, they are kept on the CPU
+        """
+        if gradients is not None:
+            gradients = [gradient.detach().cpu() for gradient in gradients]
+        self.entries[key] = (copy.deepcopy(attributions), gradients)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.write_statistics()
+
+    def statistics(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
+
+    def write_statistics(self, force: bool = False):
+        """
+        Stores the statistics of this worker process next to the model config, so that the API can serve them
+        """
+        if not force and time.monotonic() - self._last_write < STATISTICS_WRITE_INTERVAL:
+            return
+        self._last_write = time.monotonic()
+        save_statistics(self.identifier, "attribution_cache", self.statistics())
+
+
+def load_statistics(identifier: str) -> Optional[Dict]:
+    """
+    Aggregates the attribution cache statistics of all worker processes of the model
+    Args:
+         identifier: the identifier of the model
+    Returns:
+         the summed statistics and the hit rate or None if no worker reported statistics
+    """
+    return load_cache_statistics(identifier, "attribution_cache")
+
+
+attribution_cache = AttributionCache(max_size=model_config.attribution_cache_size)
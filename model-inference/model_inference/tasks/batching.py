@@ -0,0 +1,179 @@
+import copy
+import json
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .model_pool import model_key
+from .models.prediction import _decode_numpy, _encode_numpy
+from .models.request import Task
+
+
+logger = logging.getLogger(__name__)
+
+# Tasks whose inputs are processed independently of each other, so that the inputs of several requests can be
+# concatenated into one forward pass. Sequence classification is excluded because multiple choice heads score all
+# inputs of a request jointly.
+BATCHABLE_TASKS = [Task.embedding, Task.question_answering, Task.token_classification]
+
+# Fields of the prediction output that contain one entry per input
+PER_INPUT_FIELDS = ["labels", "answers", "word_ids", "generated_texts"]
+
+# Model outputs with one entry per token of each input. Token embeddings are added for embedding_mode 'token'
+TOKEN_LEVEL_OUTPUTS = ["logits", "start_logits", "end_logits", "last_hidden_state"]
+
+# Fields of the prediction output that contain one list per input with one entry per token. The labels are only
+# token-level for token classification
+TOKEN_LEVEL_FIELDS = ["labels", "word_ids"]
+
+
+def batch_key(prediction_request: Dict, task: str) -> Optional[str]:
+    """
+    Computes the key under which a request can be merged with other requests into one micro-batch.
+    Requests can only be merged if they share the task, the adapter and all kwargs.
+    Args:
+        prediction_request: the prediction request as dictionary
+        task: the task that should be performed on the request
+    Returns:
+        the key of the request or None if the request has to be processed on its own
+    """
+    if task not in BATCHABLE_TASKS:
+        return None
+    if not isinstance(prediction_request["input"], list) or prediction_request.get("is_preprocessed", False):
+        return None
+    if prediction_request.get("explain_kwargs") or prediction_request.get("attack_kwargs"):
+        return None
+    model_kwargs = prediction_request.get("model_kwargs", {})
+    # tuple outputs (e.g. attentions) are not split between the requests
+    if model_kwargs.get("output_attentions") or model_kwargs.get("output_hidden_states"):
+        return None
+    return json.dumps(
+        [
+            task,
+            prediction_request.get("adapter_name"),
+            prediction_request.get("preprocessing_kwargs", {}),
+            model_kwargs,
+            prediction_request.get("task_kwargs", {}),
+            prediction_request.get("binary_outputs", False),
+        ],
+        sort_keys=True,
+    )
+
+
+def group_requests(requests: List, max_input_size: int) -> List[List]:
+    """
+    Groups the buffered task requests into micro-batches of compatible requests.
+    The number of inputs of a micro-batch does not exceed max_input_size.
+    Requests that cannot be merged with others form a group on their own.
+    Args:
+        requests: the buffered task requests, the args of each request are (prediction_request, task, model_config)
+        max_input_size: the maximum number of inputs in a micro-batch
+    Returns:
+        list of groups of requests in order of their arrival
+    """
+    groups = []
+    open_groups = {}
+    for request in requests:
+        prediction_request, task = request.args[0], request.args[1]
+        key = batch_key(prediction_request, task)
+        if key is None:
+            groups.append([request])
+            continue
+        # workers hosting several models only merge requests for the same model
+        key = model_key(request.args[2]) + key
+
+        size = len(prediction_request["input"])
+        group = open_groups.get(key)
+        if group is None or group["size"] + size > max_input_size:
+            group = {"requests": [], "size": 0}
+            open_groups[key] = group
+            groups.append(group["requests"])
+        group["requests"].append(request)
+        group["size"] += size
+    return groups
+
+
+def merge_requests(prediction_requests: List[Dict]) -> Dict:
+    """
+    Merges compatible prediction requests into one request containing the inputs of all requests
+    """
+    merged = copy.deepcopy(prediction_requests[0])
+    merged["input"] = [model_input for request in prediction_requests for model_input in request["input"]]
+    return merged
+
+
+def _trim_tokens(value, length: int, padding_side: str):
+    """
+    Removes the padding of the inputs beyond the given token length from an array or nested list of tokens
+    """
+    if isinstance(value, np.ndarray):
+        return value[:, value.shape[1] - length :] if padding_side == "left" else value[:, :length]
+    return [tokens[len(tokens) - length :] if padding_side == "left" else tokens[:length] for tokens in value]
+
+
+def _slice_model_output(value, start: int, end: int, is_encoded: bool, length: int = None, padding_side="right"):
+    """
+    Slices the inputs from start to end from one of the (encoded) model outputs.
+    If a token length is given, the padding beyond it is removed as well.
+    """
+    if is_encoded and isinstance(value, list):
+        # tuple of tensors, e.g. attentions
+        return [_slice_model_output(v, start, end, is_encoded, length, padding_side) for v in value]
+    if is_encoded:
+        array = _decode_numpy(value)[start:end]
+        if length is not None:
+            array = _trim_tokens(array, length, padding_side)
+        if isinstance(value, bytes):
+            return _encode_numpy({"value": array}, return_binary=True)["value"]
+        return _encode_numpy({"value": array}, return_plaintext=False)["value"]
+    if length is not None:
+        return _trim_tokens(value[start:end], length, padding_side)
+    return value[start:end]
+
+
+def _is_token_level(prediction: Dict, key: str) -> bool:
+    if key == "embeddings":
+        return prediction.get("embedding_mode") == "token"
+    return key in TOKEN_LEVEL_OUTPUTS
+
+
+def split_prediction(
+    prediction: Dict, sizes: List[int], token_lengths: Optional[List[int]] = None, padding_side: str = "right"
+) -> List[Dict]:
+    """
+    Splits the prediction of a merged request back into the predictions of the single requests.
+    Args:
+        prediction: the serialized prediction output of the merged request
+        sizes: the number of inputs of each of the merged requests
+        token_lengths: the token length of each input of the merged request. Token-level outputs of each request
+            are cut to the longest of its inputs. Without token lengths, they keep the padding of the micro-batch
+        padding_side: the padding side of the tokenizer
+    Returns:
+        the prediction of each of the requests
+    """
+    total = sum(sizes)
+    if token_lengths is not None and len(token_lengths) != total:
+        token_lengths = None
+    is_encoded = prediction.get("model_output_is_encoded", False)
+    predictions = []
+    start = 0
+    for size in sizes:
+        end = start + size
+        length = max(token_lengths[start:end]) if token_lengths is not None and size > 0 else None
+        split = dict(prediction)
+        split["model_outputs"] = {
+            k: _slice_model_output(
+                v, start, end, is_encoded, length if _is_token_level(prediction, k) else None, padding_side
+            )
+            for k, v in prediction["model_outputs"].items()
+        }
+        for field in PER_INPUT_FIELDS:
+            if isinstance(prediction.get(field), list) and len(prediction[field]) == total:
+                split[field] = prediction[field][start:end]
+        for field in TOKEN_LEVEL_FIELDS:
+            if length is not None and split.get(field) and all(isinstance(tokens, list) for tokens in split[field]):
+                split[field] = _trim_tokens(split[field], length, padding_side)
+        predictions.append(split)
+        start = end
+    return predictions
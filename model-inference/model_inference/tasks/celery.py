@@ -1,7 +1,9 @@
 import logging
 import os
 
+import msgpack
 from celery import Celery
+from kombu.serialization import register
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +24,26 @@ app = Celery(
     include=["model_inference.tasks.tasks"],
 )
 
+
+def _msgpack_dumps(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes):
+    # kombu's msgpack decoder only allows str and bytes map keys, but outputs like id2label have int keys
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# Replaces the msgpack serializer of kombu (same name and content type) in the API and the workers
+register("msgpack", _msgpack_dumps, _msgpack_loads, content_type="application/x-msgpack", content_encoding="binary")
+
+# Results are serialized with JSON unless RESULT_SERIALIZER=msgpack. Only msgpack stores binary model outputs
+# (see PredictionRequest.binary_outputs) as raw bytes, with JSON they are returned as base64 strings. Both are
+# accepted, so that results of workers with either configuration can be read, e.g. during a rolling deployment.
+app.conf.result_serializer = os.getenv("RESULT_SERIALIZER", "json")
+app.conf.accept_content = ["json", "msgpack"]
+app.conf.result_accept_content = ["json", "msgpack"]
+
 # app.conf.task_routes = {
 #     'tasks.add': {'queue': 'dpr'},
 #     'tasks.predict': {'queue': 'dpr'}
@@ -53,12 +53,52 @@ class ModelConfig(Mapping):
     # the base64 string back to the numpy array
     return_plaintext_arrays: bool = False
 
+    # On-load optimization of Transformer and Adapter models served on the CPU: 'none', 'int8' (dynamic int8
+    # quantization of the linear layers) or 'bf16' (bf16 autocast). Optimized models run in torch.inference_mode and
+    # do not support explanations and attacks
+    cpu_optimization: str = "none"
+
     # Flag that decides if quantized ONNX model should be used for inference
     onnx_use_quantized: bool = False
 
     # Flag that decides if ONNX model is encoder-decoder model
     is_encoder_decoder: bool = False
 
+    # ONNX Runtime session options. 0 threads lets ONNX Runtime decide (one thread per physical core)
+    onnx_intra_op_num_threads: int = 0
+    onnx_inter_op_num_threads: int = 0
+    # 'sequential' or 'parallel' execution of the graph nodes (the inter-op threads are only used for 'parallel')
+    onnx_execution_mode: str = "sequential"
+    onnx_enable_cpu_mem_arena: bool = True
+    # Comma-separated ONNX Runtime execution providers, e.g. 'CUDAExecutionProvider,CPUExecutionProvider'.
+    # If not set, CUDA is used if available and not disabled, otherwise the CPU
+    onnx_execution_providers: str = None
+    # Directory in which the optimized ONNX graphs are stored, so that restarted workers skip the graph optimization
+    onnx_optimized_model_path: str = None
+
+    # Time window in milliseconds in which the worker collects queued requests and merges compatible ones
+    # into a single forward pass (micro-batching). 0 disables micro-batching
+    micro_batch_window_ms: int = 0
+    # Maximum number of queued requests that are collected into one micro-batch
+    micro_batch_max_requests: int = 16
+
+    # Maximum number of input embeddings kept in the in-process LRU cache of each worker process. 0 disables the
+    # cache. Requests served by the cache only return the 'embeddings' and not the other model outputs
+    embedding_cache_size: int = 0
+    # Optional Redis url (e.g. redis://redis:6379/1) of a cache tier shared by all workers of the model
+    embedding_cache_redis_url: str = None
+    # Seconds until the embeddings expire in Redis. 0 keeps them
+    embedding_cache_ttl: int = 86400
+
+    # Maximum number of explained inputs whose word attributions are kept in the in-process LRU cache of each
+    # worker process, so that explain and attack requests with another top_k or mode reuse them. 0 disables the cache
+    attribution_cache_size: int = 100
+
+    # Memory budget in MB for hosting several models in one worker process. The worker serves the models of all
+    # queues it consumes, loads them on their first request and evicts the least recently used models if the budget
+    # is exceeded. 0 serves only the configured model
+    model_memory_budget_mb: int = 0
+
     def __getitem__(self, key):
         return self.__dict__[key]
 
@@ -87,8 +127,27 @@ class ModelConfig(Mapping):
             transformers_cache=self.transformers_cache,
             is_encoder_decoder=self.is_encoder_decoder,
             onnx_use_quantized=self.onnx_use_quantized,
+            cpu_optimization=self.cpu_optimization,
+            onnx_intra_op_num_threads=self.onnx_intra_op_num_threads,
+            onnx_inter_op_num_threads=self.onnx_inter_op_num_threads,
+            onnx_execution_mode=self.onnx_execution_mode,
+            onnx_enable_cpu_mem_arena=self.onnx_enable_cpu_mem_arena,
+            onnx_execution_providers=self.onnx_execution_providers,
+            onnx_optimized_model_path=self.onnx_optimized_model_path,
+            micro_batch_window_ms=self.micro_batch_window_ms,
+            micro_batch_max_requests=self.micro_batch_max_requests,
+            embedding_cache_size=self.embedding_cache_size,
+            attribution_cache_size=self.attribution_cache_size,
         )
 
+    def update_from_dict(self, config: Mapping):
+        """
+        Sets the fields given in config, e.g. the model config sent with a task
+        """
+        for field in self.__dataclass_fields__:
+            if field in config:
+                setattr(self, field, config[field])
+
     def update(self, identifier: str=IDENTIFIER):
         with open(f"{CONFIG_PATH}/{identifier}.json", "r") as f:
             config = json.load(f)
@@ -106,6 +165,19 @@ class ModelConfig(Mapping):
         self.transformers_cache = config["transformers_cache"]
         self.model_class = config["model_class"]
         self.return_plaintext_arrays = config["return_plaintext_arrays"]
+        self.cpu_optimization = config.get("cpu_optimization", "none")
+        self.onnx_intra_op_num_threads = config.get("onnx_intra_op_num_threads", 0)
+        self.onnx_inter_op_num_threads = config.get("onnx_inter_op_num_threads", 0)
+        self.onnx_execution_mode = config.get("onnx_execution_mode", "sequential")
+        self.onnx_enable_cpu_mem_arena = config.get("onnx_enable_cpu_mem_arena", True)
+        self.onnx_execution_providers = config.get("onnx_execution_providers")
+        self.onnx_optimized_model_path = config.get("onnx_optimized_model_path")
+        self.micro_batch_window_ms = config.get("micro_batch_window_ms", 0)
+        self.micro_batch_max_requests = config.get("micro_batch_max_requests", 16)
+        self.embedding_cache_size = config.get("embedding_cache_size", 0)
+        self.embedding_cache_redis_url = config.get("embedding_cache_redis_url")
+        self.embedding_cache_ttl = config.get("embedding_cache_ttl", 86400)
+        self.attribution_cache_size = config.get("attribution_cache_size", 100)
 
     @staticmethod
     def load(path=".env"):  # change .env filename to work on local
@@ -125,6 +197,20 @@ class ModelConfig(Mapping):
             model_class=config("MODEL_CLASS", default="base"),
             return_plaintext_arrays=config("RETURN_PLAINTEXT_ARRAYS", cast=bool, default=False),
             onnx_use_quantized=config("ONNX_USE_QUANTIZED", cast=bool, default=False),
+            cpu_optimization=config("CPU_OPTIMIZATION", default="none"),
+            onnx_intra_op_num_threads=config("ONNX_INTRA_OP_NUM_THREADS", cast=int, default=0),
+            onnx_inter_op_num_threads=config("ONNX_INTER_OP_NUM_THREADS", cast=int, default=0),
+            onnx_execution_mode=config("ONNX_EXECUTION_MODE", default="sequential"),
+            onnx_enable_cpu_mem_arena=config("ONNX_ENABLE_CPU_MEM_ARENA", cast=bool, default=True),
+            onnx_execution_providers=config("ONNX_EXECUTION_PROVIDERS", default=None),
+            onnx_optimized_model_path=config("ONNX_OPTIMIZED_MODEL_PATH", default=None),
+            micro_batch_window_ms=config("MICRO_BATCH_WINDOW_MS", cast=int, default=0),
+            micro_batch_max_requests=config("MICRO_BATCH_MAX_REQUESTS", cast=int, default=16),
+            embedding_cache_size=config("EMBEDDING_CACHE_SIZE", cast=int, default=0),
+            embedding_cache_redis_url=config("EMBEDDING_CACHE_REDIS_URL", default=None),
+            embedding_cache_ttl=config("EMBEDDING_CACHE_TTL", cast=int, default=86400),
+            attribution_cache_size=config("ATTRIBUTION_CACHE_SIZE", cast=int, default=100),
+            model_memory_budget_mb=config("MODEL_MEMORY_BUDGET_MB", cast=int, default=0),
         )
         model_config.save(IDENTIFIER)
         return model_config
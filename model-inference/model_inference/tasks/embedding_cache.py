@@ -0,0 +1,286 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .config.model_config import CONFIG_PATH, IDENTIFIER, model_config
+from .models.request import PredictionRequest
+
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of seconds between two writes of the cache statistics of a worker process
+STATISTICS_WRITE_INTERVAL = 1.0
+
+
+def _statistics_file(identifier: str, cache: str, index) -> str:
+    return f"{CONFIG_PATH}/{identifier.replace('/', '-')}.{cache}.{index}.json"
+
+
+def _process_index() -> int:
+    """
+    Index of the celery pool process. Restarted pool processes reuse the index, so that the statistics files of
+    terminated processes are overwritten.
+    """
+    try:
+        from billiard.process import current_process
+
+        return current_process().index or 0
+    except (ImportError, AttributeError):
+        return 0
+
+
+def _normalize_input(model_input):
+    """
+    Normalizes the whitespace of an input text (or of each text of an input pair)
+    """
+    if isinstance(model_input, str):
+        return " ".join(model_input.split())
+    return [_normalize_input(text) for text in model_input]
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache for the embeddings of single inputs. The embeddings are kept in an in-process LRU
+    cache and optionally in Redis, which is shared between the worker processes and survives restarts.
+    """
+
+    def __init__(self, max_size: int = 0, redis_url: str = None, ttl: int = None, identifier: str = IDENTIFIER):
+        """
+        Args:
+             max_size: the maximum number of embeddings in the in-process cache, 0 disables the cache
+             redis_url: optional url of the Redis server used as second cache tier
+             ttl: seconds until embeddings expire in Redis, 0 or None keeps them
+             identifier: the identifier of the model under which the statistics are stored
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.identifier = identifier
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_write = 0.0
+        self.redis = None
+        if self.enabled and redis_url:
+            import redis
+
+            self.redis = redis.Redis.from_url(redis_url)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def key(self, request: PredictionRequest, embedding_mode: Optional[str], model_input) -> str:
+        """
+        Computes the cache key of a single input of the request. The key covers everything that changes the
+        embedding: model, adapter, embedding mode, normalization, preprocessing and the normalized input.
+        """
+        content = json.dumps(
+            [
+                model_config.model_name,
+                request.adapter_name,
+                request.model_kwargs.get("average_adapters", False),
+                embedding_mode,
+                request.task_kwargs.get("normalize", False),
+                request.preprocessing_kwargs,
+                _normalize_input(model_input),
+            ],
+            sort_keys=True,
+        )
+        return "embedding:" + hashlib.sha1(content.encode()).hexdigest()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        values = [self.entries.get(key) for key in keys]
+        for key, value in zip(keys, values):
+            if value is not None:
+                self.entries.move_to_end(key)
+
+        missing = [i for i, value in enumerate(values) if value is None]
+        if self.redis is not None and missing:
+            try:
+                stored = self.redis.mget([keys[i] for i in missing])
+            except Exception:
+                logger.exception("Reading embeddings from Redis failed")
+                stored = [None] * len(missing)
+            for i, value in zip(missing, stored):
+                if value is not None:
+                    values[i] = np.load(BytesIO(value))
+                    self._put(keys[i], values[i])
+
+        hits = sum(value is not None for value in values)
+        self.hits += hits
+        self.misses += len(values) - hits
+        return values
+
+    def put_many(self, keys: List[str], values: List[np.ndarray]):
+        for key, value in zip(keys, values):
+            # the values are usually rows of the batch array, a view would keep the whole batch in memory
+            self._put(key, value.copy())
+        if self.redis is not None:
+            try:
+                pipeline = self.redis.pipeline()
+                for key, value in zip(keys, values):
+                    with BytesIO() as b:
+                        np.save(b, value)
+                        pipeline.set(key, b.getvalue(), ex=self.ttl or None)
+                pipeline.execute()
+            except Exception:
+                logger.exception("Writing embeddings to Redis failed")
+
+    def _put(self, key: str, value: np.ndarray):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def embed(
+        self, request: PredictionRequest, embedding_mode: Optional[str], compute: Callable[[List], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Returns the embeddings of all inputs of the request. Only the inputs that are not cached are embedded.
+        Args:
+             request: the prediction request
+             embedding_mode: the pooling of the embeddings
+             compute: function computing the embeddings of a list of inputs as one array
+        Returns:
+             the embeddings of the inputs stacked into one array
+        """
+        keys = [self.key(request, embedding_mode, model_input) for model_input in request.input]
+        embeddings = self.get_many(keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = compute([request.input[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+            self.put_many([keys[i] for i in missing], list(computed))
+        self.write_statistics()
+        return np.stack(embeddings)
+
+    def statistics(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+            "max_size": self.max_size,
+        }
+
+    def write_statistics(self, force: bool = False):
+        """
+        Stores the statistics of this worker process next to the model config, so that the API can serve them
+        """
+        if not force and time.monotonic() - self._last_write < STATISTICS_WRITE_INTERVAL:
+            return
+        self._last_write = time.monotonic()
+        save_statistics(self.identifier, "embedding_cache", self.statistics())
+
+
+def save_statistics(identifier: str, cache: str, statistics: Dict):
+    """
+    Stores the cache statistics of this worker process next to the model config
+    Args:
+         identifier: the identifier of the model
+         cache: the name of the cache, e.g. 'embedding_cache'
+         statistics: the statistics of the cache
+    """
+    if CONFIG_PATH is None or identifier is None:
+        return
+    path = _statistics_file(identifier, cache, _process_index())
+    try:
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(statistics, f)
+        os.replace(f"{path}.tmp", path)
+    except OSError:
+        logger.exception(f"Writing the {cache} statistics failed")
+
+
+def load_statistics(identifier: str, cache: str = "embedding_cache") -> Optional[Dict]:
+    """
+    Aggregates the cache statistics of all worker processes of the model
+    Args:
+         identifier: the identifier of the model
+         cache: the name of the cache, e.g. 'embedding_cache'
+    Returns:
+         the summed statistics and the hit rate or None if no worker reported statistics
+    """
+    files = glob.glob(_statistics_file(identifier, cache, "*"))
+    if not files:
+        return None
+    statistics = {"hits": 0, "misses": 0, "evictions": 0, "size": 0, "max_size": 0}
+    for file in files:
+        try:
+            with open(file, "r") as f:
+                process_statistics = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for k in statistics:
+            statistics[k] += process_statistics.get(k, 0)
+    lookups = statistics["hits"] + statistics["misses"]
+    statistics["hit_rate"] = statistics["hits"] / lookups if lookups else 0.0
+    return statistics
+
+
+def load_latest_statistics(identifier: str, name: str) -> Optional[Dict]:
+    """
+    Returns the statistics that a worker process of the model wrote last, for reports that are not summed up over
+    the worker processes
+    Args:
+         identifier: the identifier of the model
+         name: the name of the report, e.g. 'accuracy_report'
+    Returns:
+         the statistics or None if no worker reported them
+    """
+    files = []
+    for file in glob.glob(_statistics_file(identifier, name, "*")):
+        try:
+            files.append((os.path.getmtime(file), file))
+        except OSError:
+            continue
+    for _, file in sorted(files, reverse=True):
+        try:
+            with open(file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+# Embedding caches of the models served by this worker process by model identifier
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+# Identifier of the model that serves the current request
+_identifier = IDENTIFIER
+
+
+def use_embedding_cache(identifier: str):
+    """
+    Selects the embedding cache of the model that serves the next requests. Workers hosting several models
+    (model_memory_budget_mb > 0) select the cache of the requested model for every task.
+    Args:
+         identifier: the identifier of the model
+    """
+    global _identifier
+    _identifier = identifier
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the embedding cache of the selected model. The cache is created on the first request of the model with
+    the cache settings of the model config that is applied for the request.
+    """
+    if _identifier not in _embedding_caches:
+        _embedding_caches[_identifier] = EmbeddingCache(
+            max_size=model_config.embedding_cache_size,
+            redis_url=model_config.embedding_cache_redis_url,
+            ttl=model_config.embedding_cache_ttl,
+            identifier=_identifier,
+        )
+    return _embedding_caches[_identifier]
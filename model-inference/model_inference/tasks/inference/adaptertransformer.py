@@ -37,6 +37,9 @@ class AdapterTransformer(Transformer):
         self._load_model(AutoAdapterModel, model_config.model_name, model_config.disable_gpu)
         if model_config.preloaded_adapters:
             self._load_adapter(model_config.model_name, model_config.transformers_cache)
+        # quantize the base model together with the preloaded adapters and heads. Adapters loaded later for a
+        # request keep their fp32 weights
+        self._optimize_for_cpu(self.model.device.type)
         self.model_name = model_config.model_name
 
     def _load_adapter(self, model_name, transformers_cache):
@@ -214,6 +217,7 @@ class AdapterTransformer(Transformer):
             raise ValueError("is_preprocessed=True is not supported for this model. Please use text as input.")
         if len(request.input) > model_config.max_input_size:
             raise ValueError(f"Input is too large. Max input size is {model_config.max_input_size}")
+        self._check_cpu_optimization(request)
         self._prepare_adapter(request.adapter_name, request.model_kwargs)
 
         self.task = task
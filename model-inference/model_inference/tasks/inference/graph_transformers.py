@@ -1,4 +1,3 @@
-import itertools
 import json
 import logging
 import operator
@@ -9,7 +8,6 @@ import networkx as nx
 import numpy as np
 import spacy
 import torch
-from spacy.matcher import Matcher
 from model_inference.tasks.config.model_config import model_config
 from model_inference.tasks.inference.model import Model
 from model_inference.tasks.models.prediction import (
@@ -28,6 +26,7 @@ from transformers import (
 
 from .utils.modelling import qagnn, roberta
 from .utils.preprocess import graph, grounding, statement
+from .utils.preprocess.cpnet import ConceptNetCSR
 
 
 os.environ["TOKENIZERS_PARALLELISM"] = "true"
@@ -44,14 +43,16 @@ logger = logging.getLogger(__name__)
 
 CPNET_VOCAB = "/concept.txt"
 CPNET_PATH = "/conceptnet.en.pruned.graph"
+# converted from CPNET_PATH with python -m model_inference.tasks.inference.utils.preprocess.cpnet
+CPNET_CSR_PATH = "/conceptnet.en.pruned.csr"
 PATTERN_PATH = "/matcher_patterns.json"
+# compiled from PATTERN_PATH with python -m model_inference.tasks.inference.utils.preprocess.grounding
+MATCHER_PATH = "/matcher.pkl"
 ENTITIES_PATH = "/tzw.ent.npy"
 
 LM_MODEL = "roberta-base"
 MAX_NODE_NUM = 200
 
-NUM_PROCESSES = os.getenv("NUM_PROCESSES", 16)
-
 nlp = None
 matcher = None
 
@@ -94,7 +95,7 @@ class GraphTransformers(Model):
         self.nlp, self.matcher = self._load_matcher()
         # load DS
         self._load_resources(self.data_path + CPNET_VOCAB)
-        self._load_cpnet(self.data_path + CPNET_PATH)
+        self._load_cpnet(self.data_path + CPNET_CSR_PATH)
         # load lm model on init
         self._load_lm()
         self._load_qagnn()
@@ -102,16 +103,16 @@ class GraphTransformers(Model):
 
     def _load_matcher(self):
         """
-        Loads the spacy matcher with the selected
-        matching patterns
+        Loads the spacy pipeline and the compiled concept matcher. If the matcher has
+        not been compiled yet, it is built from the matching patterns.
         """
         nlp = spacy.load("en_core_web_sm", disable=["ner", "parser", "textcat"])
         nlp.add_pipe("sentencizer")
-        with open(self.data_path + PATTERN_PATH, "r", encoding="utf8") as fin:
-            all_patterns = json.load(fin)
-        matcher = Matcher(nlp.vocab)
-        for concept, pattern in all_patterns.items():
-            matcher.add(concept, [pattern])
+        if os.path.isfile(self.data_path + MATCHER_PATH):
+            matcher = grounding.ConceptMatcher.load(self.data_path + MATCHER_PATH)
+        else:
+            with open(self.data_path + PATTERN_PATH, "r", encoding="utf8") as fin:
+                matcher = grounding.ConceptMatcher.from_patterns(json.load(fin))
         logger.info("loaded matcher...")
         return nlp, matcher
 
@@ -124,20 +125,17 @@ class GraphTransformers(Model):
             id2concept = [w.strip() for w in fin]
         concept2id = {w: i for i, w in enumerate(id2concept)}
 
-    def _load_cpnet(self, cpnet_graph_path):
+    def _load_cpnet(self, cpnet_csr_path):
         """
-        Loads the conceptnet
+        Memory-maps the conceptnet CSR store. If it has not been converted yet, the
+        networkx graph is converted on startup.
         """
-        global cpnet, cpnet_simple
-        cpnet = nx.read_gpickle(cpnet_graph_path)  # Multigraph class
-        cpnet_simple = nx.Graph()  # Graph class
-        for u, v, data in cpnet.edges(data=True):
-            w = data["weight"] if "weight" in data else 1.0
-            if cpnet_simple.has_edge(u, v):
-                cpnet_simple[u][v]["weight"] += w
-            else:
-                cpnet_simple.add_edge(u, v, weight=w)
-        # print(cpnet_simple.nodes)
+        global cpnet
+        if os.path.isdir(cpnet_csr_path):
+            cpnet = ConceptNetCSR.load(cpnet_csr_path)
+        else:
+            logger.warning(f"{cpnet_csr_path} not found, converting {self.data_path + CPNET_PATH} on startup")
+            cpnet = ConceptNetCSR.from_networkx(nx.read_gpickle(self.data_path + CPNET_PATH))
         logger.info("loaded conceptnet...")
 
     def _load_lm(self):
@@ -199,14 +197,13 @@ class GraphTransformers(Model):
         Returns:
              the features for the model
         """
-        global id2concept, concept2id, cpnet, cpnet_simple
+        global id2concept, concept2id, cpnet
         statements = statement.convert_to_entailment(input=input)
         grounded = grounding.ground(
             statements,
             cpnet_vocab=id2concept,
             _nlp=self.nlp,
             _matcher=self.matcher,
-            num_processes=NUM_PROCESSES,
         )
         graph_adj = graph.generate_adj_data_from_grounded_concepts__use_LM(
             statements,
@@ -214,10 +211,8 @@ class GraphTransformers(Model):
             concept2id=concept2id,
             _cpnet_vocab=id2concept,
             _cpnet=cpnet,
-            _cpnet_simple=cpnet_simple,
             model=self.lm_model,
             tokenizer=self.tokenizer,
-            num_processes=NUM_PROCESSES,
         )
         return statements, grounded, graph_adj
 
@@ -604,24 +599,23 @@ class GraphTransformers(Model):
         """
         Get edge information from node ids
         """
-        pair_list = [list(i) for i in list(itertools.product(node_ids, node_ids))]
-        edges = [
-            [pair, cpnet[pair[0]][pair[1]][0]]
-            for pair in pair_list
-            if cpnet_simple.has_edge(pair[0], pair[1])
-        ]
-        linked_pairs = [r[0] for r in edges]
+        node_ids = np.array(node_ids, dtype=np.int64)
+        # all ordered pairs of the nodes
+        src, dst = np.repeat(node_ids, len(node_ids)), np.tile(node_ids, len(node_ids))
+        found, relations, weights = cpnet.first_edges(src, dst)
 
         edge_attributes = {}
-        for i, (node_pair, edge) in enumerate(zip(linked_pairs, edges)):
+        for i, (source, target, rel, weight) in enumerate(
+            zip(src[found].tolist(), dst[found].tolist(), relations[found].tolist(), weights[found].tolist())
+        ):
             tmp_dict = dict()
-            tmp_dict["source"] = node_pair[0]
-            tmp_dict["target"] = node_pair[1]
-            tmp_dict["weight"] = edge[1]["weight"]
-            if edge[1]["rel"] >= len(id2relation):
-                tmp_dict["label"] = id2relation[edge[1]["rel"] - len(id2relation)]
+            tmp_dict["source"] = source
+            tmp_dict["target"] = target
+            tmp_dict["weight"] = weight
+            if rel >= len(id2relation):
+                tmp_dict["label"] = id2relation[rel - len(id2relation)]
             else:
-                tmp_dict["label"] = id2relation[edge[1]["rel"]]
+                tmp_dict["label"] = id2relation[rel]
             edge_attributes[i] = tmp_dict
         return edge_attributes
 
@@ -1,7 +1,10 @@
 from collections import defaultdict
-from typing import Tuple, Union
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
+import hashlib
 import logging
+import os
 import numpy as np
 import onnxruntime
 
@@ -16,7 +19,7 @@ from model_inference.tasks.models.prediction import (
     PredictionOutputForSequenceClassification,
     PredictionOutputForTokenClassification,
 )
-from model_inference.tasks.models.request import PredictionRequest
+from model_inference.tasks.models.request import PredictionRequest, Task
 from torch import nn
 from torch.nn import functional as F
 from transformers import AutoTokenizer
@@ -29,6 +32,23 @@ from .transformer import Transformer
 
 logger = logging.getLogger(__name__)
 
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+# Fields of the model config that are used to create the ONNX Runtime sessions
+SESSION_CONFIG_FIELDS = [
+    "disable_gpu",
+    "onnx_intra_op_num_threads",
+    "onnx_inter_op_num_threads",
+    "onnx_execution_mode",
+    "onnx_enable_cpu_mem_arena",
+    "onnx_execution_providers",
+    "onnx_optimized_model_path",
+]
+
+
 def to_numpy(x):
     if type(x) is not np.ndarray:
         x = x.detach().cpu().numpy() if x.requires_grad else x.cpu().numpy()
@@ -47,12 +67,9 @@ class Onnx(Transformer):
         """
         self.task = None
         self.gradients = None
+        self.token_lengths = None
 
-        self._load_model(
-            model_config.model_name,
-            model_config.onnx_use_quantized,
-            model_config.is_encoder_decoder
-        )
+        self._load_model(model_config.model_name, model_config.onnx_use_quantized, model_config.is_encoder_decoder)
 
     def _load_model(self, model_name, load_quantized=False, is_encoder_decoder=False):
         """
@@ -64,6 +81,7 @@ class Onnx(Transformer):
             decoder_name: the Huggingface name of the ONNX decoder model
             kwargs: Not used
         """
+
         def download_model(repo_id, filename):
             """
             Download a model from the Huggingface Hub
@@ -84,41 +102,115 @@ class Onnx(Transformer):
 
         # check whether a decoder model is available
         self.is_encoder_decoder = is_encoder_decoder
+        self.decoder_with_past_session = None
         if is_encoder_decoder:
             # if available load the decoder model in a onnx session
             filename = "encoder_model.onnx"
             decoder = "decoder_model.onnx"
 
             model_path = download_model(repo_id=model_name, filename=decoder)
-            self.decoder_session = onnxruntime.InferenceSession(model_path)
+            self.decoder_session = self._create_session(model_path)
+            # the decoder with past key values is optional and only used for the generation
+            try:
+                model_path = hf_hub_download(repo_id=model_name, filename="decoder_with_past_model.onnx")
+                self.decoder_with_past_session = self._create_session(model_path)
+            except EntryNotFoundError:
+                logger.info(f"No decoder_with_past_model.onnx for {model_name}. Generation runs without KV cache")
         else:
-            filename = "model_quant.onnx" if load_quantized else "model.onnx" 
+            filename = "model_quant.onnx" if load_quantized else "model.onnx"
 
         # load model and create onnx session
         model_path = download_model(repo_id=model_name, filename=filename)
-        self.session = onnxruntime.InferenceSession(model_path)
-
-        # enable all graph optimizations
-        so = onnxruntime.SessionOptions()
-        so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = self._create_session(model_path)
+        self.session_config = {field: model_config[field] for field in SESSION_CONFIG_FIELDS}
+        # decoder-only models exported with past key values take the KV cache as input
+        self.use_cache = (
+            self.decoder_with_past_session is not None
+            if is_encoder_decoder
+            else any(model_input.name.startswith("past_key_values") for model_input in self.session.get_inputs())
+        )
 
         try:
             # load tokenizer from model repository
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)    
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         except EnvironmentError:
             # if tokenizer is not available in the repository, use the base model's tokenizer
             config_path = download_model(repo_id=model_name, filename="config.json")
-        
+
             with open(config_path) as json_file:
                 base_model = json.load(json_file)["_name_or_path"]
-        
+
             self.tokenizer = AutoTokenizer.from_pretrained(base_model)
-            
+
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
 
         logger.info(f"Model {model_name} loaded")
 
+    def _execution_providers(self) -> List[str]:
+        """
+        Returns the configured execution providers. By default, CUDA is used if it is available and not disabled.
+        """
+        if model_config.onnx_execution_providers:
+            return [provider.strip() for provider in model_config.onnx_execution_providers.split(",")]
+        if not model_config.disable_gpu and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            return ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        return ["CPUExecutionProvider"]
+
+    def _create_session(self, model_path: str) -> onnxruntime.InferenceSession:
+        """
+        Creates the ONNX Runtime session for the model with the session options from the model config.
+        If onnx_optimized_model_path is set, the optimized graph is stored there on the first start
+        and loaded on later starts without optimizing the graph again.
+        Args:
+            model_path: the path to the ONNX model
+        """
+        if model_config.onnx_execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"Unknown ONNX execution mode {model_config.onnx_execution_mode}. "
+                f"Choose one of {list(EXECUTION_MODES.keys())}"
+            )
+        providers = self._execution_providers()
+        so = onnxruntime.SessionOptions()
+        so.intra_op_num_threads = model_config.onnx_intra_op_num_threads
+        so.inter_op_num_threads = model_config.onnx_inter_op_num_threads
+        so.execution_mode = EXECUTION_MODES[model_config.onnx_execution_mode]
+        so.enable_cpu_mem_arena = model_config.onnx_enable_cpu_mem_arena
+        # enable all graph optimizations
+        so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if not model_config.onnx_optimized_model_path:
+            return onnxruntime.InferenceSession(model_path, sess_options=so, providers=providers)
+
+        # the optimized graph depends on the model file (the resolved path contains its hash) and the providers
+        key = hashlib.sha1(f"{os.path.realpath(model_path)}{providers}".encode()).hexdigest()[:16]
+        optimized_model_path = os.path.join(
+            model_config.onnx_optimized_model_path, f"{Path(model_path).stem}-{key}.onnx"
+        )
+        if os.path.exists(optimized_model_path):
+            logger.info(f"Loading optimized ONNX model from {optimized_model_path}")
+            so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return onnxruntime.InferenceSession(optimized_model_path, sess_options=so, providers=providers)
+
+        os.makedirs(model_config.onnx_optimized_model_path, exist_ok=True)
+        # write to a temporary file first, so that other workers never load a partially written model
+        tmp_path = f"{optimized_model_path}.{os.getpid()}.tmp"
+        so.optimized_model_filepath = tmp_path
+        session = onnxruntime.InferenceSession(model_path, sess_options=so, providers=providers)
+        os.replace(tmp_path, optimized_model_path)
+        logger.info(f"Saved optimized ONNX model to {optimized_model_path}")
+        return session
+
+    def predict(self, request: PredictionRequest, task: Task) -> PredictionOutput:
+        """
+        Recreates the sessions if the session options were changed through the /update endpoint
+        before running the prediction
+        """
+        if self.session_config != {field: model_config[field] for field in SESSION_CONFIG_FIELDS}:
+            logger.info("ONNX session options changed. Recreating the sessions")
+            self._load_model(model_config.model_name, model_config.onnx_use_quantized, model_config.is_encoder_decoder)
+        return super().predict(request, task)
+
     def _predict(
         self, request: PredictionRequest, output_features=False, features=None
     ) -> Union[dict, Tuple[dict, dict]]:
@@ -128,7 +220,8 @@ class Onnx(Transformer):
         Args:
 
              request: the request with the input and optional kwargs
-             output_features: return the features of the input. Necessary if, e.g., attention mask is needed for post-processing.
+             output_features: return the features of the input. Necessary if, e.g., attention mask is needed for
+                post-processing.
 
         Returns:
                 The model outputs and optionally the input features
@@ -138,12 +231,18 @@ class Onnx(Transformer):
         request.preprocessing_kwargs["truncation"] = request.preprocessing_kwargs.get("truncation", True)
         if features is None:
             features = self.tokenizer(request.input, return_tensors="pt", **request.preprocessing_kwargs)
-        for start_idx in range(0, features["input_ids"].shape[0], model_config.batch_size):
-            input_names = [self.session.get_inputs()[i].name for i in range(len(self.session.get_inputs()))]
+        self._record_token_lengths(request, features)
+        input_names = [self.session.get_inputs()[i].name for i in range(len(self.session.get_inputs()))]
+        # multiple choice inputs are scored jointly and the decoder expects the inputs in their original order
+        batches = self._length_bucketed_batches(
+            features,
+            sort_by_length=not (request.task_kwargs.get("multiple_choice", False) or self.is_encoder_decoder),
+        )
+        for batch_indices, batch_length in batches:
             ort_inputs = dict(
                 (
                     k,
-                    to_numpy(input_data[start_idx : start_idx + model_config.batch_size]),
+                    self._trim_padding(to_numpy(input_data)[batch_indices.numpy()], batch_length),
                 )
                 for k, input_data in features.items()
                 if k in input_names
@@ -151,14 +250,8 @@ class Onnx(Transformer):
 
             if request.task_kwargs.get("multiple_choice", False):
                 # Multiple choice QA with ONNX expects input dimension expansion
-                ort_inputs = dict(
-                    (
-                        k,
-                        np.expand_dims(v, axis=0)
-                    )
-                    for k, v in ort_inputs.items()
-                )
-            
+                ort_inputs = dict((k, np.expand_dims(v, axis=0)) for k, v in ort_inputs.items())
+
             res = self.session.run([], ort_inputs)
 
             if self.is_encoder_decoder:
@@ -166,29 +259,32 @@ class Onnx(Transformer):
                     # Prepare decoder input
                     # This works with encoder decoder models exported similarirly to the FastT5 onnx model
                     ort_inputs = {
-                        "input_ids": features["decoder_input_ids"]
-                        if "decoder_input_ids" in features
-                        else np.array(
-                            [[self.get_bos_token()] for _ in range(features["input_ids"].shape[0])],
-                            dtype=np.int64,
+                        "input_ids": (
+                            features["decoder_input_ids"]
+                            if "decoder_input_ids" in features
+                            else np.array(
+                                [[self.get_bos_token()] for _ in range(features["input_ids"].shape[0])],
+                                dtype=np.int64,
+                            )
                         ),
                         "encoder_hidden_states": res[0],
                         "encoder_attention_mask": to_numpy(features["attention_mask"]),
                     }
                     res += self.decoder_session.run([], ort_inputs)
             all_predictions.append(res)
-        final_prediction = {}
         output_names = [self.session.get_outputs()[i].name for i in range(len(self.session.get_outputs()))]
         if self.is_encoder_decoder:
             output_names += [
                 self.decoder_session.get_outputs()[i].name for i in range(len(self.decoder_session.get_outputs()))
             ]
 
-        for idx, key in enumerate(output_names):
-            # HuggingFace outputs for 'attentions' and more is returned as tuple of tensors
-            # Tuple of tuples only exists for 'past_key_values' which is only relevant for generation.
-            # Generation should NOT use this function
-            final_prediction[key] = torch.cat([torch.tensor(p[idx]) for p in all_predictions])
+        # HuggingFace outputs for 'attentions' and more is returned as tuple of tensors
+        # Tuple of tuples only exists for 'past_key_values' which is only relevant for generation.
+        # Generation should NOT use this function
+        final_prediction = self._merge_batch_predictions(
+            [dict(zip(output_names, res)) for res in all_predictions],
+            [batch_indices for batch_indices, _ in batches],
+        )
         if output_features:
             return final_prediction, features
         return final_prediction
@@ -242,7 +338,7 @@ class Onnx(Transformer):
             elif embedding_mode == "token":
                 emb = hidden_state
                 task_outputs["word_ids"] = [features.word_ids(i) for i in range(len(request.input))]
-        
+
         if request.task_kwargs.get("normalize", False):
             print("*****Normalize the embedding*****")
             emb = torch.nn.functional.normalize(emb)
@@ -268,7 +364,11 @@ class Onnx(Transformer):
         task_outputs = {}
         # If logits dim > 1 or if the 'is_regression' flag is not set, we assume classification:
         # We replace the logits by the softmax and add labels chosen with argmax
-        if predictions["logits"].size()[-1] != 1 and not request.task_kwargs.get("is_regression", False) and not request.task_kwargs.get("multiple_choice", False):
+        if (
+            predictions["logits"].size()[-1] != 1
+            and not request.task_kwargs.get("is_regression", False)
+            and not request.task_kwargs.get("multiple_choice", False)
+        ):
             probabilities = torch.softmax(predictions["logits"], dim=-1)
             predictions["logits"] = probabilities
             labels = torch.argmax(predictions["logits"], dim=-1)
@@ -313,14 +413,19 @@ class Onnx(Transformer):
         """
         max_length = request.task_kwargs.get("max_length", 20)
         task_outputs = {"generated_texts": []}
-        model_outputs = defaultdict(list)
-        for prompt in request.input:
+        outputs = [None] * len(request.input)
+        for prompt_indices in self._generation_groups(request):
+            prompts = [request.input[idx] for idx in prompt_indices]
             # if num_beams is specified beam search is executed otherwise greedy search
             if "num_beams" in request.task_kwargs:
-                input_ids, scores = self._beam_search(request, prompt, max_length)
+                sequences, scores = self._beam_search(request, prompts, max_length)
             else:
-                input_ids, scores = self._greedy_generation(request, prompt, max_length)
+                sequences, scores = self._greedy_generation(request, prompts, max_length)
+            for idx, input_ids, prompt_scores in zip(prompt_indices, sequences, scores):
+                outputs[idx] = (input_ids, prompt_scores)
 
+        model_outputs = defaultdict(list)
+        for input_ids, scores in outputs:
             generated_texts = [
                 self.tokenizer.decode(
                     seq,
@@ -342,47 +447,164 @@ class Onnx(Transformer):
         logger.info("Model outputs: {}".format(model_outputs))
         return PredictionOutputForGeneration(model_outputs=model_outputs, **task_outputs)
 
-    def _greedy_generation(self, request, prompt, max_length):
+    def _generation_groups(self, request: PredictionRequest) -> List[List[int]]:
+        """
+        Groups the prompts that are generated together in one batch.
+        Decoder-only models are left-padded. Without position_ids as model input, the padding would shift the
+        positions of the prompt tokens, so only prompts with the same number of tokens are batched together.
+
+        Returns:
+             the indices of the prompts of each batch
+        """
+        input_names = [model_input.name for model_input in self.session.get_inputs()]
+        if self.is_encoder_decoder or "position_ids" in input_names:
+            return [list(range(len(request.input)))]
+        groups = defaultdict(list)
+        preprocessing_kwargs = {**request.preprocessing_kwargs, "padding": False}
+        for idx, prompt in enumerate(request.input):
+            groups[len(self.tokenizer(prompt, **preprocessing_kwargs)["input_ids"])].append(idx)
+        return list(groups.values())
+
+    def _prepare_generation_inputs(self, request: PredictionRequest, prompts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Tokenizes and pads the prompts for the generation. For encoder decoder models, the encoder is run once
+        and its hidden states are the input of the decoder in all generation steps.
+
+        Args:
+             request: the inference request
+             prompts: the prompts for the generation
+
+        Returns:
+             the model inputs of each prompt
+        """
+        request.preprocessing_kwargs["padding"] = False
+        features = self.tokenizer(prompts, **request.preprocessing_kwargs)
+        max_prompt_length = max(len(ids) for ids in features["input_ids"])
+        input_ids = np.full((len(prompts), max_prompt_length), self.tokenizer.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(prompts), max_prompt_length), dtype=np.int64)
+        for idx, ids in enumerate(features["input_ids"]):
+            # decoder-only models continue the prompt, so the padding goes to the left
+            start = 0 if self.is_encoder_decoder else max_prompt_length - len(ids)
+            input_ids[idx, start : start + len(ids)] = ids
+            attention_mask[idx, start : start + len(ids)] = 1
+
+        if not self.is_encoder_decoder:
+            return {"input_ids": input_ids, "attention_mask": attention_mask}
+        ort_inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        input_names = [model_input.name for model_input in self.session.get_inputs()]
+        encoder_hidden_states = self.session.run([], {k: v for k, v in ort_inputs.items() if k in input_names})[0]
+        return {"encoder_hidden_states": encoder_hidden_states, "encoder_attention_mask": attention_mask}
+
+    def _empty_past(self, session, batch_size: int) -> Dict[str, np.ndarray]:
+        """
+        Creates the empty KV cache for the first generation step of decoder-only models.
+        All dynamic dimensions except for the batch dimension (i.e., the past sequence length) are empty.
+        """
+        past = {}
+        for model_input in session.get_inputs():
+            if model_input.name.startswith("past_key_values"):
+                shape = [batch_size] + [dim if isinstance(dim, int) else 0 for dim in model_input.shape[1:]]
+                dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+                past[model_input.name] = np.zeros(shape, dtype=dtype)
+        return past
+
+    def _generation_step(
+        self, inputs: Dict[str, np.ndarray], generated_ids: np.ndarray, past: Optional[Dict[str, np.ndarray]]
+    ) -> Tuple[torch.Tensor, Optional[Dict[str, np.ndarray]]]:
+        """
+        Runs one generation step for all sequences in one session call.
+        With KV cache only the last generated token is processed, otherwise the full sequence is recomputed.
+
+        Args:
+             inputs: the model inputs of the prompt of each sequence (see _prepare_generation_inputs)
+             generated_ids: the ids generated so far for each sequence
+             past: the KV cache returned by the previous step or None in the first step
+
+        Returns:
+             the logits for the next token of each sequence and the KV cache for the next step
+        """
+        if self.is_encoder_decoder:
+            if past is None:
+                session = self.decoder_session
+                ort_inputs = {"input_ids": generated_ids, **inputs}
+            else:
+                session = self.decoder_with_past_session
+                ort_inputs = {"input_ids": generated_ids[:, -1:], **inputs, **past}
+        else:
+            session = self.session
+            input_ids = np.concatenate((inputs["input_ids"], generated_ids), axis=1)
+            attention_mask = np.concatenate((inputs["attention_mask"], np.ones_like(generated_ids)), axis=1)
+            position_ids = np.maximum(np.cumsum(attention_mask, axis=1) - 1, 0)
+            if self.use_cache:
+                if past is None:
+                    past = self._empty_past(session, input_ids.shape[0])
+                else:
+                    input_ids = input_ids[:, -1:]
+                    position_ids = position_ids[:, -1:]
+            ort_inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "position_ids": position_ids}
+            if past is not None:
+                ort_inputs.update(past)
+
+        input_names = [model_input.name for model_input in session.get_inputs()]
+        output_names = [model_output.name for model_output in session.get_outputs()]
+        res = dict(zip(output_names, session.run([], {k: v for k, v in ort_inputs.items() if k in input_names})))
+        next_token_logits = torch.from_numpy(res["logits"][:, -1, :])
+
+        present = {
+            name.replace("present", "past_key_values", 1): value
+            for name, value in res.items()
+            if name.startswith("present")
+        }
+        if not self.use_cache or not present:
+            return next_token_logits, None
+        # the decoder with past only returns the updated self-attention cache, the cross-attention cache is kept
+        return next_token_logits, {**(past or {}), **present}
+
+    def _greedy_generation(self, request, prompts, max_length):
         """
         Performs greedy generation for the prompts
 
         Args:
              request: the inference request
-             prompt: the prompt for the generation
+             prompts: the prompts for the generation
              max_length: the maximum length of the generated sequence
         Returns:
-             the ids of the generated sequence and the score
+             the ids of the generated sequence and the scores for each prompt
         """
-        cur_len = 0
         eos_token_id = (
             self.tokenizer.eos_token_id if self.tokenizer.eos_token_id is not None else self.tokenizer.pad_token_id
         )
-        request.preprocessing_kwargs["padding"] = False
-        features = self.tokenizer(prompt, return_tensors="pt", **request.preprocessing_kwargs)
-        input_ids = features["input_ids"]
-        generated_ids = [self.get_bos_token()] if self.is_encoder_decoder else []
-        unfinished_sequences = input_ids.new(input_ids.shape[0]).fill_(1)
-        scores = ()
+        inputs = self._prepare_generation_inputs(request, prompts)
+        num_start_tokens = 1 if self.is_encoder_decoder else 0
+        generated_ids = np.full((len(prompts), num_start_tokens), self.get_bos_token(), dtype=np.int64)
+        unfinished_sequences = np.ones(len(prompts), dtype=bool)
+        # number of generated tokens of each prompt up to (and including) the eos token
+        lengths = np.zeros(len(prompts), dtype=np.int64)
+        scores = []
+        past = None
         # greedy generation (adapted from transformers/generation_utils.py)
-        while cur_len < max_length:
-            input_data = self._prepare_input(features, generated_ids)
-            predictions = self._predict(request, features=input_data)
-
-            next_token_logits = predictions["logits"][:, -1, :]
-            scores += (next_token_logits,)
+        for _ in range(max_length):
+            next_token_logits, past = self._generation_step(inputs, generated_ids, past)
+            scores.append(next_token_logits)
 
             # argmax
-            next_tokens = torch.argmax(next_token_logits, dim=-1)
+            next_tokens = torch.argmax(next_token_logits, dim=-1).numpy()
             # update generated ids, model inputs, and length for next step
-            generated_ids.append(next_tokens[:, None].item())
-            cur_len = cur_len + 1
+            generated_ids = np.concatenate((generated_ids, next_tokens[:, None]), axis=1)
+            lengths += unfinished_sequences
 
             if eos_token_id is not None:
-                unfinished_sequences = unfinished_sequences.mul((next_tokens != eos_token_id).long())
-                # stop when each sentence is finished, or if we exceed the maximum length
-            if unfinished_sequences.max() == 0:
+                unfinished_sequences &= next_tokens != eos_token_id
+            # stop when each sentence is finished, or if we exceed the maximum length
+            if not unfinished_sequences.any():
                 break
-        return [generated_ids], scores
+        return (
+            [[generated_ids[idx, : num_start_tokens + length].tolist()] for idx, length in enumerate(lengths)],
+            [
+                tuple(step_scores[idx : idx + 1] for step_scores in scores[:length])
+                for idx, length in enumerate(lengths)
+            ],
+        )
 
     def _question_answering(self, request: PredictionRequest) -> PredictionOutput:
         """
@@ -532,9 +754,11 @@ class Onnx(Transformer):
                 attributions = self._interpret(
                     request=request,
                     prediction=predictions,
-                    method=request.explain_kwargs["method"]
-                    if request.explain_kwargs
-                    else request.attack_kwargs["saliency_method"],
+                    method=(
+                        request.explain_kwargs["method"]
+                        if request.explain_kwargs
+                        else request.attack_kwargs["saliency_method"]
+                    ),
                     **grad_kwargs,
                 )
                 # new added section start
@@ -568,115 +792,100 @@ class Onnx(Transformer):
 
         return PredictionOutputForQuestionAnswering(model_outputs=predictions, **task_outputs)
 
-
-    def _prepare_input(self, encoder_features, generated_sequence):
+    def _beam_search(self, request, prompts, max_length):
         """
-        Prepares the input for the _predict method. If the model is an encoder decoder model the
-        generated sequence is the decoder input.
+        Performs beam search for the given prompts. The beams of all prompts and return sequences
+        are processed together in one session call per generation step.
 
         Args:
-             encoder_features: the features of the prompt
-             generated_sequence: the generated ids
+             request: the inference request
+             prompts: the generation prompts
+             max_length: the maximum length of the generated sequence
 
         Returns:
-             the features for the model
+             the generated sequence(s) and their scores for each prompt
         """
-        model_input = encoder_features.copy()
-        # if it is a encoder decoder model the generated sequence is passed to the decoder
-        # otherwise the generated sequence is appended to the input_ids
-        if self.is_encoder_decoder:
-            model_input["decoder_input_ids"] = np.array([generated_sequence], dtype=np.int64)
-            model_input["decoder_attention_mask"] = np.array([[1] * len(generated_sequence)], dtype=np.int64)
+        # get the generation arguments
+        num_beams = request.task_kwargs["num_beams"]
+        no_repeat_ngram_size = request.task_kwargs.get("no_repeat_ngram_size", 0)
+        do_sample = request.task_kwargs.get("do_sample", False)
+        top_p = request.task_kwargs.get("top_p", None)
+        top_k = request.task_kwargs.get("top_k", None)
+        num_return_sequences = request.task_kwargs.get("num_return_sequences", 1)
+
+        # every return sequence of a prompt is the result of a separate beam search
+        num_searches = len(prompts) * num_return_sequences
+        inputs = self._prepare_generation_inputs(request, prompts)
+        inputs = {k: np.repeat(v, num_return_sequences, axis=0) for k, v in inputs.items()}
+        num_start_tokens = 1 if self.is_encoder_decoder else 0
+        generated_ids = np.full((num_searches, num_start_tokens), self.get_bos_token(), dtype=np.int64)
+        # each search starts with one beam and is expanded to num_beams beams after the first step
+        beam_scores = torch.zeros((num_searches, 1), dtype=torch.float64)
+        past = None
+        for cur_len in range(max_length):
+            next_token_logits, past = self._generation_step(inputs, generated_ids, past)
+            next_token_scores = F.softmax(next_token_logits, dim=1)
+            if do_sample:
+                next_token_scores = self._preprocess_logits(
+                    next_token_scores,
+                    top_k=top_k,
+                    top_p=top_p,
+                    min_tokens_to_keep=2 * num_beams,
+                )
 
-        elif generated_sequence:
-            model_input["input_ids"] = torch.cat(
-                (
-                    encoder_features["input_ids"],
-                    torch.tensor(generated_sequence).unsqueeze(dim=0),
-                ),
-                dim=1,
-            )
-            model_input["attention_mask"] = torch.ones(model_input["input_ids"].shape, dtype=torch.int64)
+            if no_repeat_ngram_size > 0:
+                banned_batch_tokens = calc_banned_ngram_tokens(
+                    torch.from_numpy(generated_ids), generated_ids.shape[0], no_repeat_ngram_size, cur_len
+                )
+                for i, banned_tokens in enumerate(banned_batch_tokens):
+                    next_token_scores[i, banned_tokens] = -float("inf")
 
-        return model_input
+            if do_sample:
+                # draw the next token based on the probabilities
+                probs = nn.functional.softmax(next_token_scores, dim=-1)
 
-    def _beam_search(self, request, prompt, max_length):
-        """
-        Performs beam search for the given prompt
+                next_tokens = torch.multinomial(probs, num_samples=2 * num_beams)
+                next_token_prob = torch.gather(next_token_scores, -1, next_tokens)
 
-        Args:
-             request: the inference request
-             prompt: the generation prompt
-             max_length: the maximum length of the generated sequence
+                next_token_prob, _indices = torch.sort(next_token_prob, descending=True, dim=1)
+                next_tokens_idx = torch.gather(next_tokens, -1, _indices)
 
-        Returns:
-             the generated sequence(s)
-        """
-        request.preprocessing_kwargs["padding"] = False
-        features = self.tokenizer(prompt, return_tensors="pt", **request.preprocessing_kwargs)
-        # get the generation arguments
-        num_beams = request.task_kwargs.pop("num_beams")
-        no_repeat_ngram_size = request.task_kwargs.pop("no_repeat_ngram_size", 0)
-        do_sample = request.task_kwargs.pop("do_sample", False)
-        top_p = request.task_kwargs.pop("top_p", None)
-        top_k = request.task_kwargs.pop("top_k", None)
-        num_return_sequences = request.task_kwargs.pop("num_return_sequences", 1)
-        return_sequences = []
-        for i in range(num_return_sequences):
-            sequences = [([self.get_bos_token()] if self.is_encoder_decoder else [], 0.0)]
-            cur_len = 0
-            while cur_len < max_length:
-                candidates = []
-                for seq in sequences:
-                    model_input = self._prepare_input(features, seq[0])
-                    predictions = self._predict(request, False, model_input)
-
-                    next_token_logits = predictions["logits"][:, -1, :]
-                    next_token_scores = F.softmax(next_token_logits, dim=1)
-                    if do_sample:
-                        next_token_scores = self._preprocess_logits(
-                            next_token_scores,
-                            top_k=top_k,
-                            top_p=top_p,
-                            min_tokens_to_keep=2 * num_beams,
-                        )
-
-                    if no_repeat_ngram_size > 0:
-                        banned_batch_tokens = calc_banned_ngram_tokens(
-                            torch.tensor([seq[0]]), 1, no_repeat_ngram_size, cur_len
-                        )
-                        for i, banned_tokens in enumerate(banned_batch_tokens):
-                            next_token_scores[i, banned_tokens] = -float("inf")
-
-                    if do_sample:
-                        # draw the next token based on the probabilities
-                        probs = nn.functional.softmax(next_token_scores, dim=-1)
-
-                        next_tokens = torch.multinomial(probs, num_samples=2 * num_beams)
-                        next_token_prob = torch.gather(next_token_scores, -1, next_tokens)
-
-                        _, _indices = torch.sort(next_token_prob, descending=True, dim=1)
-                        next_tokens_idx = torch.gather(next_tokens, -1, _indices)
-
-                    else:
-                        # take the most likely tokens as the next tokens
-                        next_token_prob, next_tokens_idx = torch.topk(next_token_scores, num_beams, dim=-1)
-                    candidates += [
-                        (seq[0] + [token_id], seq[1] + np.log(score))
-                        for token_id, score in zip(
-                            next_tokens_idx.squeeze().tolist(),
-                            next_token_prob.squeeze().tolist(),
-                        )
-                    ]
-                # select the candidates with the highest scores as beams for the generation of the next token
-                sequences = sorted(candidates, key=lambda x: x[1], reverse=True)[:num_beams]
-                cur_len += 1
-
-            return_sequences.append(sequences[0])
+            else:
+                # take the most likely tokens as the next tokens
+                next_token_prob, next_tokens_idx = torch.topk(next_token_scores, num_beams, dim=-1)
+
+            # select the candidates with the highest scores as beams for the generation of the next token
+            num_candidates = next_tokens_idx.shape[-1]
+            candidate_scores = (beam_scores.view(-1, 1) + torch.log(next_token_prob.double())).view(num_searches, -1)
+            selected = torch.sort(candidate_scores, dim=-1, descending=True, stable=True)[1][:, :num_beams]
+            source_rows = (
+                (
+                    torch.arange(num_searches).unsqueeze(-1) * beam_scores.shape[1]
+                    + torch.div(selected, num_candidates, rounding_mode="floor")
+                )
+                .flatten()
+                .numpy()
+            )
+            next_tokens = torch.gather(next_tokens_idx.view(num_searches, -1), 1, selected).flatten().numpy()
+            beam_scores = torch.gather(candidate_scores, 1, selected)
+
+            generated_ids = np.concatenate((generated_ids[source_rows], next_tokens[:, None]), axis=1)
+            inputs = {k: v[source_rows] for k, v in inputs.items()}
+            if past is not None:
+                past = {k: v[source_rows] for k, v in past.items()}
 
+        # the beams are sorted by their score, so the first beam of each search is the best sequence
+        best_sequences = generated_ids.reshape(num_searches, beam_scores.shape[1], -1)[:, 0]
+        best_scores = beam_scores[:, 0].tolist()
         return (
-            [torch.tensor(s[0]) for s in return_sequences],
-            [s[1] for s in return_sequences],
+            [
+                [torch.tensor(best_sequences[idx]) for idx in range(start, start + num_return_sequences)]
+                for start in range(0, num_searches, num_return_sequences)
+            ],
+            [
+                best_scores[start : start + num_return_sequences]
+                for start in range(0, num_searches, num_return_sequences)
+            ],
         )
 
     def get_bos_token(self):
@@ -1,8 +1,11 @@
 import logging
+from typing import List
 
+import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer as SentenceTransformerModel
 from model_inference.tasks.config.model_config import model_config
+from model_inference.tasks.embedding_cache import get_embedding_cache
 from model_inference.tasks.inference.model import Model
 from model_inference.tasks.models.prediction import PredictionOutput, PredictionOutputForEmbedding
 from model_inference.tasks.models.request import PredictionRequest, Task
@@ -45,9 +48,16 @@ class SentenceTransformer(Model):
         self.model = model
 
     def _embedding(self, request: PredictionRequest) -> PredictionOutput:
-        embeddings = self.model.encode(request.input, batch_size=model_config.batch_size, show_progress_bar=False)
+        embedding_cache = get_embedding_cache()
+        if embedding_cache.enabled:
+            embeddings = embedding_cache.embed(request, None, self._encode)
+        else:
+            embeddings = self._encode(request.input)
         return PredictionOutputForEmbedding(model_outputs={"embeddings": embeddings})
 
+    def _encode(self, inputs: List[str]) -> np.ndarray:
+        return self.model.encode(inputs, batch_size=model_config.batch_size, show_progress_bar=False)
+
     def predict(self, request: PredictionRequest, task: Task) -> PredictionOutput:
         """
         Args:
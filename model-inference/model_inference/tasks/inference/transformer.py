@@ -1,3 +1,4 @@
+import contextlib
 import logging
 import math
 import string
@@ -9,7 +10,9 @@ import numpy as np
 import torch
 from bertviz import head_view
 from model_inference.tasks.attacks import hotflip, input_reduction, subspan, topk_tokens
+from model_inference.tasks.attribution_cache import attribution_cache
 from model_inference.tasks.config.model_config import model_config
+from model_inference.tasks.embedding_cache import get_embedding_cache
 from model_inference.tasks.inference.model import Model
 from model_inference.tasks.models.prediction import (
     PredictionOutput,
@@ -43,6 +46,33 @@ CLASS_MAPPING = {
     "generation": AutoModelForCausalLM,
 }
 
+# On-load optimizations for models served on the CPU (see ModelConfig.cpu_optimization)
+CPU_OPTIMIZATIONS = ["none", "int8", "bf16"]
+
+# (question, context) pairs used to compare the optimized model against the fp32 model
+ACCURACY_CHECK_INPUTS = [
+    ("What is the capital of Germany?", "Berlin is the capital and largest city of Germany."),
+    ("Who wrote Hamlet?", "Hamlet is a tragedy written by William Shakespeare around 1600."),
+    ("How many legs does a spider have?", "Spiders are arachnids with eight legs and two body segments."),
+    ("When did the Second World War end?", "The war in Europe ended with the surrender of Germany in May 1945."),
+]
+
+
+def _repeat_batch(value, copies: int):
+    """
+    Repeats the batch of a tensor, e.g. input ids or labels, the given number of times
+    """
+    if not torch.is_tensor(value) or value.dim() == 0:
+        return value
+    return value.repeat(copies, *[1] * (value.dim() - 1))
+
+
+def _bfloat16_to_float(tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Casts bf16 outputs of autocast back to fp32 because numpy does not support bf16
+    """
+    return tensor.float() if tensor.dtype == torch.bfloat16 else tensor
+
 
 class Transformer(Model):
     """
@@ -62,6 +92,8 @@ class Transformer(Model):
         """
         self.task = None
         self.gradients = None
+        # token length of each input of the last prediction
+        self.token_lengths = None
         if model_config.model_class == "from_config":
             config = AutoConfig.from_pretrained(model_config.model_name)
             if config.architectures:
@@ -81,6 +113,7 @@ class Transformer(Model):
             model_config.model_name,
             model_config.disable_gpu,
         )
+        self._optimize_for_cpu(self.model.device.type)
 
     def _load_model(self, model_cls, model_name, disable_gpu):
 
@@ -98,6 +131,97 @@ class Transformer(Model):
 
         self.model = model
         self.tokenizer = tokenizer
+        self.cpu_optimization = "none"
+
+    def _optimize_for_cpu(self, device: str):
+        """
+        Applies the CPU optimization of the model config to the loaded model: dynamic int8 quantization of the
+        linear layers ('int8') or bf16 autocast ('bf16'). Both run the model in torch.inference_mode.
+        The outputs of the optimized model are compared against the fp32 model. The result is logged and kept as
+        accuracy_report, which the worker stores next to the model config for the statistics endpoint.
+        Must be called after all weights (e.g. preloaded adapters and heads) are loaded, because only the linear
+        layers that exist at this point are quantized.
+        """
+        optimization = model_config.cpu_optimization or "none"
+        if optimization not in CPU_OPTIMIZATIONS:
+            raise RuntimeError(f"Unknown CPU_OPTIMIZATION. Must be one of {CPU_OPTIMIZATIONS}")
+        if optimization == "none":
+            return
+        if device != "cpu":
+            logger.warning(f"CPU optimization {optimization} is ignored for models on {device}")
+            return
+
+        self.model.eval()
+        reference_outputs = self._accuracy_check_outputs()
+        if optimization == "int8":
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.cpu_optimization = optimization
+        self.accuracy_report = self._accuracy_report(reference_outputs, self._accuracy_check_outputs())
+
+    def _inference_context(self) -> contextlib.ExitStack:
+        """
+        Context for the forward passes of the model without gradients (with autocast for bf16 models)
+        """
+        stack = contextlib.ExitStack()
+        if getattr(self, "cpu_optimization", "none") == "none":
+            stack.enter_context(torch.no_grad())
+            return stack
+        stack.enter_context(torch.inference_mode())
+        if self.cpu_optimization == "bf16":
+            stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+        return stack
+
+    def _accuracy_check_outputs(self) -> List[torch.Tensor]:
+        """
+        Computes the first model output (e.g. the logits or the last hidden state) for the accuracy check inputs
+        """
+        outputs = []
+        try:
+            with self._inference_context():
+                for question, context in ACCURACY_CHECK_INPUTS:
+                    features = self.tokenizer(question, context, return_tensors="pt", truncation=True)
+                    outputs.append(_bfloat16_to_float(self.model(**features)[0]).clone())
+        except Exception as err:
+            # e.g. encoder-decoder models that need decoder inputs
+            logger.warning(f"Accuracy check of the CPU optimization skipped: {err}")
+            return []
+        return outputs
+
+    def _check_cpu_optimization(self, request: PredictionRequest):
+        """
+        Explanations and attacks need gradients which are not available for optimized models
+        """
+        if getattr(self, "cpu_optimization", "none") != "none" and (request.explain_kwargs or request.attack_kwargs):
+            raise ValueError(
+                f"Explanations and attacks are not supported for models with CPU optimization {self.cpu_optimization}"
+            )
+
+    def _accuracy_report(self, reference_outputs: List[torch.Tensor], outputs: List[torch.Tensor]) -> Dict:
+        """
+        Compares the outputs of the optimized model against the outputs of the fp32 model
+        Returns:
+             the maximum absolute difference, the mean cosine similarity and the share of equal argmax predictions
+        """
+        if not reference_outputs or not outputs:
+            return {}
+        max_abs_diff, similarities, agreements = 0.0, [], []
+        for reference, output in zip(reference_outputs, outputs):
+            max_abs_diff = max(max_abs_diff, (reference - output).abs().max().item())
+            similarities.append(
+                torch.nn.functional.cosine_similarity(reference.flatten(), output.flatten(), dim=0).item()
+            )
+            agreements.append((reference.argmax(dim=-1) == output.argmax(dim=-1)).float().mean().item())
+        report = {
+            "cpu_optimization": self.cpu_optimization,
+            "max_abs_diff": max_abs_diff,
+            "mean_cosine_similarity": sum(similarities) / len(similarities),
+            "argmax_agreement": sum(agreements) / len(agreements),
+        }
+        if report["mean_cosine_similarity"] < 0.99 or report["argmax_agreement"] < 1.0:
+            logger.warning(f"Outputs of the optimized model differ from the fp32 model: {report}")
+        else:
+            logger.info(f"Accuracy check of the optimized model: {report}")
+        return report
 
     def encode(self, inputs: list = None, add_special_tokens: bool = True, return_tensors=None):
         """
@@ -184,29 +308,49 @@ class Transformer(Model):
         handles.append(attn_layer.register_forward_hook(forward_hook))
         return handles
 
-    def _register_hooks(self, embeddings_list: List, alpha: int, method: str):
+    def _register_hooks(
+        self,
+        embeddings_list: List,
+        alpha: Union[float, np.ndarray],
+        method: str,
+        copies: int = 1,
+        generator: torch.Generator = None,
+    ):
         """
         Register the model embeddings during the forward pass
         Args:
             embeddings_list: list to store embeddings during forward pass
+            alpha: scaling factor of the embeddings for integrated_grads, one per copy of the inputs
+            method: the explanation method
+            copies: number of copies of the inputs in the batch, e.g. one per interpolation step
+            generator: random number generator for the noise of smooth_grads, consumed one copy at a time
         """
 
         def forward_hook(module, inputs, output):
-            if alpha == 0 and method in ["simple_grads", "integrated_grads"]:
-                embeddings_list.append(output.squeeze(0).clone().detach())
+            # (copies, num_inputs, seq_len, hidden_size)
+            copy_outputs = output.view(copies, -1, *output.shape[1:])
+            alphas = torch.as_tensor(alpha, dtype=output.dtype, device=output.device).reshape(-1)
+            if alphas[0] == 0 and method in ["simple_grads", "integrated_grads"]:
+                embeddings_list.append(copy_outputs[0].squeeze(0).clone().detach())
             if method == "integrated_grads":
-                # Scale the embedding by alpha
-                output.mul_(alpha)
+                # Scale the embeddings of each copy by its alpha
+                copy_outputs.mul_(alphas.view(-1, *[1] * (copy_outputs.dim() - 1)))
             elif method == "smooth_grads":
-                torch.manual_seed(4)
-                torch.cuda.manual_seed(4)
                 # Random noise = N(0, stdev * (max-min))
                 stdev = 0.01
-                scale = output.detach().max() - output.detach().min()
-                noise = torch.randn(output.shape, device=output.device) * stdev * scale
+                flat_outputs = copy_outputs.detach().flatten(1)
+                scale = flat_outputs.max(1).values - flat_outputs.min(1).values
+                # The noise is drawn copy by copy, so the samples do not depend on how many copies fit into a batch
+                noise = torch.stack(
+                    [
+                        torch.randn(copy_outputs.shape[1:], generator=generator, device=generator.device)
+                        for _ in range(copies)
+                    ]
+                ).to(output.device)
+                noise = noise * stdev * scale.view(-1, *[1] * (copy_outputs.dim() - 1))
 
                 # Add the random noise
-                output.add_(noise)
+                copy_outputs.add_(noise)
 
         handles = []
         embedding_layer = self.get_model_embeddings()
@@ -245,13 +389,15 @@ class Transformer(Model):
         hooks.append(attentions.register_full_backward_hook(hook_layers))
         return hooks
 
-    def get_gradients(self, request: PredictionRequest, method: str, **kwargs):
+    def get_gradients(self, request: PredictionRequest, method: str, copies: int = 1, **kwargs):
         """
         Compute model gradients
         Args:
             inputs: list of question and context
             answer_start: answer span start
             answer_end: answer span end
+            copies: number of copies of the inputs in the batch, e.g. one per interpolation step of
+                integrated_grads. The gradients are summed over the copies
         Return:
             dict of model gradients
         """
@@ -269,8 +415,13 @@ class Transformer(Model):
         with torch.backends.cudnn.flags(enabled=False):
             features = self.tokenizer(request.input, return_tensors="pt", **request.preprocessing_kwargs)
             input_features = self._ensure_tensor_on_device(**features)
-            outputs = self.model(**input_features, **kwargs, **request.model_kwargs)
-            loss = outputs.loss
+            model_kwargs = kwargs
+            if copies > 1:
+                input_features = {name: _repeat_batch(tensor, copies) for name, tensor in input_features.items()}
+                model_kwargs = {name: _repeat_batch(value, copies) for name, value in kwargs.items()}
+            outputs = self.model(**input_features, **model_kwargs, **request.model_kwargs)
+            # the loss is averaged over the batch, so each copy gets the gradients of a separate pass
+            loss = outputs.loss * copies
 
             # Zero gradients.
             # NOTE: this is actually more efficient than
@@ -284,6 +435,8 @@ class Transformer(Model):
         for hook in hooks:
             hook.remove()
 
+        if copies > 1:
+            gradients = [grad.view(copies, -1, *grad.shape[1:]).sum(0) for grad in gradients]
         # if multiple entries, only choose emb grad for the correct answer
         if "labels" in kwargs.keys() and gradients[0].shape[0] > 1:
             gradients = [gradients[0][kwargs["labels"].item()].unsqueeze(0)]
@@ -302,6 +455,86 @@ class Transformer(Model):
 
         return grad_dict
 
+    def _length_bucketed_batches(self, features, sort_by_length: bool = True) -> List[Tuple[torch.Tensor, int]]:
+        """
+        Split the tokenized inputs into batches of model_config.batch_size inputs.
+        If the inputs do not fit into one batch, they are sorted by their token length
+        so that each batch only needs to be padded to its own longest input.
+        The batch with the longest inputs keeps the padding of the features.
+        Args:
+            features: the tokenized inputs of the request
+            sort_by_length: sort the inputs by their length. Otherwise, the batches keep the order of the inputs
+        Returns:
+            list of the indices of the inputs in each batch and the token length the batch is padded to
+        """
+        padded_length = features["input_ids"].shape[-1]
+        num_inputs = features["input_ids"].shape[0]
+        if not sort_by_length or num_inputs <= model_config.batch_size or "attention_mask" not in features:
+            return [
+                (torch.arange(start_idx, min(start_idx + model_config.batch_size, num_inputs)), padded_length)
+                for start_idx in range(0, num_inputs, model_config.batch_size)
+            ]
+
+        lengths = torch.as_tensor(features["attention_mask"]).sum(dim=-1)
+        order = torch.sort(lengths, stable=True)[1]
+        batches = []
+        for start_idx in range(0, num_inputs, model_config.batch_size):
+            batch_indices = order[start_idx : start_idx + model_config.batch_size]
+            batches.append((batch_indices, int(lengths[batch_indices].max())))
+        # keep the padding of the features for the longest batch so that merged outputs keep their shape
+        batches[-1] = (batches[-1][0], padded_length)
+        return batches
+
+    def _trim_padding(self, tensor, length: int):
+        """
+        Remove the padding of the tokenized inputs beyond the given token length
+        """
+        if self.tokenizer.padding_side == "left":
+            return tensor[:, tensor.shape[1] - length :]
+        return tensor[:, :length]
+
+    def _record_token_lengths(self, request: PredictionRequest, features):
+        """
+        Keep the token length of each input so that the outputs of merged requests can be cut back to the padding
+        length of each request. Not recorded for padding to a fixed length, which does not depend on the batch.
+        """
+        self.token_lengths = None
+        if request.preprocessing_kwargs.get("padding") in (True, "longest") and "attention_mask" in features:
+            self.token_lengths = torch.as_tensor(features["attention_mask"]).sum(dim=-1).tolist()
+
+    def _merge_batch_predictions(self, all_predictions: List[dict], batch_indices: List[torch.Tensor]) -> dict:
+        """
+        Concatenate the outputs of the length-bucketed batches. Outputs of shorter batches
+        are padded with zeros to the shape of the batch with the longest inputs and
+        all outputs are returned in the original order of the inputs.
+        Args:
+            all_predictions: the model outputs of each batch
+            batch_indices: the indices of the inputs in each batch
+        Returns:
+            the merged model outputs
+        """
+        order = torch.cat(batch_indices)
+        inverse_order = None if torch.equal(order, torch.arange(len(order))) else torch.argsort(order)
+        padding_side = self.tokenizer.padding_side
+
+        def merge(outputs: List):
+            if isinstance(outputs[0], tuple):
+                merged = tuple(merge(list(parts)) for parts in zip(*outputs))
+                return tuple(torch.stack(m) if isinstance(m, tuple) else m for m in merged)
+            outputs = [_bfloat16_to_float(torch.as_tensor(output).cpu()) for output in outputs]
+            reference_shape = outputs[-1].shape
+            padded_outputs = []
+            for output in outputs:
+                pad = []
+                for dim in reversed(range(1, output.dim())):
+                    diff = reference_shape[dim] - output.shape[dim]
+                    pad += [diff, 0] if padding_side == "left" else [0, diff]
+                padded_outputs.append(torch.nn.functional.pad(output, pad) if any(pad) else output)
+            merged = torch.cat(padded_outputs)
+            return merged if inverse_order is None else merged[inverse_order]
+
+        return {key: merge([p[key] for p in all_predictions]) for key in all_predictions[0].keys()}
+
     def _predict(self, request: PredictionRequest, output_features=False) -> Union[dict, Tuple[dict, dict]]:
         """
         Inference on the input.
@@ -319,6 +552,7 @@ class Transformer(Model):
         self.model.to("cuda" if torch.cuda.is_available() and not model_config.disable_gpu else "cpu")
 
         features = self.tokenizer(request.input, return_tensors="pt", **request.preprocessing_kwargs)
+        self._record_token_lengths(request, features)
         if request.explain_kwargs or request.attack_kwargs:
             self.decoded_texts = [self.decode(tokens, skip_special_tokens=False) for tokens in features["input_ids"]]
             # remove padding tokens in MCQ
@@ -336,49 +570,67 @@ class Transformer(Model):
             ]:
                 request.model_kwargs["output_attentions"] = True
 
-        for start_idx in range(0, len(request.input), model_config.batch_size):
-            with torch.no_grad():
+        batches = self._length_bucketed_batches(features)
+        for batch_indices, batch_length in batches:
+            with self._inference_context():
                 input_features = {
-                    k: features[k][start_idx : start_idx + model_config.batch_size] for k in features.keys()
+                    k: self._trim_padding(features[k][batch_indices], batch_length) for k in features.keys()
                 }
                 input_features = self._ensure_tensor_on_device(**input_features)
                 predictions = self.model(**input_features, **request.model_kwargs)
                 all_predictions.append(predictions)
 
-        keys = all_predictions[0].keys()
-        final_prediction = {}
-        for key in keys:
-            # HuggingFace outputs for 'attentions' and more is
-            # returned as tuple of tensors
-            # Tuple of tuples only exists for 'past_key_values'
-            # which is only relevant for generation.
-            # Generation should NOT use this function
-            if isinstance(all_predictions[0][key], tuple):
-                tuple_of_lists = list(
-                    zip(
-                        *[
-                            [torch.stack(p).cpu() if isinstance(p, tuple) else p.cpu() for p in tpl[key]]
-                            for tpl in all_predictions
-                        ]
-                    )
-                )
-                final_prediction[key] = tuple(torch.cat(l) for l in tuple_of_lists)
-            else:
-                final_prediction[key] = torch.cat([p[key].cpu() for p in all_predictions])
+        # HuggingFace outputs for 'attentions' and more is
+        # returned as tuple of tensors
+        # Tuple of tuples only exists for 'past_key_values'
+        # which is only relevant for generation.
+        # Generation should NOT use this function
+        final_prediction = self._merge_batch_predictions(
+            all_predictions, [batch_indices for batch_indices, _ in batches]
+        )
         if output_features:
             return final_prediction, features
 
         return final_prediction
 
+    def _copies_per_batch(self, request: PredictionRequest, num_copies: int) -> int:
+        """
+        Number of copies of the inputs, e.g. interpolation steps or noise samples, that fit into one batch
+        of model_config.batch_size inputs
+        """
+        return max(1, min(num_copies, model_config.batch_size // max(len(request.input), 1)))
+
     def _interpret(self, request: PredictionRequest, prediction: Dict, method: str, **kwargs):
         """
-        gets the word attributions
+        gets the word attributions, from the attribution cache if the same input was already explained
+        """
+        if not attribution_cache.enabled:
+            return self._compute_attributions(request, prediction, method, **kwargs)
+
+        key = attribution_cache.key(request, method, **kwargs)
+        cached = attribution_cache.get(key)
+        if cached is not None:
+            attributions, gradients = cached
+            if gradients is not None:
+                # hotflip uses the token gradients of the explained input
+                self.gradients = [gradient.to(self.model.device) for gradient in gradients]
+            return attributions
+
+        attributions = self._compute_attributions(request, prediction, method, **kwargs)
+        # the attention attributions are computed without gradients
+        attribution_cache.put(key, attributions, None if method == "attention" else self.gradients)
+        return attributions
+
+    def _compute_attributions(self, request: PredictionRequest, prediction: Dict, method: str, **kwargs):
+        """
+        computes the word attributions
         """
 
         embeddings_list: List[torch.Tensor] = []
         attentions_list: List[torch.Tensor] = []
         grads: Dict[str, Any] = {}
         instances_with_grads: Dict = {}
+        interpret_kwargs = request.explain_kwargs or request.attack_kwargs or {}
 
         if method == "simple_grads":
             # Hook used for saving embeddings
@@ -399,15 +651,18 @@ class Transformer(Model):
         elif method == "integrated_grads":
             # Use 10 terms in the summation approximation of the
             # integral in integrated grad
-            steps = 10
+            steps = int(interpret_kwargs.get("steps", 10))
             # Exclude the endpoint because we do a left point
             # integral approximation
-            for alpha in np.linspace(0, 1.0, num=steps, endpoint=False):
-                handles = []
+            alphas = np.linspace(0, 1.0, num=steps, endpoint=False)
+            # all steps are computed in batches of model_config.batch_size inputs
+            copies_per_batch = self._copies_per_batch(request, steps)
+            for start in range(0, steps, copies_per_batch):
+                batch_alphas = alphas[start : start + copies_per_batch]
                 # Hook for modifying embedding value
-                handles = self._register_hooks(embeddings_list, alpha, method=method)
+                handles = self._register_hooks(embeddings_list, batch_alphas, method=method, copies=len(batch_alphas))
                 try:
-                    gradients = self.get_gradients(request, method, **kwargs)
+                    gradients = self.get_gradients(request, method, copies=len(batch_alphas), **kwargs)
                 finally:
                     for handle in handles:
                         handle.remove()
@@ -435,11 +690,17 @@ class Transformer(Model):
                 grads[key] *= input_embedding
 
         elif method == "smooth_grads":
-            num_samples = 10
-            for _ in range(num_samples):
-                handles = self._register_hooks(embeddings_list, alpha=0, method=method)
+            num_samples = int(interpret_kwargs.get("num_samples", 10))
+            # fixed seed so that explanations are reproducible, each sample gets different noise
+            generator = torch.Generator(device=self.model.device).manual_seed(4)
+            copies_per_batch = self._copies_per_batch(request, num_samples)
+            for start in range(0, num_samples, copies_per_batch):
+                copies = min(copies_per_batch, num_samples - start)
+                handles = self._register_hooks(
+                    embeddings_list, alpha=0, method=method, copies=copies, generator=generator
+                )
                 try:
-                    gradients = self.get_gradients(request, method, **kwargs)
+                    gradients = self.get_gradients(request, method, copies=copies, **kwargs)
                 finally:
                     for handle in handles:
                         handle.remove()
@@ -507,6 +768,26 @@ class Transformer(Model):
         return attributions
 
     def _embedding(self, request: PredictionRequest) -> PredictionOutput:
+        embedding_mode = request.task_kwargs.get("embedding_mode", "mean")
+        embedding_cache = get_embedding_cache()
+        # token embeddings and attentions depend on the padding of the batch, so they are not cached
+        if embedding_cache.enabled and embedding_mode != "token" and not request.model_kwargs.get("output_attentions"):
+
+            def compute(inputs):
+                predictions, _ = self._compute_embedding(request.copy(update={"input": inputs}))
+                return predictions["embeddings"].cpu().numpy()
+
+            embeddings = embedding_cache.embed(request, embedding_mode, compute)
+            return PredictionOutputForEmbedding(model_outputs={"embeddings": embeddings}, embedding_mode=embedding_mode)
+        predictions, task_outputs = self._compute_embedding(request)
+        return PredictionOutputForEmbedding(model_outputs=predictions, **task_outputs)
+
+    def _compute_embedding(self, request: PredictionRequest) -> Tuple[Dict[str, torch.Tensor], Dict[str, Any]]:
+        """
+        Embeds the inputs of the request with the pooling given by the embedding_mode
+        Returns:
+             the model outputs including the 'embeddings' and the task outputs
+        """
         request.model_kwargs["output_hidden_states"] = True
         predictions, features = self._predict(request, output_features=True)
         # We remove hidden_states from predictions!
@@ -535,7 +816,8 @@ class Transformer(Model):
         # copied from sentence-transformers pooling
         elif embedding_mode == "max":
             input_mask_expanded = attention_mask.unsqueeze(-1).expand(hidden_state.size()).float()
-            hidden_state[input_mask_expanded == 0] = -1e9  # Set padding tokens to large negative value
+            # Set padding tokens to large negative value
+            hidden_state = hidden_state.masked_fill(input_mask_expanded == 0, -1e9)
             emb = torch.max(hidden_state, 1)[0]
         # copied from sentence-transformers pooling
         elif embedding_mode == "mean":
@@ -551,7 +833,7 @@ class Transformer(Model):
             print("*****Normalize the embedding*****")
             emb = torch.nn.functional.normalize(emb)
         predictions["embeddings"] = emb
-        return PredictionOutputForEmbedding(model_outputs=predictions, **task_outputs)
+        return predictions, task_outputs
 
     def _token_classification(self, request: PredictionRequest) -> PredictionOutput:
         predictions, features = self._predict(request, output_features=True)
@@ -643,17 +925,20 @@ class Transformer(Model):
             input_ids = self._ensure_tensor_on_device(input_ids=input_ids)["input_ids"]
             request.model_kwargs.update(request.task_kwargs)
             request.model_kwargs["return_dict_in_generate"] = True
-            res = self.model.generate(input_ids, **request.model_kwargs)
+            with self._inference_context():
+                res = self.model.generate(input_ids, **request.model_kwargs)
 
             # put everything on CPU and add it to model_outputs
             for key in res.keys():
                 if isinstance(res[key], tuple):
                     if isinstance(res[key][0], tuple):
-                        res[key] = tuple((tuple(tensor.cpu() for tensor in tpl)) for tpl in res[key])
+                        res[key] = tuple(
+                            (tuple(_bfloat16_to_float(tensor.cpu()) for tensor in tpl)) for tpl in res[key]
+                        )
                     else:
-                        res[key] = tuple(tensor.cpu() for tensor in res[key])
+                        res[key] = tuple(_bfloat16_to_float(tensor.cpu()) for tensor in res[key])
                 else:
-                    res[key] = res[key].cpu()
+                    res[key] = _bfloat16_to_float(res[key].cpu())
                 model_outputs[key].append(res[key])
 
             generated_texts = [
@@ -929,7 +1214,9 @@ class Transformer(Model):
             raise ValueError("is_preprocessed=True is not " "supported for this model. " "Please use text as input.")
         if len(request.input) > model_config.max_input_size:
             raise ValueError(f"Input is too large. Max input size is " f"{model_config.max_input_size}")
+        self._check_cpu_optimization(request)
         self.task = task
+        self.token_lengths = None
         if task == Task.sequence_classification:
             return self._sequence_classification(request)
         elif task == Task.token_classification:
@@ -0,0 +1,217 @@
+"""
+Compact ConceptNet store for the QA-GNN preprocessing.
+
+The graph is kept in CSR format as plain NumPy arrays that are saved as .npy files and memory-mapped on load, so
+workers start in seconds and share the pages of the graph instead of each unpickling a networkx graph.
+Convert the networkx graph once with:
+
+    python -m model_inference.tasks.inference.utils.preprocess.cpnet conceptnet.en.pruned.graph conceptnet.en.pruned.csr
+"""
+import argparse
+import logging
+import os
+from typing import Iterable, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ("indptr", "indices", "relations", "weights", "simple_indptr", "simple_indices")
+
+
+def _to_csr(src: np.ndarray, dst: np.ndarray, n_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sorts the edges by source and target (stable, so parallel edges keep their order) and builds the row pointers
+    Returns:
+        the row pointers and the order of the edges
+    """
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, order
+
+
+def _gather_rows(indptr: np.ndarray, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the index in nodes of the row and the position of all edges in the rows of the given nodes
+    """
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    return np.repeat(np.arange(len(nodes)), lengths), positions
+
+
+class ConceptNetCSR:
+    """
+    ConceptNet as directed multigraph in CSR format. The edges of node u are at positions indptr[u]:indptr[u+1] of
+    indices (target nodes), relations and weights, sorted by target. Additionally, the undirected simple graph
+    (cpnet_simple) is stored as simple_indptr and simple_indices.
+    """
+
+    def __init__(self, indptr, indices, relations, weights, simple_indptr, simple_indices):
+        self.indptr = indptr
+        self.indices = indices
+        self.relations = relations
+        self.weights = weights
+        self.simple_indptr = simple_indptr
+        self.simple_indices = simple_indices
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(
+        cls, src: Iterable[int], dst: Iterable[int], relations: Iterable[int], weights: Iterable[float], n_nodes=None
+    ) -> "ConceptNetCSR":
+        """
+        Args:
+            src: source node of each directed edge
+            dst: target node of each directed edge
+            relations: relation id of each edge
+            weights: weight of each edge
+            n_nodes: number of nodes, defaults to the highest node id + 1
+        """
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        if n_nodes is None:
+            n_nodes = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        indptr, order = _to_csr(src, dst, n_nodes)
+        indices = dst[order].astype(np.int32)
+        relations = np.asarray(relations)[order].astype(np.int16)
+        weights = np.asarray(weights, dtype=np.float32)[order]
+
+        # simple undirected graph: one edge per connected pair, self loops only once
+        loops = src == dst
+        simple_src = np.concatenate([src, dst[~loops]])
+        simple_dst = np.concatenate([dst, src[~loops]])
+        pairs = np.unique(simple_src * n_nodes + simple_dst)
+        simple_src, simple_dst = pairs // n_nodes, pairs % n_nodes
+        simple_indptr, _ = _to_csr(simple_src, simple_dst, n_nodes)
+        return cls(indptr, indices, relations, weights, simple_indptr, simple_dst.astype(np.int32))
+
+    @classmethod
+    def from_networkx(cls, graph) -> "ConceptNetCSR":
+        """
+        Converts the networkx (Multi)(Di)Graph of ConceptNet with integer nodes and the edge attributes rel and weight
+        """
+        edges = list(graph.edges(data=True))
+        src = np.fromiter((u for u, _, _ in edges), dtype=np.int64, count=len(edges))
+        dst = np.fromiter((v for _, v, _ in edges), dtype=np.int64, count=len(edges))
+        relations = np.fromiter((data["rel"] for _, _, data in edges), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((data.get("weight", 1.0) for _, _, data in edges), dtype=np.float32, count=len(edges))
+        n_nodes = max(graph.nodes, default=-1) + 1
+        if not graph.is_directed():
+            # undirected edges can be traversed in both directions
+            loops = src == dst
+            src, dst = np.concatenate([src, dst[~loops]]), np.concatenate([dst, src[~loops]])
+            relations = np.concatenate([relations, relations[~loops]])
+            weights = np.concatenate([weights, weights[~loops]])
+        return cls.from_edges(src, dst, relations, weights, n_nodes=n_nodes)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ConceptNetCSR":
+        """
+        Args:
+            path: directory the graph was saved to
+            mmap: memory-map the arrays instead of reading them into memory
+        """
+        mmap_mode = "r" if mmap else None
+        return cls(*(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAYS))
+
+    def has_node(self, node: int) -> bool:
+        """
+        Whether the node is part of the graph, i.e. has at least one edge
+        """
+        return 0 <= node < self.n_nodes and self.simple_indptr[node + 1] > self.simple_indptr[node]
+
+    def neighbors(self, node: int) -> np.ndarray:
+        """
+        Returns the neighbors of the node in the simple undirected graph
+        """
+        if not 0 <= node < self.n_nodes:
+            return np.empty(0, dtype=self.simple_indices.dtype)
+        return self.simple_indices[self.simple_indptr[node] : self.simple_indptr[node + 1]]
+
+    def _valid(self, nodes) -> np.ndarray:
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return nodes[(nodes >= 0) & (nodes < self.n_nodes)]
+
+    def common_neighbors(self, nodes: Iterable[int]) -> np.ndarray:
+        """
+        Returns the nodes (except the given ones) that are neighbors of at least two of the given nodes
+        """
+        nodes = np.unique(self._valid(list(nodes)))
+        _, positions = _gather_rows(self.simple_indptr, nodes)
+        neighbors, counts = np.unique(self.simple_indices[positions], return_counts=True)
+        return np.setdiff1d(neighbors[counts >= 2], nodes)
+
+    def subgraph_edges(self, nodes: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns all directed edges between the given (unique) nodes
+        Returns:
+            the positions of the source and the target node in nodes and the relation of each edge
+        """
+        nodes = np.asarray(list(nodes), dtype=np.int64)
+        src_pos = np.flatnonzero((nodes >= 0) & (nodes < self.n_nodes))
+        rows, positions = _gather_rows(self.indptr, nodes[src_pos])
+        src_pos, dst = src_pos[rows], self.indices[positions]
+        # look up the targets in the sorted nodes
+        sorter = np.argsort(nodes)
+        dst_pos = np.minimum(np.searchsorted(nodes[sorter], dst), max(len(nodes) - 1, 0))
+        inside = nodes[sorter][dst_pos] == dst
+        return src_pos[inside], sorter[dst_pos[inside]], self.relations[positions[inside]]
+
+    def first_edges(self, src: Iterable[int], dst: Iterable[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Looks up the first edge (as cpnet[u][v][0]) of each node pair
+        Returns:
+            whether the pair is connected, the relation and the weight of the edge
+        """
+        src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+        # pairs with nodes outside the graph would collide with the keys of other pairs
+        valid = (src >= 0) & (src < self.n_nodes) & (dst >= 0) & (dst < self.n_nodes)
+        rows = np.unique(src[valid])
+        row_ids, positions = _gather_rows(self.indptr, rows)
+        # the gathered edges are sorted by (source, target), parallel edges in insertion order
+        keys = rows[row_ids] * self.n_nodes + self.indices[positions]
+        pair_keys = src * self.n_nodes + dst
+        position = np.minimum(np.searchsorted(keys, pair_keys), max(len(keys) - 1, 0))
+        found = valid & (len(keys) > 0)
+        found[found] = keys[position[found]] == pair_keys[found]
+        edges = positions[position[found]]
+        relations = np.zeros(len(src), dtype=self.relations.dtype)
+        weights = np.zeros(len(src), dtype=self.weights.dtype)
+        relations[found], weights[found] = self.relations[edges], self.weights[edges]
+        return found, relations, weights
+
+
+def convert(graph_path: str, output_path: str):
+    """
+    Converts the networkx gpickle of ConceptNet to the CSR store
+    """
+    import networkx as nx
+
+    logger.info(f"Loading {graph_path}")
+    graph = ConceptNetCSR.from_networkx(nx.read_gpickle(graph_path))
+    graph.save(output_path)
+    logger.info(f"Saved {graph.n_nodes} nodes and {graph.n_edges} edges to {output_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Converts the networkx ConceptNet graph to the CSR store")
+    parser.add_argument("graph_path", help="networkx gpickle of ConceptNet, e.g. conceptnet.en.pruned.graph")
+    parser.add_argument("output_path", help="Output directory, e.g. conceptnet.en.pruned.csr")
+    args = parser.parse_args()
+    convert(args.graph_path, args.output_path)
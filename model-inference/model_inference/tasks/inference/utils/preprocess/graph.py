@@ -1,14 +1,12 @@
-import time
+import os
+import weakref
 from collections import OrderedDict
-from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
-
-# from multiprocessing import Pool
-from billiard.pool import Pool
 from scipy.sparse import coo_matrix
-from tqdm import tqdm
+
+from .cache import LRUCache
 
 
 concept2id = None
@@ -16,8 +14,6 @@ id2concept = None
 
 
 cpnet = None
-cpnet_all = None
-cpnet_simple = None
 
 merged_relations = [
     "antonym",
@@ -42,74 +38,99 @@ merged_relations = [
 id2relation = merged_relations
 relation2id = {r: i for i, r in enumerate(id2relation)}
 
+LM_SCORE_BATCH_SIZE = int(os.getenv("LM_SCORE_BATCH_SIZE", 128))
+
 
 def concepts2adj(node_ids):
     cids = np.array(node_ids, dtype=np.int32)
     n_rel = len(id2relation)
     n_node = cids.shape[0]
     adj = np.zeros((n_rel, n_node, n_node), dtype=np.uint8)
-    for s in range(n_node):
-        for t in range(n_node):
-            s_c, t_c = cids[s], cids[t]
-            if cpnet.has_edge(s_c, t_c):
-                for e_attr in cpnet[s_c][t_c].values():
-                    # print("edge attributes:", e_attr)
-                    if e_attr["rel"] >= 0 and e_attr["rel"] < n_rel:
-                        adj[e_attr["rel"]][s][t] = 1
+    s, t, rel = cpnet.subgraph_edges(cids)
+    valid = (rel >= 0) & (rel < n_rel)
+    adj[rel[valid], s[valid], t[valid]] = 1
     # cids += 1  # note!!! index 0 is reserved for padding
     adj = coo_matrix(adj.reshape(-1, n_node))
     return adj, cids
 
 
-def get_LM_score(cids, question, model, tokenizer):
-    cids = cids[:]
-    cids.insert(0, -1)  # QAcontext node
-    sents, scores = [], []
-    sents = [
-        tokenizer.encode(question.lower(), add_special_tokens=True)
-        if cid == -1
-        else tokenizer.encode(
-            "{} {}.".format(question.lower(), " ".join(id2concept[cid].split("_"))),
-            add_special_tokens=True,
-        )
-        for cid in cids
+LM_SCORE_CACHE_SIZE = int(os.getenv("LM_SCORE_CACHE_SIZE", 100000))
+# LM relevance scores of the concept sentences, one cache per LM so that the QA-GNN models sharing a worker
+# process do not get the scores of each other
+lm_score_caches = weakref.WeakKeyDictionary()
+
+
+def _lm_score_cache(model) -> LRUCache:
+    cache = lm_score_caches.get(model)
+    if cache is None:
+        cache = lm_score_caches.setdefault(model, LRUCache(LM_SCORE_CACHE_SIZE))
+    return cache
+
+
+def _concept_sentence(question, cid):
+    if cid == -1:  # QAcontext node
+        return question
+    return "{} {}.".format(question, " ".join(id2concept[cid].split("_")))
+
+
+def score_sentences(sentences, model, tokenizer, batch_size=LM_SCORE_BATCH_SIZE):
+    """
+    Scores the sentences with the negative masked LM loss. The sentences are tokenized in one call and batched
+    by length to minimize padding.
+    """
+    input_ids = tokenizer(sentences, add_special_tokens=True)["input_ids"]
+    order = np.argsort([len(ids) for ids in input_ids], kind="stable")
+    scores = np.empty(len(sentences), dtype=np.float32)
+    device = next(model.parameters()).device
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            idx = order[start : start + batch_size]
+            batch_ids = torch.full((len(idx), len(input_ids[idx[-1]])), tokenizer.pad_token_id, dtype=torch.long)
+            mask = torch.zeros_like(batch_ids)
+            for row, i in enumerate(idx):
+                batch_ids[row, : len(input_ids[i])] = torch.tensor(input_ids[i])
+                mask[row, : len(input_ids[i])] = 1
+            batch_ids, mask = batch_ids.to(device), mask.to(device)
+            outputs = model(batch_ids, attention_mask=mask, masked_lm_labels=batch_ids)
+            scores[idx] = -outputs[0].float().cpu().numpy()  # [B, ]
+    return scores
+
+
+def get_LM_scores(data, model, tokenizer):
+    """
+    Scores the relevance of the concepts for their questions in one pass, e.g. for all answer choices of a question.
+    Scores are cached per model and scored sentence.
+    Args:
+        data: list of (cids, question)
+    Returns:
+        list of OrderedDicts mapping the cids and -1 (QAcontext node) to their score, from high to low
+    """
+    cache = _lm_score_cache(model)
+    keys = [[(question.lower(), cid) for cid in [-1] + list(cids)] for cids, question in data]
+    sentences = {key: _concept_sentence(*key) for example_keys in keys for key in example_keys}
+    scores = {key: cache.get(sentence) for key, sentence in sentences.items()}
+    missing = [key for key, score in scores.items() if score is None]
+    if missing:
+        for key, score in zip(missing, score_sentences([sentences[key] for key in missing], model, tokenizer)):
+            scores[key] = score
+            cache.put(sentences[key], score)
+
+    # score: from high to low
+    return [
+        OrderedDict(sorted(((cid, scores[question, cid]) for question, cid in example_keys), key=lambda x: -x[1]))
+        for example_keys in keys
     ]
-    n_cids = len(cids)
-    # print(n_cids)
-    cur_idx = 0
-    batch_size = 128
-    while cur_idx < n_cids:
-        # Prepare batch
-        input_ids = sents[cur_idx : cur_idx + batch_size]
-        max_len = max([len(seq) for seq in input_ids])
-        for j, seq in enumerate(input_ids):
-            seq += [tokenizer.pad_token_id] * (max_len - len(seq))
-            input_ids[j] = seq
-        input_ids = torch.tensor(input_ids)
-        mask = (input_ids != 1).long()
-        # Get LM score
-        with torch.no_grad():
-            outputs = model(input_ids, attention_mask=mask, masked_lm_labels=input_ids)
-            loss = outputs[0]  # [B, ]
-            _scores = list(-loss.detach().cpu().numpy())
-        scores += _scores
-        cur_idx += batch_size
-    assert len(sents) == len(scores) == len(cids)
-    cid2score = OrderedDict(sorted(list(zip(cids, scores)), key=lambda x: -x[1]))  # score: from high to low
-
-    return cid2score
+
+
+def get_LM_score(cids, question, model, tokenizer):
+    return get_LM_scores([(cids, question)], model, tokenizer)[0]
 
 
 def concepts_to_adj_matrices_part1(data):
     qc_ids, ac_ids, question = data
     qa_nodes = set(qc_ids) | set(ac_ids)
-    extra_nodes = set()
-
-    for qid in qa_nodes:
-        for aid in qa_nodes:
-            if qid != aid and qid in cpnet_simple.nodes and aid in cpnet_simple.nodes:
-                extra_nodes |= set(cpnet_simple[qid]) & set(cpnet_simple[aid])  # list of node ids
-    extra_nodes = extra_nodes - qa_nodes
+    # nodes connected to at least two of the question and answer concepts
+    extra_nodes = set(cpnet.common_neighbors(qa_nodes).tolist())
 
     return (sorted(qc_ids), sorted(ac_ids), question, sorted(extra_nodes))
 
@@ -137,10 +158,8 @@ def generate_adj_data_from_grounded_concepts__use_LM(
     concept2id,
     _cpnet_vocab,
     _cpnet,
-    _cpnet_simple,
     model,
     tokenizer,
-    num_processes=1,
 ):
     """
     This function will save
@@ -155,20 +174,14 @@ def generate_adj_data_from_grounded_concepts__use_LM(
 
     statement_json: json (dict)
     grounded: 5 dicts as
-    cpnet_graph_path: str
-    cpnet_vocab_path: str
-
-    num_processes: int
+    _cpnet_vocab: list of concepts
+    _cpnet: ConceptNetCSR
     """
     # print(concept2id)
     global cpnet
     cpnet = _cpnet
     del _cpnet
 
-    global cpnet_simple
-    cpnet_simple = _cpnet_simple
-    del _cpnet_simple
-
     global id2concept
     id2concept = _cpnet_vocab
     del _cpnet_vocab
@@ -183,23 +196,18 @@ def generate_adj_data_from_grounded_concepts__use_LM(
         QAcontext = "{} {}.".format(statements["question"], ex["ans"])
         qa_data.append((q_ids, a_ids, QAcontext))
 
-    # start = time.time()
-    with Pool(num_processes) as p:
-        res1 = list(tqdm(p.imap(concepts_to_adj_matrices_part1, qa_data), total=len(qa_data)))
-
-    global concepts_to_adj_matrices_part2
-
-    def concepts_to_adj_matrices_part2(data):
-        qc_ids, ac_ids, question, extra_nodes = data
-        cid2score = get_LM_score(qc_ids + ac_ids + extra_nodes, question, model, tokenizer)
-        return (qc_ids, ac_ids, question, extra_nodes, cid2score)
+    # the subgraphs are built with a few array operations on the CSR graph, which is faster than sending the data to
+    # worker processes
+    res1 = [concepts_to_adj_matrices_part1(data) for data in qa_data]
 
-    workers = 5
-    with ThreadPoolExecutor(workers) as pool:
-        res2 = list(pool.map(concepts_to_adj_matrices_part2, res1))
+    # one LM pass for the concepts of all answer choices
+    cid2scores = get_LM_scores(
+        [(qc_ids + ac_ids + extra_nodes, question) for qc_ids, ac_ids, question, extra_nodes in res1],
+        model,
+        tokenizer,
+    )
+    res2 = [(*data, cid2score) for data, cid2score in zip(res1, cid2scores)]
 
-    with Pool(num_processes) as p:
-        res3 = list(tqdm(p.imap(concepts_to_adj_matrices_part3, res2), total=len(res2)))
-    # print(f"concepts_to_adj_matrices_2hop_all_pair__use_LM__Part3 takes {end-start}")
+    res3 = [concepts_to_adj_matrices_part3(data) for data in res2]
 
     return res3
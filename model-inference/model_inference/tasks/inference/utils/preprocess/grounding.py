@@ -1,15 +1,17 @@
-import multiprocessing
+import argparse
+import functools
+import json
+import os
+import pickle
+import weakref
 
 import nltk
-
-# import multiprocessing.pool
-# from multiprocessing import Pool
-from billiard.pool import Pool
-from spacy.matcher import Matcher
 from tqdm import tqdm
 
+from .cache import LRUCache
+
 
-__all__ = ["ground"]
+__all__ = ["ground", "ConceptMatcher"]
 
 # the lemma of it/them/mine/.. is -PRON-
 
@@ -40,31 +42,65 @@ nltk.download("stopwords", quiet=True)
 nltk_stopwords = nltk.corpus.stopwords.words("english")
 
 CPNET_VOCAB = None
+CPNET_CONCEPTS = None
+_cpnet_vocab = None
 PATTERN_PATH = None
 nlp = None
 matcher = None
 
-
-class NoDaemonProcess(multiprocessing.Process):
-    @property
-    def daemon(self):
-        return False
-
-    @daemon.setter
-    def daemon(self, value):
-        pass
-
-
-class NoDaemonContext(type(multiprocessing.get_context())):
-    Process = NoDaemonProcess
-
-
-# We sub-class multiprocessing.pool.Pool instead of multiprocessing.Pool
-# because the latter is only a wrapper function, not a proper class.
-class NestablePool(multiprocessing.pool.Pool):
-    def __init__(self, *args, **kwargs):
-        kwargs["context"] = NoDaemonContext()
-        super(NestablePool, self).__init__(*args, **kwargs)
+GROUNDING_CACHE_SIZE = int(os.getenv("GROUNDING_CACHE_SIZE", 10000))
+# grounded concepts of (statement, answer) pairs, one cache per matcher so that the QA-GNN models sharing a worker
+# process do not get the concepts of each other
+grounding_caches = weakref.WeakKeyDictionary()
+
+
+class ConceptMatcher:
+    """
+    Matches the lemmas of the tokens against the lemma patterns of the ConceptNet concepts.
+    The patterns are indexed by their lemma sequence, so matching takes a few dict lookups
+    per token and the matcher is saved to and loaded from a single pickle.
+    """
+
+    def __init__(self, index: dict):
+        """
+        Args:
+            index: maps the lemma sequences of the patterns to their concepts
+        """
+        self.index = index
+        self.max_length = max(map(len, index), default=0)
+
+    @classmethod
+    def from_patterns(cls, patterns: dict) -> "ConceptMatcher":
+        """
+        Args:
+            patterns: maps the concepts to their spaCy Matcher pattern [{"LEMMA": ...}, ...]
+        """
+        index = {}
+        for concept, pattern in patterns.items():
+            index.setdefault(tuple(token["LEMMA"] for token in pattern), []).append(concept)
+        return cls(index)
+
+    def __call__(self, doc):
+        """
+        Returns:
+            (concept, start, end) for all concepts mentioned in the doc
+        """
+        lemmas = [token.lemma_ for token in doc]
+        matches = []
+        for start in range(len(lemmas)):
+            for end in range(start + 1, min(start + self.max_length, len(lemmas)) + 1):
+                for concept in self.index.get(tuple(lemmas[start:end]), ()):
+                    matches.append((concept, start, end))
+        return matches
+
+    def save(self, path: str):
+        with open(path, "wb") as fout:
+            pickle.dump(self.index, fout, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "ConceptMatcher":
+        with open(path, "rb") as fin:
+            return cls(pickle.load(fin))
 
 
 def create_pattern(nlp, doc, debug=False):
@@ -109,29 +145,35 @@ def create_pattern(nlp, doc, debug=False):
     return pattern
 
 
+@functools.lru_cache(maxsize=100000)
 def lemmatize(nlp, concept):
 
     doc = nlp(concept.replace("_", " "))
-    lcs = set()
-    lcs.add("_".join([token.lemma_ for token in doc]))  # all lemma
+    lcs = frozenset(["_".join([token.lemma_ for token in doc])])  # all lemma
     return lcs
 
 
-def ground_qa_pair(qa_pair):
+def ground_qa_pair(s, a, docs):
+    """
+    Args:
+        s: the statement
+        a: the answer
+        docs: the lowercased statements and answers processed by nlp
+    """
     global nlp, matcher
-    s, a = qa_pair
-    all_concepts = ground_mentioned_concepts(nlp, matcher, s, a)
+    s_doc, a_doc = docs[s.lower()], docs[a.lower()]
+    all_concepts = ground_mentioned_concepts(nlp, matcher, s_doc, a)
     # print("all", all_concepts)
-    answer_concepts = ground_mentioned_concepts(nlp, matcher, a)
+    answer_concepts = ground_mentioned_concepts(nlp, matcher, a_doc)
     # print("ans c", answer_concepts)
     question_concepts = all_concepts - answer_concepts
     # print("ques c", question_concepts)
     if len(question_concepts) == 0:
-        question_concepts = hard_ground(nlp, s, CPNET_VOCAB)  # not very possible
+        question_concepts = hard_ground(s_doc, CPNET_VOCAB)  # not very possible
         # print("ques c new", question_concepts)
 
     if len(answer_concepts) == 0:
-        answer_concepts = hard_ground(nlp, a, CPNET_VOCAB)  # some case
+        answer_concepts = hard_ground(a_doc, CPNET_VOCAB)  # some case
         # print("ans c new", answer_concepts)
 
     # question_concepts = question_concepts -  answer_concepts
@@ -140,35 +182,44 @@ def ground_qa_pair(qa_pair):
     return {"sent": s, "ans": a, "qc": question_concepts, "ac": answer_concepts}
 
 
-def ground_mentioned_concepts(nlp, matcher, s, ans=None):
-    s = s.lower()
-    doc = nlp(s)
+def find_mentions(doc, text_tokens):
+    """
+    Returns the (start, end) token spans of the doc whose lowercased text is text_tokens
+    """
+    doc_tokens = [token.text.lower() for token in doc]
+    n = len(text_tokens)
+    return set(
+        (start, start + n)
+        for start in range(len(doc_tokens) - n + 1)
+        if n > 0 and doc_tokens[start : start + n] == text_tokens
+    )
+
+
+def ground_mentioned_concepts(nlp, matcher, doc, ans=None):
+    """
+    Args:
+        doc: the lowercased sentence processed by nlp
+        ans: the answer, its mentions in the sentence are not grounded
+    """
     matches = matcher(doc)
     mentioned_concepts = set()
     span_to_concepts = {}
 
     if ans is not None:
-        ans_matcher = Matcher(nlp.vocab)
-        ans_matcher.add(ans, [[{"TEXT": token.text.lower()} for token in nlp.tokenizer.pipe(ans)]])
-
-        ans_match = ans_matcher(doc)
-        ans_mentions = set()
-        for _, ans_start, ans_end in ans_match:
-            ans_mentions.add((ans_start, ans_end))
+        ans_mentions = find_mentions(doc, [token.text.lower() for token in nlp.tokenizer(ans)])
 
-    for match_id, start, end in matches:
+    for original_concept, start, end in matches:
         if ans is not None:
             if (start, end) in ans_mentions:
                 continue
 
         span = doc[start:end].text  # the matched span
 
-        original_concept = nlp.vocab.strings[match_id]
         original_concept_set = set()
         original_concept_set.add(original_concept)
 
         if len(original_concept.split("_")) == 1:
-            original_concept_set.update(lemmatize(nlp, nlp.vocab.strings[match_id]))
+            original_concept_set.update(lemmatize(nlp, original_concept))
         if span not in span_to_concepts:
             span_to_concepts[span] = set()
         span_to_concepts[span].update(original_concept_set)
@@ -196,9 +247,7 @@ def ground_mentioned_concepts(nlp, matcher, s, ans=None):
     return mentioned_concepts
 
 
-def hard_ground(nlp, sent, cpnet_vocab):
-    sent = sent.lower()
-    doc = nlp(sent)
+def hard_ground(doc, cpnet_vocab):
     res = set()
     for t in doc:
         if t.lemma_ in cpnet_vocab:
@@ -213,10 +262,30 @@ def hard_ground(nlp, sent, cpnet_vocab):
     return res
 
 
-def match_mentioned_concepts(sents, answers, num_processes):
-    with Pool(num_processes) as p:
-        res = list(tqdm(p.imap(ground_qa_pair, zip(sents, answers)), total=len(sents)))
-    return res
+def _grounding_cache(concept_matcher) -> LRUCache:
+    cache = grounding_caches.get(concept_matcher)
+    if cache is None:
+        cache = grounding_caches.setdefault(concept_matcher, LRUCache(GROUNDING_CACHE_SIZE))
+    return cache
+
+
+def match_mentioned_concepts(sents, answers):
+    """
+    Grounds the (statement, answer) pairs. The texts of the pairs that are not cached are processed
+    with one nlp.pipe call.
+    """
+    cache = _grounding_cache(matcher)
+    pairs = list(zip(sents, answers))
+    res = {pair: cache.get(pair) for pair in pairs}
+    missing = [pair for pair, grounded in res.items() if grounded is None]
+    if missing:
+        texts = list(dict.fromkeys(text.lower() for pair in missing for text in pair))
+        docs = dict(zip(texts, nlp.pipe(texts)))
+        for pair in missing:
+            res[pair] = ground_qa_pair(*pair, docs)
+            cache.put(pair, res[pair])
+    # copies, as prune replaces the concepts of the results
+    return [dict(res[pair]) for pair in pairs]
 
 
 # To-do: examine prune
@@ -264,9 +333,19 @@ def prune(data, cpnet_vocab):
     return prune_data
 
 
-def ground(statement, cpnet_vocab, _nlp, _matcher, num_processes=1, debug=False):
-    global CPNET_VOCAB
-    CPNET_VOCAB = [c.replace("_", " ") for c in cpnet_vocab]
+def _set_cpnet_vocab(cpnet_vocab):
+    """
+    Builds the vocab sets for lookups once instead of on every request
+    """
+    global CPNET_VOCAB, CPNET_CONCEPTS, _cpnet_vocab
+    if cpnet_vocab is not _cpnet_vocab:
+        CPNET_VOCAB = set(c.replace("_", " ") for c in cpnet_vocab)
+        CPNET_CONCEPTS = set(cpnet_vocab)
+        _cpnet_vocab = cpnet_vocab
+
+
+def ground(statement, cpnet_vocab, _nlp, _matcher, debug=False):
+    _set_cpnet_vocab(cpnet_vocab)
 
     sents = []
     answers = []
@@ -285,7 +364,16 @@ def ground(statement, cpnet_vocab, _nlp, _matcher, num_processes=1, debug=False)
             print(answer)
         answers.append(answer)
 
-    res = match_mentioned_concepts(sents, answers, num_processes)
-    res = prune(res, cpnet_vocab)
+    res = match_mentioned_concepts(sents, answers)
+    res = prune(res, CPNET_CONCEPTS)
     print(f"grounding concepts finished ")
     return res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compiles the matcher patterns of the concepts into a ConceptMatcher")
+    parser.add_argument("pattern_path", help="json file with the patterns, e.g. matcher_patterns.json")
+    parser.add_argument("output_path", help="Output file, e.g. matcher.pkl")
+    args = parser.parse_args()
+    with open(args.pattern_path, "r", encoding="utf8") as fin:
+        ConceptMatcher.from_patterns(json.load(fin)).save(args.output_path)
@@ -0,0 +1,135 @@
+import gc
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable, Mapping, Optional
+
+from .config.model_config import model_config
+from .inference.model import Model
+
+
+logger = logging.getLogger(__name__)
+
+# Fields of the model config that decide which weights are loaded. Models that agree on these fields are shared,
+# all other fields (e.g. batch_size) are applied for every request.
+MODEL_FIELDS = [
+    "model_name",
+    "model_type",
+    "model_class",
+    "model_path",
+    "decoder_path",
+    "data_path",
+    "is_encoder_decoder",
+    "onnx_use_quantized",
+    "preloaded_adapters",
+    "disable_gpu",
+    "transformers_cache",
+]
+
+
+def model_key(config: Mapping) -> str:
+    """
+    Computes the key identifying the loaded model for the model config sent with a task
+    """
+    return json.dumps([config.get(field) for field in MODEL_FIELDS])
+
+
+def _resident_memory() -> int:
+    """
+    Resident set size of the worker process in bytes (0 if /proc is not available)
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _model_memory(model: Model) -> Optional[int]:
+    """
+    Size of the weights and buffers of all torch modules of the model in bytes.
+    Returns None for models without torch modules (e.g. ONNX models).
+    """
+    import torch
+
+    modules = [value for value in vars(model).values() if isinstance(value, torch.nn.Module)]
+    if not modules:
+        return None
+    tensors = {}
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            tensors[tensor.data_ptr()] = tensor.numel() * tensor.element_size()
+    return sum(tensors.values())
+
+
+class ModelPool:
+    """
+    Keeps the models of several model identifiers loaded in one worker process. Models are loaded on their first
+    request and the least recently used models are evicted when the loaded models exceed the memory budget.
+    """
+
+    def __init__(self, memory_budget_mb: int, load: Callable[[], Model]):
+        """
+        Args:
+             memory_budget_mb: the memory in MB that the loaded models may use
+             load: function instantiating the model described by the global model config
+        """
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.load = load
+        self.models = OrderedDict()
+        # memory of the models in bytes, kept after eviction to make room before reloading a model
+        self.memory = {}
+
+    def get(self, config: Mapping) -> Model:
+        """
+        Returns the model for the model config sent with a task, loading it if necessary.
+        The config is applied to the global model config that the models read during prediction.
+        Args:
+             config: the model config of the requested model identifier
+        Returns:
+             the loaded model
+        """
+        model_config.update_from_dict(config)
+        key = model_key(config)
+        if key in self.models:
+            self.models.move_to_end(key)
+            return self.models[key]
+
+        self._evict(reserved=self.memory.get(key, 0), keep=0)
+        logger.info(f"Loading model {config.get('model_name')} ({len(self.models)} models loaded)")
+        memory_before = _resident_memory()
+        model = self.load()
+        memory = _model_memory(model)
+        if memory is None:
+            memory = max(_resident_memory() - memory_before, 0)
+        self.models[key] = model
+        self.memory[key] = memory
+        self._evict()
+        return model
+
+    def used_memory(self) -> int:
+        return sum(self.memory[key] for key in self.models)
+
+    def _evict(self, reserved: int = 0, keep: int = 1):
+        """
+        Evicts the least recently used models until the loaded models and the reserved memory fit into the budget.
+        Args:
+             reserved: memory in bytes that is needed for the model that is loaded next
+             keep: the number of most recently used models that are never evicted
+        """
+        evicted = False
+        while len(self.models) > keep and self.used_memory() + reserved > self.memory_budget:
+            key, _ = self.models.popitem(last=False)
+            logger.info(f"Evicting model {json.loads(key)[0]} ({self.memory[key] / 2 ** 20:.0f} MB)")
+            evicted = True
+        if evicted:
+            gc.collect()
+            self._empty_cuda_cache()
+
+    @staticmethod
+    def _empty_cuda_cache():
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
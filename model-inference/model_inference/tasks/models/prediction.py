@@ -1,4 +1,6 @@
 import base64
+from contextlib import contextmanager
+from contextvars import ContextVar
 from io import BytesIO
 from typing import Dict, Iterable, List, Optional, Tuple, Union
 
@@ -8,23 +10,48 @@ from pydantic import BaseModel, Field
 from model_inference.tasks.config.model_config import model_config
 
 
+# Set while predicting requests that asked for binary model outputs (see binary_outputs)
+_binary_outputs = ContextVar("binary_outputs", default=False)
+
+
+@contextmanager
+def binary_outputs(enabled: bool = True):
+    """
+    Context manager in which the model outputs of all created PredictionOutputs are encoded as raw .npy bytes
+    instead of lists or base64 strings. The bytes can only be transported with the msgpack serializer.
+    :param enabled: whether the model outputs are encoded as bytes
+    """
+    token = _binary_outputs.set(enabled)
+    try:
+        yield
+    finally:
+        _binary_outputs.reset(token)
+
+
 def _encode_numpy(
     obj: Dict[str, Union[torch.Tensor, Tuple[torch.Tensor]]],
     return_plaintext: bool = None,
-) -> Dict[str, Union[list, str]]:
+    return_binary: bool = None,
+) -> Dict[str, Union[list, str, bytes]]:
     """
     Encodes the Torch Tensors first to Numpy arrays and then encodes them either as plain lists or base64 string
-    depending on the flag RETURN_PLAINTEXT_ARRAYS
+    depending on the flag RETURN_PLAINTEXT_ARRAYS, or as raw .npy bytes for requests with binary outputs
     :param obj: the objects whose tensors will be encoded
-    :return: the same dictionary with all tensors replaced by lists or base64-encoded array strings.
+    :return: the same dictionary with all tensors replaced by lists, base64-encoded array strings or bytes.
     """
+    if return_binary is None:
+        return_binary = _binary_outputs.get()
     if return_plaintext is None:
         return_plaintext = model_config.return_plaintext_arrays
 
-    # Encode numpy array either as lists or base64 string
+    # Encode numpy array either as lists, bytes or base64 string
     def encode(arr):
         if isinstance(arr, torch.Tensor):
             arr = arr.numpy()
+        if return_binary:
+            with BytesIO() as b:
+                np.save(b, arr)
+                return b.getvalue()
         if return_plaintext:
             return arr.tolist()
         else:
@@ -46,7 +73,7 @@ def _encode_numpy(
         # Stop attempt to encode an already encoded array
         # This can happen because PredictionOutput is initialized twice
         # - once by Model and once when request response is serialized by fastAPI
-        if isinstance(val, int) or isinstance(val, float) or isinstance(val, str):
+        if isinstance(val, int) or isinstance(val, float) or isinstance(val, str) or isinstance(val, bytes):
             raise ValueError("Array is already encoded")
         if isinstance(val, Iterable) and not isinstance(val, torch.Tensor) and not isinstance(val, np.ndarray):
             return [enc_or_iterate(v) for v in val]
@@ -62,6 +89,18 @@ def _encode_numpy(
     return obj
 
 
+def _decode_numpy(arr_string_b64: Union[str, bytes]) -> np.ndarray:
+    """
+    Decodes a base64-encoded (or binary) numpy array created by _encode_numpy back to the numpy array
+    :param arr_string_b64: the base64 string or the bytes of the array
+    :return: the decoded numpy array
+    """
+    if isinstance(arr_string_b64, bytes):
+        return np.load(BytesIO(arr_string_b64))
+    arr_binary = base64.decodebytes(arr_string_b64.encode())
+    return np.load(BytesIO(arr_binary))
+
+
 class PredictionOutput(BaseModel):
     """
     The results of the prediction of the model on the given input for the requested task.
@@ -99,6 +138,11 @@ class PredictionOutput(BaseModel):
         description="Flag indicating that 'model_output' is a base64-encoded numpy array and not a human-readable list."
         "See the field description for 'model_output' on information on how to decode the array.",
     )
+    model_output_is_binary: bool = Field(
+        False,
+        description="Flag indicating that the arrays in 'model_output' are raw .npy bytes (only for requests with "
+        "'binary_outputs' and msgpack responses). Decode them with np.load(BytesIO(arr_binary)).",
+    )
 
     def __init__(self, **data):
         """
@@ -112,7 +156,8 @@ class PredictionOutput(BaseModel):
         """
         super().__init__(**data)
         self.model_outputs = _encode_numpy(self.model_outputs)
-        self.model_output_is_encoded = not model_config.return_plaintext_arrays
+        self.model_output_is_binary = _binary_outputs.get()
+        self.model_output_is_encoded = self.model_output_is_binary or not model_config.return_plaintext_arrays
 
 
 class TokenAttributions(BaseModel):
@@ -3,15 +3,20 @@ import os
 from abc import ABC
 
 from celery import Task
+from celery_batches import Batches
 
+from .batching import group_requests, merge_requests, split_prediction
 from .celery import app
-from .config.model_config import model_config
+from .config.model_config import IDENTIFIER, model_config
+from .embedding_cache import save_statistics, use_embedding_cache
+from .model_pool import ModelPool
 
 # from .inference.adaptertransformer import AdapterTransformer
 # from .inference.onnx import Onnx
 # from .inference.sentencetransformer import SentenceTransformer
 # from .inference.transformer import Transformer
 # from .inference.graph_transformers import GraphTransformers
+from .models.prediction import binary_outputs
 from .models.request import PredictionRequest
 
 
@@ -26,6 +31,83 @@ logger = logging.getLogger(__name__)
 # }
 
 
+def load_model():
+    """
+    Instantiate the model of the configured model type
+    """
+    if model_config.model_type == "transformer":
+        from .inference.transformer import Transformer
+
+        MODEL_MAPPING = {"transformer": Transformer}
+
+    if model_config.model_type == "adapter":
+        from .inference.adaptertransformer import AdapterTransformer
+
+        MODEL_MAPPING = {"adapter": AdapterTransformer}
+
+    if model_config.model_type == "sentence-transformer":
+        from .inference.sentencetransformer import SentenceTransformer
+
+        MODEL_MAPPING = {"sentence-transformer": SentenceTransformer}
+
+    if model_config.model_type == "onnx":
+        from .inference.onnx import Onnx
+
+        MODEL_MAPPING = {"onnx": Onnx}
+
+    if model_config.model_type == "graph":
+        from .inference.graph_transformers import GraphTransformers
+
+        MODEL_MAPPING = {"graph": GraphTransformers}
+
+    if model_config.model_type == "metaqa":
+        from .inference.metaqa import MetaQA
+
+        MODEL_MAPPING = {"metaqa": MetaQA}
+
+    logger.info(model_config)
+    return MODEL_MAPPING[model_config.model_type]()
+
+
+# Workers with a memory budget host the models of all consumed queues and select the model per task
+model_pool = None
+if model_config.model_memory_budget_mb > 0:
+    model_pool = ModelPool(model_config.model_memory_budget_mb, load_model)
+
+
+def _model_identifier(request) -> str:
+    """
+    Identifier of the requested model, i.e. the queue from which the task request was consumed
+    """
+    return (request.delivery_info or {}).get("routing_key") or IDENTIFIER
+
+
+# Identifiers of the models whose accuracy report was stored by this worker process
+_reported_identifiers = set()
+
+
+def _save_accuracy_report(identifier, model):
+    """
+    Stores the accuracy check of the CPU optimization (see Transformer._optimize_for_cpu) next to the model config,
+    so that the API serves it with the model statistics
+    """
+    report = getattr(model, "accuracy_report", None)
+    if report and identifier not in _reported_identifiers:
+        save_statistics(identifier, "accuracy_report", report)
+        _reported_identifiers.add(identifier)
+
+
+def _get_pooled_model(config, request):
+    """
+    Returns the model for the model config sent with the task request and selects the caches of the model
+    """
+    identifier = _model_identifier(request)
+    model = model_pool.get(config)
+    use_embedding_cache(identifier)
+    _save_accuracy_report(identifier, model)
+    return model
+
+
 class ModelTask(Task, ABC):
     """
     Abstraction of Celery's Task class to support providing mongo client.
@@ -42,43 +124,70 @@ class ModelTask(Task, ABC):
         Instantiate mongo client on first call (i.e. first task processed)
         Avoids the creation of multiple clients for each task request
         """
-        model_config.update()
-        logger.info(f"Configuration: {model_config}")
-        if model_config.model_type == "transformer":
-            from .inference.transformer import Transformer
-
-            MODEL_MAPPING = {"transformer": Transformer}
+        if model_pool is None:
+            model_config.update()
+            logger.info(f"Configuration: {model_config}")
+            if not self.model:
+                self.model = load_model()
+                _save_accuracy_report(IDENTIFIER, self.model)
+        return self.run(*args, **kwargs)
 
-        if model_config.model_type == "adapter":
-            from .inference.adaptertransformer import AdapterTransformer
+    def get_model(self, config):
+        """
+        Returns the model for the model config sent with the task
+        """
+        if model_pool is not None:
+            return _get_pooled_model(config, self.request)
+        return self.model
 
-            MODEL_MAPPING = {"adapter": AdapterTransformer}
 
-        if model_config.model_type == "sentence-transformer":
-            from .inference.sentencetransformer import SentenceTransformer
+class BatchedModelTask(Batches):
+    """
+    Abstraction of celery-batches' Batches class that buffers the queued prediction requests
+    and provides the model for processing them as micro-batches.
+    """
 
-            MODEL_MAPPING = {"sentence-transformer": SentenceTransformer}
+    abstract = True
 
-        if model_config.model_type == "onnx":
-            from .inference.onnx import Onnx
+    def __init__(self):
+        super().__init__()
+        self.model = None
 
-            MODEL_MAPPING = {"onnx": Onnx}
+    def __call__(self, *args, **kwargs):
+        """
+        Instantiate the model on first call (i.e. first micro-batch processed)
+        """
+        if model_pool is None:
+            model_config.update()
+            logger.info(f"Configuration: {model_config}")
+            if not self.model:
+                self.model = load_model()
+                _save_accuracy_report(IDENTIFIER, self.model)
+        return self.run(*args, **kwargs)
 
-        if model_config.model_type == "graph":
-            from .inference.graph_transformers import GraphTransformers
+    def get_model(self, request):
+        """
+        Returns the model for the model config sent with the buffered request
+        """
+        if model_pool is not None:
+            return _get_pooled_model(request.args[2], request)
+        return self.model
 
-            MODEL_MAPPING = {"graph": GraphTransformers}
 
-        if model_config.model_type == "metaqa":
-            from .inference.metaqa import MetaQA
+if model_config.micro_batch_window_ms > 0:
+    # the worker has to prefetch enough messages to be able to fill a micro-batch
+    app.conf.worker_prefetch_multiplier = max(
+        app.conf.worker_prefetch_multiplier, model_config.micro_batch_max_requests
+    )
 
-            MODEL_MAPPING = {"metaqa": MetaQA}
 
-        if not self.model:
-            logger.info(model_config)
-            model_instance = MODEL_MAPPING[model_config.model_type]()
-            self.model = model_instance
-        return self.run(*args, **kwargs)
+def _binary_outputs(prediction_request):
+    """
+    Binary model outputs are only returned if the results are stored with msgpack, JSON cannot encode bytes
+    """
+    return binary_outputs(
+        prediction_request.get("binary_outputs", False) and app.conf.result_serializer == "msgpack"
+    )
 
 
 @app.task(
@@ -88,6 +197,66 @@ class ModelTask(Task, ABC):
 def prediction_task(self, prediction_request, task, model_config):
     logger.info(f"Prediction Request: {prediction_request} for task {task}")
     logger.info(model_config)
-    prediction = self.model.predict(PredictionRequest(**prediction_request), task)
+    model = self.get_model(model_config)
+    with _binary_outputs(prediction_request):
+        prediction = model.predict(PredictionRequest(**prediction_request), task)
     logger.info(f"Prediction: {prediction}")
     return prediction.dict()
+
+
+def _predict_single(batched_task, request):
+    """
+    Runs the prediction for a single buffered request and stores its result in the result backend
+    """
+    prediction_request, task = request.args[0], request.args[1]
+    try:
+        model = batched_task.get_model(request)
+        with _binary_outputs(prediction_request):
+            prediction = model.predict(PredictionRequest(**prediction_request), task)
+    except Exception as err:
+        logger.exception(f"Prediction for task {request.id} failed")
+        app.backend.mark_as_failure(request.id, err, request=request, call_errbacks=False)
+        return
+    app.backend.mark_as_done(request.id, prediction.dict(), request=request)
+
+
+@app.task(
+    bind=True,
+    base=BatchedModelTask,
+    flush_every=model_config.micro_batch_max_requests,
+    flush_interval=max(model_config.micro_batch_window_ms, 1) / 1000,
+)
+def batched_prediction_task(self, requests):
+    """
+    Processes the requests buffered within the micro-batch window. Compatible requests (same task, adapter and
+    kwargs) are merged into one forward pass and the results are split back per task id.
+    """
+    logger.info(f"Micro-batch with {len(requests)} requests")
+    for group in group_requests(requests, model_config.max_input_size):
+        if len(group) == 1:
+            _predict_single(self, group[0])
+            continue
+
+        prediction_requests = [request.args[0] for request in group]
+        task = group[0].args[1]
+        try:
+            merged_request = merge_requests(prediction_requests)
+            model = self.get_model(group[0])
+            with _binary_outputs(merged_request):
+                prediction = model.predict(PredictionRequest(**merged_request), task)
+            # token-level outputs are cut back to the padding length of each request
+            predictions = split_prediction(
+                prediction.dict(),
+                [len(prediction_request["input"]) for prediction_request in prediction_requests],
+                getattr(model, "token_lengths", None),
+                getattr(getattr(model, "tokenizer", None), "padding_side", "right"),
+            )
+        except Exception:
+            # do not let a single malformed request fail all requests of the micro-batch
+            logger.exception(f"Merged prediction of {len(group)} requests failed. Processing them separately")
+            for request in group:
+                _predict_single(self, request)
+            continue
+
+        for request, request_prediction in zip(group, predictions):
+            app.backend.mark_as_done(request.id, request_prediction, request=request)
@@ -1,7 +1,14 @@
+import asyncio
+import base64
+from types import SimpleNamespace
 from unittest.mock import patch
 
+import msgpack
 from celery.result import AsyncResult
 from starlette.testclient import TestClient
+from model_inference.app.api.routes import prediction
+from model_inference.tasks import tasks
+from model_inference.tasks.config.model_config import ModelConfig
 from model_inference.tasks.models.request import Task
 
 
@@ -115,3 +122,88 @@ def test_api_statistics(test_app) -> None:
     # assert response.json()["model_name"] == "bert-base-uncased"
     assert response.json()["max_input"] == 512
     assert response.status_code == 200
+
+
+def test_api_statistics_serve_the_accuracy_report(test_app, monkeypatch) -> None:
+    test_client = TestClient(test_app)
+    cpu_optimization = ModelConfig.load_from_file(identifier).cpu_optimization
+    report = {"cpu_optimization": cpu_optimization, "max_abs_diff": 0.01, "argmax_agreement": 1.0}
+    monkeypatch.setattr(tasks, "_reported_identifiers", set())
+    tasks._save_accuracy_report(identifier, SimpleNamespace(accuracy_report={**report, "cpu_optimization": "stale"}))
+    assert test_client.get(f"/api/{identifier}/stats").json()["cpu_optimization_report"] is None
+
+    monkeypatch.setattr(tasks, "_reported_identifiers", set())
+    tasks._save_accuracy_report(identifier, SimpleNamespace(accuracy_report=report))
+    assert test_client.get(f"/api/{identifier}/stats").json()["cpu_optimization_report"] == report
+
+
+@patch("celery.result.AsyncResult.ready", return_value=False)
+def test_api_task_result_processing(test_ready, test_app) -> None:
+    test_client = TestClient(test_app)
+    response = test_client.get("/api/task_result/123")
+    assert response.status_code == 202
+    assert response.json()["status"] == "Processing"
+
+
+@patch("celery.result.AsyncResult.get", return_value={"labels": [1]})
+@patch("celery.result.AsyncResult.ready", side_effect=[False, True, True])
+def test_api_task_result_wait(test_ready, test_get, test_app) -> None:
+    test_client = TestClient(test_app)
+    response = test_client.get("/api/task_result/123", params={"wait": True, "timeout": 5})
+    assert test_get.call_args_list[0][1] == {"timeout": 5, "propagate": False}
+    assert response.status_code == 200
+    assert response.json() == {"task_id": "123", "status": "Finished", "result": {"labels": [1]}}
+
+
+@patch("celery.result.AsyncResult.get", return_value={"labels": [1]})
+@patch("celery.result.AsyncResult.ready", side_effect=[False, False, True, True])
+def test_api_task_result_wait_polls_without_free_waiter(test_ready, test_get, test_app, monkeypatch) -> None:
+    monkeypatch.setattr(prediction, "task_result_waiters", asyncio.Semaphore(0))
+    monkeypatch.setattr(prediction, "TASK_RESULT_POLL_INTERVAL", 0.01)
+    test_client = TestClient(test_app)
+    response = test_client.get("/api/task_result/123", params={"wait": True, "timeout": 5})
+    # the result is only fetched once the task is finished instead of blocking in AsyncResult.get
+    assert test_get.call_args_list[0][1] == {}
+    assert response.status_code == 200
+    assert response.json()["result"] == {"labels": [1]}
+
+
+_binary_result = {"model_outputs": {"logits": b"\x93NUMPY"}, "model_output_is_binary": True}
+
+
+@patch("celery.result.AsyncResult.get", return_value=_binary_result)
+@patch("celery.result.AsyncResult.ready", return_value=True)
+def test_api_task_result_msgpack(test_ready, test_get, test_app) -> None:
+    test_client = TestClient(test_app)
+    response = test_client.get("/api/task_result/123", headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(response.content)["result"] == _binary_result
+
+    # clients without msgpack support receive the arrays base64-encoded
+    response = test_client.get("/api/task_result/123")
+    result = response.json()["result"]
+    assert result["model_output_is_binary"] is False
+    assert base64.b64decode(result["model_outputs"]["logits"]) == b"\x93NUMPY"
+
+
+def test_api_task_result_wait_timeout_too_large(test_app) -> None:
+    test_client = TestClient(test_app)
+    response = test_client.get("/api/task_result/123", params={"wait": True, "timeout": 3600})
+    assert response.status_code == 422
+
+
+def test_api_update_onnx_session_options(test_app) -> None:
+    test_client = TestClient(test_app)
+    update = {"disable_gpu": True, "batch_size": 8, "max_input": 512, "return_plaintext_arrays": False}
+    response = test_client.post(
+        f"/api/{identifier}/update",
+        json={**update, "onnx_intra_op_num_threads": 4, "onnx_execution_mode": "parallel"},
+    )
+    assert response.status_code == 200
+    assert response.json()["onnx_intra_op_num_threads"] == 4
+    assert response.json()["onnx_execution_mode"] == "parallel"
+    assert response.json()["max_input"] == 512
+
+    response = test_client.post(f"/api/{identifier}/update", json={**update, "onnx_execution_mode": "threaded"})
+    assert response.status_code == 400
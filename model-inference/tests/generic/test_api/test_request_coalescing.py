@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from celery.result import AsyncResult
+from starlette.testclient import TestClient
+from model_inference.app.core.request_coalescing import RequestCoalescer
+
+
+identifier = "test_config"
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode()
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def get_coalescer(ttl=5, result_ttl=0):
+    coalescer = RequestCoalescer(ttl=0, result_ttl=result_ttl)
+    coalescer.ttl = ttl
+    coalescer.redis = FakeRedis()
+    return coalescer
+
+
+def fake_result(ready, successful=True, date_done=None):
+    result = MagicMock()
+    result.ready.return_value = ready
+    result.successful.return_value = successful
+    result.date_done = date_done
+    return result
+
+
+def test_request_key():
+    request = {"input": ["a"], "task_kwargs": {"topk": 1, "x": 2}}
+    key = RequestCoalescer.request_key(identifier, "embedding", request, {"batch_size": 1})
+    reordered = {"task_kwargs": {"x": 2, "topk": 1}, "input": ["a"]}
+    assert key == RequestCoalescer.request_key(identifier, "embedding", reordered, {"batch_size": 1})
+    assert key != RequestCoalescer.request_key(identifier, "embedding", {"input": ["b"]}, {"batch_size": 1})
+    assert key != RequestCoalescer.request_key(identifier, "generation", request, {"batch_size": 1})
+
+
+def test_attach_to_queued_task():
+    coalescer = get_coalescer()
+    enqueue = MagicMock()
+    task_id, attached = coalescer.submit("key", enqueue)
+    assert not attached
+    enqueue.assert_called_once_with(task_id)
+
+    with patch("model_inference.app.core.request_coalescing.AsyncResult", return_value=fake_result(ready=False)):
+        duplicate_id, attached = coalescer.submit("key", enqueue)
+    assert attached
+    assert duplicate_id == task_id
+    assert enqueue.call_count == 1
+
+
+def test_finished_task_is_not_reused_without_result_cache():
+    coalescer = get_coalescer()
+    enqueue = MagicMock()
+    task_id, _ = coalescer.submit("key", enqueue)
+    finished = fake_result(ready=True, date_done=datetime.now(timezone.utc))
+    with patch("model_inference.app.core.request_coalescing.AsyncResult", return_value=finished):
+        new_id, attached = coalescer.submit("key", enqueue)
+    assert not attached
+    assert new_id != task_id
+    assert enqueue.call_count == 2
+
+
+def test_result_cache():
+    coalescer = get_coalescer(result_ttl=10)
+    enqueue = MagicMock()
+    task_id, _ = coalescer.submit("key", enqueue)
+    recent = fake_result(ready=True, date_done=datetime.now(timezone.utc) - timedelta(seconds=5))
+    with patch("model_inference.app.core.request_coalescing.AsyncResult", return_value=recent):
+        assert coalescer.submit("key", enqueue) == (task_id, True)
+    # results of failed tasks and expired results are not reused
+    failed = fake_result(ready=True, successful=False, date_done=datetime.now(timezone.utc))
+    with patch("model_inference.app.core.request_coalescing.AsyncResult", return_value=failed):
+        assert not coalescer.submit("key", enqueue)[1]
+    expired = fake_result(ready=True, date_done=datetime.now(timezone.utc) - timedelta(seconds=20))
+    with patch("model_inference.app.core.request_coalescing.AsyncResult", return_value=expired):
+        assert not coalescer.submit("key", enqueue)[1]
+
+
+@patch("celery.app.task.Task.apply_async", return_value=AsyncResult(123))
+def test_api_coalesces_identical_requests(test_task, test_app) -> None:
+    coalescer = get_coalescer()
+    request = {"input": ["this is a test"], "is_preprocessed": False, "adapter_name": ""}
+    with patch("model_inference.app.api.routes.prediction.get_request_coalescer", return_value=coalescer), patch(
+        "model_inference.app.core.request_coalescing.AsyncResult", return_value=fake_result(ready=False)
+    ):
+        test_client = TestClient(test_app)
+        first = test_client.post(f"/api/{identifier}/embedding", json=request)
+        second = test_client.post(f"/api/{identifier}/embedding", json=request)
+    assert first.status_code == 200
+    assert first.json()["task_id"] == second.json()["task_id"]
+    assert test_task.call_count == 1
+    assert test_task.call_args[1] == {"queue": identifier, "task_id": first.json()["task_id"]}
@@ -0,0 +1,74 @@
+import torch
+from model_inference.tasks import embedding_cache
+from model_inference.tasks.attribution_cache import AttributionCache, load_statistics
+from model_inference.tasks.models.request import PredictionRequest
+
+
+def _request(input, **explain_kwargs):
+    return PredictionRequest(
+        input=input,
+        is_preprocessed=False,
+        preprocessing_kwargs={},
+        model_kwargs={},
+        task_kwargs={},
+        explain_kwargs={"method": "integrated_grads", "top_k": 10, "mode": "all", **explain_kwargs},
+        attack_kwargs={},
+        adapter_name="",
+    )
+
+
+def test_key_ignores_visualization_kwargs() -> None:
+    cache = AttributionCache(max_size=10)
+    labels = torch.tensor([1])
+    key = cache.key(_request(["a"]), "integrated_grads", labels=labels)
+    assert key == cache.key(_request(["a"], top_k=3, mode="question"), "integrated_grads", labels=labels)
+    assert key != cache.key(_request(["b"]), "integrated_grads", labels=labels)
+    assert key != cache.key(_request(["a"]), "simple_grads", labels=labels)
+    assert key != cache.key(_request(["a"], steps=20), "integrated_grads", labels=labels)
+    assert key != cache.key(_request(["a"]), "integrated_grads", labels=torch.tensor([0]))
+
+
+def test_cached_attributions_are_copies() -> None:
+    cache = AttributionCache(max_size=10)
+    gradients = [torch.ones(1, 3, 2)]
+    cache.put("key", [[0.5, 0.5]], gradients)
+    attributions, cached_gradients = cache.get("key")
+    attributions[0][0] = 1.0
+
+    assert cache.get("key")[0] == [[0.5, 0.5]]
+    assert torch.equal(cached_gradients[0], gradients[0])
+    assert cache.get("other") is None
+    assert cache.statistics() == {"hits": 2, "misses": 1, "evictions": 0, "size": 1, "max_size": 10}
+
+
+def test_lru_eviction() -> None:
+    cache = AttributionCache(max_size=2)
+    cache.put("a", [[1.0]], None)
+    cache.put("b", [[1.0]], None)
+    cache.get("a")
+    cache.put("c", [[1.0]], None)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+
+
+def test_statistics_are_loaded_for_the_api(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(embedding_cache, "CONFIG_PATH", str(tmp_path))
+    cache = AttributionCache(max_size=1, identifier="test-model")
+    assert load_statistics("test-model") is None
+
+    cache.put("a", [[1.0]], None)
+    cache.put("b", [[1.0]], None)
+    cache.get("b")
+    cache.get("a")
+    cache.write_statistics(force=True)
+
+    assert load_statistics("test-model") == {
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+        "size": 1,
+        "max_size": 1,
+        "hit_rate": 0.5,
+    }
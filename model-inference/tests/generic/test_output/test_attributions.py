@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+import torch
+from model_inference.tasks.attribution_cache import AttributionCache, attribution_cache
+from model_inference.tasks.config.model_config import model_config, set_test_config
+from model_inference.tasks.inference import transformer as transformer_module
+from model_inference.tasks.inference.transformer import Transformer
+from model_inference.tasks.models.request import PredictionRequest
+from transformers import BertConfig, BertForSequenceClassification, BertTokenizerFast
+
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "a", "dog", "cat", "is", "red", "blue", "sky"]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tiny_bert")
+    (path / "vocab.txt").write_text("\n".join(VOCAB))
+    BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(str(path))
+    torch.manual_seed(987654321)
+    # the embeddings of an input are no multiple of 16 values, so torch.randn draws different noise for one
+    # batch of copies than for each copy on its own
+    config = BertConfig(
+        vocab_size=len(VOCAB), hidden_size=18, num_hidden_layers=2, num_attention_heads=2, intermediate_size=32
+    )
+    BertForSequenceClassification(config).save_pretrained(str(path))
+    return str(path)
+
+
+@pytest.fixture()
+def tiny_transformer(tiny_model_path, monkeypatch):
+    config = model_config.to_dict()
+    # every explanation is computed, the attribution cache is tested separately
+    monkeypatch.setattr(attribution_cache, "max_size", 0)
+    set_test_config(
+        model_name=tiny_model_path,
+        model_class="sequence_classification",
+        disable_gpu=True,
+        batch_size=1,
+        max_input_size=50,
+        model_type="transformer",
+    )
+    transformer = Transformer()
+    transformer.model.eval()
+    yield transformer
+    model_config.update_from_dict(config)
+
+
+def _attributions(transformer, batch_size, method, input=("the dog is red",), **explain_kwargs):
+    model_config.batch_size = batch_size
+    request = PredictionRequest(
+        input=list(input),
+        is_preprocessed=False,
+        preprocessing_kwargs={},
+        model_kwargs={},
+        task_kwargs={},
+        explain_kwargs={"method": method, **explain_kwargs},
+        attack_kwargs={},
+        adapter_name="",
+    )
+    return transformer._interpret(request, {}, method, labels=torch.tensor([1]))
+
+
+def test_batched_integrated_grads_match_one_step_per_pass(tiny_transformer) -> None:
+    # 7 steps in batches of 3 copies leave a last batch with a single step
+    expected = _attributions(tiny_transformer, 1, "integrated_grads", steps=7)
+    batched = _attributions(tiny_transformer, 3, "integrated_grads", steps=7)
+
+    np.testing.assert_allclose(batched, expected, rtol=1e-4, atol=1e-6)
+
+
+def _smooth_grads_gradients(transformer, monkeypatch, batch_size):
+    gradients = []
+
+    def get_gradients(*args, **kwargs):
+        output = Transformer.get_gradients(transformer, *args, **kwargs)
+        gradients.append(output["grad_input_1"].copy())
+        return output
+
+    monkeypatch.setattr(transformer, "get_gradients", get_gradients)
+    _attributions(transformer, batch_size, "smooth_grads", num_samples=5)
+    return sum(gradients)
+
+
+def test_smooth_grads_do_not_depend_on_batch_size(tiny_transformer, monkeypatch) -> None:
+    # the gradients are compared because the word attributions of the random tiny model sum to almost 0
+    expected = _smooth_grads_gradients(tiny_transformer, monkeypatch, 1)
+    batched = _smooth_grads_gradients(tiny_transformer, monkeypatch, 2)
+
+    np.testing.assert_allclose(batched, expected, rtol=1e-4, atol=1e-6)
+
+
+def test_cached_attributions_restore_gradients_for_hotflip(tiny_transformer, monkeypatch) -> None:
+    cache = AttributionCache(max_size=10, identifier=None)
+    monkeypatch.setattr(transformer_module, "attribution_cache", cache)
+    attributions = _attributions(tiny_transformer, 1, "simple_grads")
+    gradients = tiny_transformer.gradients
+    _attributions(tiny_transformer, 1, "simple_grads", input=("the cat is blue",))
+
+    def get_gradients(*args, **kwargs):
+        raise AssertionError("cached attributions must not compute gradients")
+
+    monkeypatch.setattr(tiny_transformer, "get_gradients", get_gradients)
+    assert _attributions(tiny_transformer, 1, "simple_grads") == attributions
+    assert cache.hits == 1
+    # hotflip attacks the explained input with its token gradients
+    torch.testing.assert_close(tiny_transformer.gradients[0], gradients[0])
@@ -0,0 +1,81 @@
+import numpy as np
+from model_inference.tasks import embedding_cache
+from model_inference.tasks.config.model_config import model_config
+from model_inference.tasks.embedding_cache import EmbeddingCache, get_embedding_cache, use_embedding_cache
+from model_inference.tasks.models.request import PredictionRequest
+
+
+def _request(input, **task_kwargs):
+    return PredictionRequest(
+        input=input,
+        is_preprocessed=False,
+        preprocessing_kwargs={},
+        model_kwargs={},
+        task_kwargs=task_kwargs,
+        explain_kwargs={},
+        attack_kwargs={},
+        adapter_name="",
+    )
+
+
+class Encoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, inputs):
+        self.calls.append(inputs)
+        return np.array([[len(text), 1.0] for text in inputs], dtype="float32")
+
+
+def test_only_cache_misses_are_embedded() -> None:
+    cache = EmbeddingCache(max_size=10, identifier=None)
+    encoder = Encoder()
+
+    first = cache.embed(_request(["a", "bb"]), "mean", encoder)
+    second = cache.embed(_request(["bb", " a ", "ccc"]), "mean", encoder)
+
+    assert encoder.calls == [["a", "bb"], ["ccc"]]
+    np.testing.assert_equal(second[:2], first[::-1])
+    assert cache.statistics() == {"hits": 2, "misses": 3, "evictions": 0, "size": 3, "max_size": 10}
+
+
+def test_key_depends_on_embedding_mode() -> None:
+    cache = EmbeddingCache(max_size=10, identifier=None)
+    assert cache.key(_request(["a"]), "mean", "a") != cache.key(_request(["a"]), "cls", "a")
+    assert cache.key(_request(["a"]), "mean", "a") != cache.key(_request(["a"], normalize=True), "mean", "a")
+
+
+def test_lru_eviction() -> None:
+    cache = EmbeddingCache(max_size=2, identifier=None)
+    encoder = Encoder()
+    cache.embed(_request(["a", "b"]), "mean", encoder)
+    cache.embed(_request(["a"]), "mean", encoder)
+    cache.embed(_request(["c"]), "mean", encoder)
+    cache.embed(_request(["a", "b"]), "mean", encoder)
+
+    assert encoder.calls == [["a", "b"], ["c"], ["b"]]
+    assert cache.evictions == 2
+
+
+def test_cached_embeddings_do_not_keep_the_batch() -> None:
+    cache = EmbeddingCache(max_size=10, identifier=None)
+    batch = np.zeros((2, 1024), dtype="float32")
+    cache.embed(_request(["a", "b"]), "mean", lambda inputs: batch)
+
+    assert all(not np.shares_memory(embedding, batch) for embedding in cache.entries.values())
+
+
+def test_embedding_caches_per_model(monkeypatch) -> None:
+    monkeypatch.setattr(embedding_cache, "_embedding_caches", {})
+    monkeypatch.setattr(embedding_cache, "_identifier", None)
+    monkeypatch.setattr(model_config, "embedding_cache_size", 10)
+    use_embedding_cache("model-a")
+    cache_a = get_embedding_cache()
+    monkeypatch.setattr(model_config, "embedding_cache_size", 20)
+    use_embedding_cache("model-b")
+    cache_b = get_embedding_cache()
+    use_embedding_cache("model-a")
+
+    assert get_embedding_cache() is cache_a
+    assert (cache_a.identifier, cache_a.max_size) == ("model-a", 10)
+    assert (cache_b.identifier, cache_b.max_size) == ("model-b", 20)
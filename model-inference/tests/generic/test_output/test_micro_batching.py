@@ -0,0 +1,155 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from model_inference.tasks.batching import group_requests, merge_requests, split_prediction
+from model_inference.tasks.config.model_config import model_config, set_test_config
+from model_inference.tasks.inference.transformer import Transformer
+from model_inference.tasks.models.prediction import (
+    PredictionOutputForQuestionAnswering,
+    PredictionOutputForTokenClassification,
+    _decode_numpy,
+    binary_outputs,
+)
+from model_inference.tasks.models.request import PredictionRequest, Task
+from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+
+def _request(input, task=Task.embedding, **kwargs):
+    prediction_request = {
+        "input": input,
+        "is_preprocessed": False,
+        "preprocessing_kwargs": {},
+        "model_kwargs": {},
+        "task_kwargs": {},
+        "explain_kwargs": {},
+        "attack_kwargs": {},
+        "adapter_name": "",
+    }
+    prediction_request.update(kwargs)
+    return SimpleNamespace(args=(prediction_request, task, {}))
+
+
+def test_group_compatible_requests() -> None:
+    requests = [
+        _request(["a"]),
+        _request(["b", "c"]),
+        _request(["d"], task_kwargs={"embedding_mode": "cls"}),
+        _request(["e"], explain_kwargs={"method": "simple_grads"}),
+        _request(["f"], task=Task.sequence_classification),
+    ]
+    groups = group_requests(requests, max_input_size=10)
+
+    assert [len(group) for group in groups] == [2, 1, 1, 1]
+    assert groups[0] == requests[:2]
+
+
+def test_group_respects_max_input_size() -> None:
+    requests = [_request(["a", "b"]), _request(["c", "d"]), _request(["e"])]
+    groups = group_requests(requests, max_input_size=4)
+
+    assert [len(group) for group in groups] == [2, 1]
+
+
+def test_merge_and_split_prediction() -> None:
+    prediction_requests = [_request(["a"]).args[0], _request(["b", "c"]).args[0]]
+    merged = merge_requests(prediction_requests)
+    assert merged["input"] == ["a", "b", "c"]
+
+    logits = np.arange(12, dtype="float32").reshape(3, 4)
+    prediction = PredictionOutputForQuestionAnswering(
+        model_outputs={"start_logits": torch.from_numpy(logits)},
+        answers=[[{"score": i, "start": 0, "end": 1, "answer": str(i)}] for i in range(3)],
+    ).dict()
+    first, second = split_prediction(prediction, [1, 2])
+
+    for split, expected in [(first, logits[:1]), (second, logits[1:])]:
+        start_logits = split["model_outputs"]["start_logits"]
+        if split["model_output_is_encoded"]:
+            start_logits = _decode_numpy(start_logits)
+        np.testing.assert_equal(np.array(start_logits), expected)
+    assert [answers[0]["answer"] for answers in first["answers"]] == ["0"]
+    assert [answers[0]["answer"] for answers in second["answers"]] == ["1", "2"]
+
+
+def test_split_binary_prediction() -> None:
+    logits = np.arange(12, dtype="float32").reshape(3, 4)
+    with binary_outputs():
+        prediction = PredictionOutputForQuestionAnswering(
+            model_outputs={"start_logits": torch.from_numpy(logits)},
+            answers=[[{"score": i, "start": 0, "end": 1, "answer": str(i)}] for i in range(3)],
+        ).dict()
+    assert prediction["model_output_is_binary"]
+    first, second = split_prediction(prediction, [1, 2])
+
+    for split, expected in [(first, logits[:1]), (second, logits[1:])]:
+        start_logits = split["model_outputs"]["start_logits"]
+        assert isinstance(start_logits, bytes)
+        np.testing.assert_equal(_decode_numpy(start_logits), expected)
+
+
+@pytest.mark.parametrize("padding_side", ["right", "left"])
+def test_split_prediction_removes_the_padding_of_the_micro_batch(padding_side) -> None:
+    logits = np.arange(24, dtype="float32").reshape(3, 4, 2)
+    word_ids = [[None, 0, None, None], [None, 0, 1, None], [None, 0, 1, None]]
+    if padding_side == "left":
+        word_ids = [[None, None, 0, None], word_ids[1], word_ids[2]]
+    prediction = PredictionOutputForTokenClassification(
+        model_outputs={"logits": torch.from_numpy(logits)}, labels=[[0] * 4] * 3, word_ids=word_ids
+    ).dict()
+    first, second = split_prediction(prediction, [1, 2], token_lengths=[3, 4, 2], padding_side=padding_side)
+
+    first_logits = first["model_outputs"]["logits"]
+    if first["model_output_is_encoded"]:
+        first_logits = _decode_numpy(first_logits)
+    expected = logits[:1, 1:] if padding_side == "left" else logits[:1, :3]
+    np.testing.assert_equal(np.array(first_logits), expected)
+    assert first["word_ids"] == [[None, 0, None]]
+    assert first["labels"] == [[0] * 3]
+    # the second request keeps the length of its longest input
+    assert second["word_ids"] == word_ids[1:]
+
+
+VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "the", "a", "dog", "cat", "is", "red", "blue", "sky"]
+
+
+@pytest.fixture()
+def tiny_token_classifier(tmp_path):
+    (tmp_path / "vocab.txt").write_text("\n".join(VOCAB))
+    BertTokenizerFast(str(tmp_path / "vocab.txt")).save_pretrained(str(tmp_path))
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(VOCAB), hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32
+    )
+    BertForTokenClassification(config).save_pretrained(str(tmp_path))
+    previous_config = model_config.to_dict()
+    set_test_config(
+        model_name=str(tmp_path),
+        model_class="token_classification",
+        disable_gpu=True,
+        batch_size=4,
+        max_input_size=50,
+        model_type="transformer",
+    )
+    model_config.return_plaintext_arrays = True
+    transformer = Transformer()
+    transformer.model.eval()
+    yield transformer
+    model_config.update_from_dict(previous_config)
+
+
+def test_merged_token_outputs_match_single_requests(tiny_token_classifier) -> None:
+    prediction_requests = [_request(["the dog"]).args[0], _request(["the cat is blue", "a sky"]).args[0]]
+    merged = merge_requests(prediction_requests)
+    prediction = tiny_token_classifier.predict(PredictionRequest(**merged), Task.token_classification).dict()
+    splits = split_prediction(prediction, [1, 2], tiny_token_classifier.token_lengths)
+
+    for prediction_request, split in zip(prediction_requests, splits):
+        single = tiny_token_classifier.predict(PredictionRequest(**prediction_request), Task.token_classification)
+        single = single.dict()
+        np.testing.assert_allclose(
+            np.array(split["model_outputs"]["logits"]), np.array(single["model_outputs"]["logits"]), atol=1e-5
+        )
+        assert split["word_ids"] == single["word_ids"]
+        assert split["labels"] == single["labels"]
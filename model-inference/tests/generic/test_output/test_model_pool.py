@@ -0,0 +1,42 @@
+import pytest
+import torch
+from model_inference.tasks.config.model_config import model_config
+from model_inference.tasks.model_pool import ModelPool
+
+
+class DummyModel:
+    def __init__(self):
+        # 1 MB of weights
+        self.model = torch.nn.Linear(512, 512, bias=False)
+        self.model_name = model_config.model_name
+
+
+@pytest.fixture(autouse=True)
+def restore_model_config():
+    config = model_config.to_dict()
+    yield
+    model_config.update_from_dict(config)
+
+
+def _config(model_name):
+    return {"model_name": model_name, "model_type": "transformer", "batch_size": 4}
+
+
+def test_models_are_loaded_once() -> None:
+    pool = ModelPool(memory_budget_mb=10, load=DummyModel)
+    first = pool.get(_config("a"))
+    assert pool.get(_config("b")).model_name == "b"
+    assert pool.get(_config("a")) is first
+    assert model_config.model_name == "a"
+    assert len(pool.models) == 2
+
+
+def test_least_recently_used_model_is_evicted() -> None:
+    pool = ModelPool(memory_budget_mb=2, load=DummyModel)
+    pool.get(_config("a"))
+    pool.get(_config("b"))
+    pool.get(_config("a"))
+    pool.get(_config("c"))
+
+    assert [model.model_name for model in pool.models.values()] == ["a", "c"]
+    assert pool.used_memory() == 2 * 512 * 512 * 4
@@ -0,0 +1,42 @@
+import torch
+from kombu.serialization import dumps, loads, prepare_accept_content
+from model_inference.tasks.celery import app
+from model_inference.tasks.models.prediction import PredictionOutputForSequenceClassification, binary_outputs
+from model_inference.tasks.tasks import _binary_outputs
+
+
+def _round_trip(result, serializer):
+    content_type, content_encoding, data = dumps(result, serializer=serializer)
+    return loads(data, content_type, content_encoding, accept=prepare_accept_content(app.conf.result_accept_content))
+
+
+def test_results_are_json_by_default() -> None:
+    assert app.conf.result_serializer == "json"
+    with _binary_outputs({"binary_outputs": True}):
+        prediction = PredictionOutputForSequenceClassification(model_outputs={"logits": torch.tensor([[0.2, 0.8]])})
+
+    assert isinstance(prediction.dict()["model_outputs"]["logits"], str)
+
+
+def test_classification_result_round_trip() -> None:
+    prediction = PredictionOutputForSequenceClassification(
+        model_outputs={"logits": torch.tensor([[0.2, 0.8]])}, labels=[1], id2label={0: "negative", 1: "positive"}
+    )
+    result = prediction.dict()
+    assert app.backend.decode(app.backend.encode(result))["labels"] == [1]
+
+    decoded = _round_trip(result, "msgpack")
+    assert decoded["id2label"] == {0: "negative", 1: "positive"}
+    assert decoded == result
+
+
+def test_binary_result_round_trip() -> None:
+    with binary_outputs():
+        prediction = PredictionOutputForSequenceClassification(
+            model_outputs={"logits": torch.tensor([[0.2, 0.8]])}, labels=[1], id2label={0: "negative", 1: "positive"}
+        )
+    result = prediction.dict()
+    decoded = _round_trip(result, "msgpack")
+
+    assert isinstance(decoded["model_outputs"]["logits"], bytes)
+    assert decoded == result
@@ -0,0 +1,99 @@
+import itertools
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+from model_inference.tasks.inference.utils.preprocess.cpnet import ConceptNetCSR
+
+
+nx = pytest.importorskip("networkx")
+
+
+def _graph(directed: bool):
+    graph = nx.MultiDiGraph() if directed else nx.MultiGraph()
+    edges = [
+        (0, 1, 0, 1.0),
+        (0, 1, 2, 0.5),  # parallel edge with another relation
+        (0, 1, 0, 0.25),  # duplicate edge
+        (1, 0, 3, 2.0),
+        (2, 2, 1, 1.5),  # self loop
+        (2, 2, 1, 3.0),
+        (1, 2, 4, 1.0),
+        (3, 1, 0, 1.0),
+        (5, 3, 2, 1.0),
+    ]
+    for u, v, rel, weight in edges:
+        graph.add_edge(u, v, rel=rel, weight=weight)
+    # node without edges between nodes with edges
+    graph.add_node(4)
+    rng = random.Random(0)
+    for _ in range(300):
+        graph.add_edge(rng.randrange(6, 40), rng.randrange(0, 40), rel=rng.randrange(5), weight=rng.random())
+    return graph
+
+
+def _simple(graph):
+    simple = nx.Graph()
+    for u, v in graph.edges():
+        simple.add_edge(u, v)
+    return simple
+
+
+@pytest.fixture(params=[True, False], ids=["directed", "undirected"])
+def graphs(request, tmp_path):
+    graph = _graph(request.param)
+    ConceptNetCSR.from_networkx(graph).save(str(tmp_path))
+    return graph, ConceptNetCSR.load(str(tmp_path))
+
+
+def test_nodes(graphs) -> None:
+    graph, cpnet = graphs
+    simple = _simple(graph)
+    for node in range(-1, 45):
+        assert cpnet.has_node(node) == (node in simple.nodes)
+        expected = sorted(simple[node]) if node in simple.nodes else []
+        assert cpnet.neighbors(node).tolist() == expected
+
+
+def test_common_neighbors(graphs) -> None:
+    graph, cpnet = graphs
+    simple = _simple(graph)
+    rng = random.Random(1)
+    node_sets = [{0, 2}, {1, 2}, {2, 4}, {4, 44}, {0, 1, 2, 3}, set()]
+    node_sets += [set(rng.sample(range(45), rng.randint(1, 8))) for _ in range(50)]
+    for nodes in node_sets:
+        expected = set()
+        for a, b in itertools.permutations(nodes, 2):
+            if a in simple.nodes and b in simple.nodes:
+                expected |= set(simple[a]) & set(simple[b])
+        assert set(cpnet.common_neighbors(nodes).tolist()) == expected - nodes
+
+
+def test_subgraph_edges(graphs) -> None:
+    graph, cpnet = graphs
+    rng = random.Random(2)
+    node_lists = [[0, 1, 2], [2], [4, 1, 0], [1, 44]]
+    node_lists += [rng.sample(range(45), rng.randint(1, 12)) for _ in range(50)]
+    for nodes in node_lists:
+        expected = Counter(
+            (i, j, data["rel"])
+            for (i, u), (j, v) in itertools.product(enumerate(nodes), repeat=2)
+            if graph.has_edge(u, v)
+            for data in graph[u][v].values()
+        )
+        src, dst, rel = cpnet.subgraph_edges(nodes)
+        assert Counter(zip(src.tolist(), dst.tolist(), rel.tolist())) == expected
+
+
+def test_first_edges(graphs) -> None:
+    graph, cpnet = graphs
+    nodes = list(range(-1, 12)) + [44]
+    pairs = list(itertools.product(nodes, repeat=2))
+    found, relations, weights = cpnet.first_edges([u for u, _ in pairs], [v for _, v in pairs])
+    for (u, v), has_edge, rel, weight in zip(pairs, found, relations, weights):
+        assert has_edge == graph.has_edge(u, v)
+        if has_edge:
+            first = graph[u][v][0]
+            assert rel == first["rel"]
+            np.testing.assert_allclose(weight, first["weight"])
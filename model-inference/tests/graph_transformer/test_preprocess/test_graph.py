@@ -0,0 +1,85 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+
+
+pytest.importorskip("scipy")
+from model_inference.tasks.inference.utils.modelling.roberta import RobertaForMaskedLMwithLoss  # noqa: E402
+from model_inference.tasks.inference.utils.preprocess import graph  # noqa: E402
+from transformers import RobertaConfig, RobertaTokenizerFast  # noqa: E402
+from transformers.models.roberta.tokenization_roberta import bytes_to_unicode  # noqa: E402
+
+
+QUESTION = "Where do you keep a dog? house."
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tokenizer")
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3, "<mask>": 4}
+    for char in bytes_to_unicode().values():
+        vocab[char] = len(vocab)
+    (path / "vocab.json").write_text(json.dumps(vocab))
+    (path / "merges.txt").write_text("#version: 0.2\n")
+    return RobertaTokenizerFast(vocab_file=str(path / "vocab.json"), merges_file=str(path / "merges.txt"))
+
+
+def _model(tokenizer, seed):
+    torch.manual_seed(seed)
+    config = RobertaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=16,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=128,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    return RobertaForMaskedLMwithLoss(config).eval()
+
+
+@pytest.fixture(autouse=True)
+def concepts(monkeypatch):
+    monkeypatch.setattr(graph, "id2concept", ["dog", "dog_house", "red_apple_tree", "sky"])
+
+
+def test_batched_scores_match_single_sentences(tokenizer) -> None:
+    model = _model(tokenizer, seed=0)
+    sentences = ["a", "what is it? dog.", "what is it? red apple tree.", "sky", "a longer question about the sky?"]
+
+    batched = graph.score_sentences(sentences, model, tokenizer, batch_size=2)
+    single = []
+    with torch.no_grad():
+        for sentence in sentences:
+            input_ids = torch.tensor([tokenizer.encode(sentence)])
+            loss = model(input_ids, attention_mask=torch.ones_like(input_ids), masked_lm_labels=input_ids)[0]
+            single.append(-loss.item())
+    np.testing.assert_allclose(batched, single, rtol=1e-5, atol=1e-5)
+
+
+def test_cached_scores(tokenizer) -> None:
+    model = _model(tokenizer, seed=0)
+    scores = graph.get_LM_score([0, 1, 2], QUESTION, model, tokenizer)
+    assert list(scores) == sorted(scores, key=lambda cid: -scores[cid])
+    assert set(scores) == {-1, 0, 1, 2}
+
+    calls = []
+    forward = model.forward
+    model.forward = lambda *args, **kwargs: (calls.append(args), forward(*args, **kwargs))[1]
+    cached = graph.get_LM_scores([([2, 0], QUESTION), ([1], QUESTION)], model, tokenizer)
+    assert not calls
+    assert cached[0] == {cid: scores[cid] for cid in [-1, 2, 0]}
+    assert cached[1] == {cid: scores[cid] for cid in [-1, 1]}
+
+    # only the new concept is scored
+    scores_with_new = graph.get_LM_score([0, 3], QUESTION, model, tokenizer)
+    assert len(calls) == 1 and calls[0][0].shape[0] == 1
+    assert scores_with_new[0] == scores[0]
+
+
+def test_scores_are_cached_per_model(tokenizer) -> None:
+    scores = graph.get_LM_score([0, 1], QUESTION, _model(tokenizer, seed=0), tokenizer)
+    other_scores = graph.get_LM_score([0, 1], QUESTION, _model(tokenizer, seed=1), tokenizer)
+    assert scores[0] != other_scores[0]
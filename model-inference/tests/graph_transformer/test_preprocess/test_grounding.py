@@ -0,0 +1,99 @@
+import pytest
+
+
+spacy = pytest.importorskip("spacy")
+from model_inference.tasks.inference.utils.preprocess import grounding  # noqa: E402
+from spacy.language import Language  # noqa: E402
+from spacy.matcher import Matcher  # noqa: E402
+
+
+LEMMAS = {"dogs": "dog", "apples": "apple", "trees": "tree", "ran": "run", "is": "be", "are": "be"}
+CONCEPTS = [
+    "dog",
+    "dogs",  # same pattern as dog
+    "apple",
+    "red",
+    "red_apple",
+    "apple_tree",
+    "red_apple_tree",  # overlaps red_apple and apple_tree
+    "tree",
+    "run",
+    "house",
+    "dog_house",
+]
+SENTENCES = [
+    "the dogs ran to the red apple trees",
+    "a red apple tree is not a dog house",
+    "apple apple tree red",
+    "nothing to see here",
+    "dog",
+]
+
+
+@Language.component("test_grounding_lemmatizer")
+def lemmatizer(doc):
+    for token in doc:
+        token.lemma_ = LEMMAS.get(token.lower_, token.lower_)
+    return doc
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("test_grounding_lemmatizer")
+    return nlp
+
+
+@pytest.fixture(scope="module")
+def patterns(nlp):
+    return {concept: grounding.create_pattern(nlp, nlp(concept.replace("_", " "))) for concept in CONCEPTS}
+
+
+@pytest.fixture(scope="module")
+def matcher(patterns, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("matcher") / "matcher.pkl")
+    grounding.ConceptMatcher.from_patterns(patterns).save(path)
+    return grounding.ConceptMatcher.load(path)
+
+
+def test_matches_spacy_matcher(nlp, patterns, matcher) -> None:
+    spacy_matcher = Matcher(nlp.vocab)
+    for concept, pattern in patterns.items():
+        spacy_matcher.add(concept, [pattern])
+
+    for sentence in SENTENCES:
+        doc = nlp(sentence)
+        expected = sorted((nlp.vocab.strings[match_id], start, end) for match_id, start, end in spacy_matcher(doc))
+        assert sorted(matcher(doc)) == expected
+    assert ("red_apple_tree", 5, 8) in matcher(nlp(SENTENCES[0]))
+
+
+def test_answer_mentions_are_not_grounded(nlp, matcher) -> None:
+    doc = nlp("the red apple is next to the dog house")
+    concepts = grounding.ground_mentioned_concepts(nlp, matcher, doc)
+    assert {"red_apple", "dog_house", "apple", "red"} <= concepts
+
+    # only the span of the answer itself is excluded, not the concepts inside or overlapping it
+    concepts_without_answer = grounding.ground_mentioned_concepts(nlp, matcher, doc, ans="red apple")
+    assert concepts_without_answer == concepts - {"red_apple"}
+
+
+def test_grounding_is_cached(nlp, matcher, monkeypatch) -> None:
+    statement = {
+        "question": "what is red?",
+        "statements": [{"statement": "a red apple is red"}, {"statement": "a dog house is red"}],
+        "choices": ["red apple", "dog house"],
+    }
+    grounded = grounding.ground(statement, CONCEPTS, nlp, matcher)
+    assert grounded[0]["ac"] == ["apple", "red", "red_apple"]
+    assert grounded[1]["qc"] == ["red"] and grounded[1]["ac"] == ["dog", "dog_house", "house"]
+
+    def pipe(texts):
+        raise AssertionError("cached statements are processed again")
+
+    monkeypatch.setattr(nlp, "pipe", pipe)
+    assert grounding.ground(statement, CONCEPTS, nlp, matcher) == grounded
+    # the matcher of another model does not use the cache
+    other_matcher = grounding.ConceptMatcher.from_patterns({"dog": [{"LEMMA": "dog"}]})
+    with pytest.raises(AssertionError):
+        grounding.ground(statement, CONCEPTS, nlp, other_matcher)
@@ -107,6 +107,24 @@ def test_transformer_generation():
     return Transformer()
 
 
+@pytest.fixture(scope="class", params=["int8", "bf16"])
+def test_transformer_cpu_optimization(request):
+    torch.manual_seed(987654321)
+    set_test_config(
+        model_name=TRANSFORMER_MODEL,
+        model_class="sequence_classification",
+        disable_gpu=True,
+        batch_size=1,
+        max_input_size=50,
+        model_type="transformer",
+    )
+    model_config.cpu_optimization = request.param
+    try:
+        return Transformer()
+    finally:
+        model_config.cpu_optimization = "none"
+
+
 @pytest.fixture(scope="class")
 def test_adapter():
     set_test_config(
@@ -417,3 +417,21 @@ class TestTransformerGeneration:
 
         prediction = test_transformer_generation.predict(prediction_request, Task.generation)
         assert len(prediction.generated_texts[0]) == 2
+
+
+@pytest.mark.usefixtures("test_transformer_cpu_optimization")
+class TestTransformerCpuOptimization:
+    @pytest.mark.asyncio
+    async def test_sequence_classification(self, prediction_request, test_transformer_cpu_optimization):
+        prediction_request.input = ["this is a test", "this is a test with a longer sentence"]
+
+        prediction = test_transformer_cpu_optimization.predict(prediction_request, Task.sequence_classification)
+        np.testing.assert_allclose(np.sum(prediction.model_outputs["logits"], axis=-1), [1.0] * 2, rtol=1e-3)
+        assert test_transformer_cpu_optimization.accuracy_report["argmax_agreement"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_explanation_not_supported(self, prediction_request, test_transformer_cpu_optimization):
+        prediction_request.explain_kwargs = {"method": "simple_grads", "top_k": 3, "mode": "all"}
+
+        with pytest.raises(ValueError):
+            test_transformer_cpu_optimization.predict(prediction_request, Task.sequence_classification)
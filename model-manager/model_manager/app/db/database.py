@@ -135,6 +135,16 @@ class MongoClass:
                 "RETURN_PLAINTEXT_ARRAYS": updated_params.return_plaintext_arrays,
             }
         }
+        # the ONNX session options are only changed if they are set
+        onnx_session_options = {
+            "ONNX_INTRA_OP_NUM_THREADS": updated_params.onnx_intra_op_num_threads,
+            "ONNX_INTER_OP_NUM_THREADS": updated_params.onnx_inter_op_num_threads,
+            "ONNX_EXECUTION_MODE": updated_params.onnx_execution_mode,
+            "ONNX_ENABLE_CPU_MEM_ARENA": updated_params.onnx_enable_cpu_mem_arena,
+            "ONNX_EXECUTION_PROVIDERS": updated_params.onnx_execution_providers,
+            "ONNX_OPTIMIZED_MODEL_PATH": updated_params.onnx_optimized_model_path,
+        }
+        new_values["$set"].update({k: v for k, v in onnx_session_options.items() if v is not None})
         self.models.update_one(query, new_values)
 
     async def init_db(self, deployed_models):
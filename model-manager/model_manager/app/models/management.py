@@ -49,6 +49,7 @@ class DeployRequest(BaseModel):
     max_input: int = Field("", description="max input length")
     transformers_cache: Optional[str] = Field("../.cache", description="path to cache models")
     onnx_use_quantized: Optional[bool] = Field(False, description="Flag that decides if quantized ONNX model should be used for inference")
+    cpu_optimization: Optional[str] = Field("none", description="CPU optimization of transformer and adapter models: none, int8 or bf16")
     is_encoder_decoder: Optional[bool] = Field(False, description="Flag that decides if ONNX model is encoder-decoder model")
     hf_token: Optional[str] = Field(None, description="HuggingFace API token with write access to UKP-SQuARE repository for onnx model export")
     adapter_id: Optional[str] = Field(None, description="Adapter id, required if the model to deploy is an adapter model")
@@ -61,6 +62,26 @@ class DeployRequest(BaseModel):
     )
     return_plaintext_arrays: Optional[bool] = Field(False, description="whether to encode outputs")
     preloaded_adapters: Optional[bool] = Field(True, description="whether to preload adapters")
+    micro_batch_window_ms: Optional[int] = Field(
+        0, description="time window in ms in which the worker merges queued requests into one forward pass (0 disables)"
+    )
+    micro_batch_max_requests: Optional[int] = Field(16, description="maximum number of requests in one micro-batch")
+    onnx_intra_op_num_threads: Optional[int] = Field(0, description="ONNX Runtime intra-op threads (0 uses all cores)")
+    onnx_inter_op_num_threads: Optional[int] = Field(0, description="ONNX Runtime inter-op threads (0 uses all cores)")
+    onnx_execution_mode: Optional[str] = Field("sequential", description="ONNX Runtime execution mode: sequential or parallel")
+    onnx_enable_cpu_mem_arena: Optional[bool] = Field(True, description="whether ONNX Runtime uses the CPU memory arena")
+    onnx_execution_providers: Optional[str] = Field(
+        "", description="comma-separated ONNX Runtime execution providers (empty selects CUDA or CPU automatically)"
+    )
+    onnx_optimized_model_path: Optional[str] = Field(
+        "", description="directory in which the optimized ONNX graphs are stored to skip the optimization on restarts"
+    )
+    embedding_cache_size: Optional[int] = Field(0, description="number of cached input embeddings per worker (0 disables)")
+    embedding_cache_redis_url: Optional[str] = Field("", description="optional Redis url of a shared embedding cache")
+    embedding_cache_ttl: Optional[int] = Field(86400, description="seconds until embeddings expire in Redis (0 keeps them)")
+    attribution_cache_size: Optional[int] = Field(
+        100, description="number of cached word attributions of explained inputs per worker (0 disables)"
+    )
 
 
 class TaskGenericModel(BaseModel):
@@ -83,3 +104,9 @@ class UpdateModel(BaseModel):
     batch_size: Optional[int] = None
     max_input: Optional[int] = None
     return_plaintext_arrays: Optional[bool] = None
+    onnx_intra_op_num_threads: Optional[int] = None
+    onnx_inter_op_num_threads: Optional[int] = None
+    onnx_execution_mode: Optional[str] = None
+    onnx_enable_cpu_mem_arena: Optional[bool] = None
+    onnx_execution_providers: Optional[str] = None
+    onnx_optimized_model_path: Optional[str] = None
@@ -1,4 +1,4 @@
-from transformers import AutoAdapterModel, AutoModel, AutoTokenizer, AutoConfig
+from transformers import AutoAdapterModel, AutoModel, AutoModelForCausalLM, AutoTokenizer, AutoConfig
 from transformers.onnx import OnnxConfig, export
 
 import onnx
@@ -189,6 +189,9 @@ def auto_onnx_config(model_name: str, task: str) -> OnnxConfig:
         config_name = CONFIG_MAPPING_NAMES[identifier]
         config_class = import_module(f"transformers.models.{identifier}")
         auto_onnx_config = getattr(config_class, config_name)
+        # e.g. causal-lm-with-past exports the past key values as additional inputs and outputs
+        if task.endswith("-with-past"):
+            return auto_onnx_config.with_past(config, task=task[: -len("-with-past")])
         return auto_onnx_config.from_model_config(config, task=task)
     except:
         raise ValueError(f"Could not find an AutoOnnxConfig for model {model_name}.")
@@ -381,6 +384,9 @@ def onnx_export(model_name: str, skill: str, hf_token: str, adapter_id: Optional
         model = AutoAdapterModel.from_pretrained(model_name)
         adapter_name = model.load_adapter(adapter, source="hf")
         model.active_adapters = adapter_name
+    elif skill == "generation":
+        # generation models need the LM head
+        model = AutoModelForCausalLM.from_pretrained(model_name)
     else:
         model = AutoModel.from_pretrained(model_name)
 
@@ -395,7 +401,8 @@ def onnx_export(model_name: str, skill: str, hf_token: str, adapter_id: Optional
         onnx_config = CustomOnnxConfig(model_name, skill)
     else:
         logger.info("Using auto onnx config")
-        onnx_config = auto_onnx_config(model_name, skill)
+        # generation models are exported with the KV cache so that each decoding step only processes the new token
+        onnx_config = auto_onnx_config(model_name, "causal-lm-with-past" if skill == "generation" else skill)
     
     # Generate the local directory in onnx_tmp/
     directory_path = Path("onnx_tmp/{}".format(model_id))
@@ -219,6 +219,7 @@ async def deploy_new_model(request: Request, model_params: DeployRequest):
         "UUID": str(uuid.uuid1()),
         "MODEL_NAME": model_name,
         "ONNX_USE_QUANTIZED": model_params.onnx_use_quantized,
+        "CPU_OPTIMIZATION": model_params.cpu_optimization,
         "IS_ENCODER_DECODER": model_params.is_encoder_decoder,
         "MODEL_TYPE": model_type,
         "MODEL_CLASS": model_params.model_class,
@@ -228,6 +229,18 @@ async def deploy_new_model(request: Request, model_params: DeployRequest):
         "TRANSFORMERS_CACHE": model_params.transformers_cache,
         "RETURN_PLAINTEXT_ARRAYS": model_params.return_plaintext_arrays,
         "PRELOADED_ADAPTERS": model_params.preloaded_adapters,
+        "MICRO_BATCH_WINDOW_MS": model_params.micro_batch_window_ms,
+        "MICRO_BATCH_MAX_REQUESTS": model_params.micro_batch_max_requests,
+        "ONNX_INTRA_OP_NUM_THREADS": model_params.onnx_intra_op_num_threads,
+        "ONNX_INTER_OP_NUM_THREADS": model_params.onnx_inter_op_num_threads,
+        "ONNX_EXECUTION_MODE": model_params.onnx_execution_mode,
+        "ONNX_ENABLE_CPU_MEM_ARENA": model_params.onnx_enable_cpu_mem_arena,
+        "ONNX_EXECUTION_PROVIDERS": model_params.onnx_execution_providers,
+        "ONNX_OPTIMIZED_MODEL_PATH": model_params.onnx_optimized_model_path,
+        "EMBEDDING_CACHE_SIZE": model_params.embedding_cache_size,
+        "EMBEDDING_CACHE_REDIS_URL": model_params.embedding_cache_redis_url,
+        "EMBEDDING_CACHE_TTL": model_params.embedding_cache_ttl,
+        "ATTRIBUTION_CACHE_SIZE": model_params.attribution_cache_size,
         "WEB_CONCURRENCY": os.getenv("WEB_CONCURRENCY", 1),  # fixed processes, do not give the control to  end-user
         "KEYCLOAK_BASE_URL": os.getenv("KEYCLOAK_BASE_URL", "https://square.ukp-lab.de"),
         "VERIFY_ISSUER": os.getenv("VERIFY_ISSUER", "1")
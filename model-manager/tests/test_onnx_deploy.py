@@ -18,6 +18,15 @@ def test__auto_onnx_config(model_name) -> None:
     assert type(onnx_config) is BartOnnxConfig
 
 
+@pytest.mark.parametrize(
+    'model_name', (["gpt2"])
+)
+def test_auto_onnx_config_with_past(model_name) -> None:
+    onnx_config = auto_onnx_config(model_name, "causal-lm-with-past")
+    assert onnx_config.use_past
+    assert "past_key_values.0.key" in onnx_config.inputs
+
+
 @pytest.mark.parametrize(
     'model_name', (["SpanBERT/spanbert-large-cased"])
 )
@@ -1,5 +1,7 @@
+from skill_manager.core.prediction_writer import PredictionWriter
 from skill_manager.core.redis_client import RedisClient
 from skill_manager.mongo.mongo_client import MongoClient
 
 mongo_client = MongoClient()
 redis_client = RedisClient()
+prediction_writer = PredictionWriter(mongo_client)
@@ -34,7 +34,9 @@ async def get_skill_if_authorized(
         payload = {"username": None}
 
     skill = Skill.from_mongo(
-        mongo_client.client.skill_manager.skills.find_one({"_id": ObjectId(skill_id)})
+        await mongo_client.async_client.skill_manager.skills.find_one(
+            {"_id": ObjectId(skill_id)}
+        )
     )
     if skill is None:
         raise HTTPException(404, "Skill not found.")
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionWriter:
+    """Saves the predictions of skill queries to mongoDB in the background.
+
+    Predictions are buffered and written with one `insert_many` per batch, so that
+    queries do not wait for mongoDB. A batch is written when it has
+    `PREDICTION_BATCH_SIZE` predictions or when the oldest prediction has waited
+    `PREDICTION_FLUSH_INTERVAL` seconds. Queries only wait if the buffer of
+    `PREDICTION_BUFFER_SIZE` predictions is full.
+    """
+
+    def __init__(self, mongo_client):
+        self.mongo_client = mongo_client
+        self.batch_size = int(os.getenv("PREDICTION_BATCH_SIZE", 100))
+        self.flush_interval = float(os.getenv("PREDICTION_FLUSH_INTERVAL", 1.0))
+        self.buffer_size = int(os.getenv("PREDICTION_BUFFER_SIZE", 10000))
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Starts writing in the background on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def write(self, predictions: List[Dict]):
+        """Adds predictions to the buffer."""
+        if self._task is None or self._task.done():
+            self.start()
+        for prediction in predictions:
+            await self._queue.put(prediction)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            closed = batch[-1] is None
+            if closed:
+                batch.pop()
+            if batch:
+                await self._insert(batch)
+            if closed:
+                return
+
+    async def _insert(self, batch: List[Dict]):
+        try:
+            await self.mongo_client.async_client.skill_manager.predictions.insert_many(
+                batch, ordered=False
+            )
+            logger.debug("saved {n} predictions".format(n=len(batch)))
+        except Exception:
+            logger.exception("Saving {n} predictions failed".format(n=len(batch)))
+
+    async def close(self):
+        """Writes the buffered predictions and stops the background writer."""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
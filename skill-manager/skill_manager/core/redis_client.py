@@ -1,3 +1,4 @@
+import redis.asyncio
 from redis import Redis
 
 from skill_manager.settings.redis_settings import RedisSettings
@@ -12,6 +13,14 @@ class RedisClient:
             password=self.redis_settings.password,
             username=self.redis_settings.username,
         )
+        # non-blocking client for the request handlers
+        self.async_client = redis.asyncio.Redis(
+            host=self.redis_settings.host,
+            port=self.redis_settings.port,
+            password=self.redis_settings.password,
+            username=self.redis_settings.username,
+        )
 
-    def close(self):
+    async def close(self):
         self.client.close()
+        await self.async_client.close()
@@ -1,33 +1,132 @@
+import hashlib
+import json
 import logging
 import os
-from datetime import timedelta
+import time
+from typing import Dict, Optional
 
-import requests_cache
+import httpx
 
 from skill_manager import redis_client
 
 logger = logging.getLogger(__name__)
 
 
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parses a Cache-Control header into a dict of directives and their arguments."""
+    directives = {}
+    for directive in (value or "").split(","):
+        key, _, argument = directive.strip().partition("=")
+        if key:
+            directives[key.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _max_age(directives: Dict[str, Optional[str]]) -> Optional[int]:
+    try:
+        return int(directives["max-age"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 class SessionCache:
+    """Async HTTP session for querying skills, with responses cached in Redis.
+
+    Successful responses are cached for `CACHE_EXPIRE_MINS` minutes, keyed by the url
+    and the request body without the `user_id`. The `Cache-Control` headers of the
+    request and the response are respected: `no-store` disables the cache, `no-cache`
+    skips reading from the cache and `max-age` overrides the expiration.
+    """
+
+    namespace = "skill_query_cache"
+    ignored_parameters = ["user_id"]
+
+    def __init__(self):
+        self.expire_after = int(os.getenv("CACHE_EXPIRE_MINS", 5)) * 60
+
     def init_session(self):
-        self._session = requests_cache.CachedSession(
-            cache_name="skill_query_cache",
-            backend=requests_cache.backends.redis.RedisCache(
-                namespace="skill_query_cache", connection=redis_client.client
+        self._session = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("SKILL_QUERY_TIMEOUT", 600))),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SKILL_QUERY_MAX_CONNECTIONS", 100)),
+                max_keepalive_connections=int(
+                    os.getenv("SKILL_QUERY_MAX_KEEPALIVE_CONNECTIONS", 20)
+                ),
             ),
-            serializer="json",
-            match_headers=False,
-            ignored_parameters=["user_id"],
-            cache_control=True,
-            expire_after=timedelta(minutes=os.getenv("CACHE_EXPIRE_MINS", 5)),
-            allowable_codes=[200],
-            allowable_methods=["GET", "POST"],
-            stale_if_error=False,
         )
 
     @property
-    def session(self):
+    def session(self) -> httpx.AsyncClient:
         if not hasattr(self, "_session"):
             self.init_session()
         return self._session
+
+    async def close(self):
+        if hasattr(self, "_session"):
+            await self._session.aclose()
+            del self._session
+
+    def cache_key(self, url: str, body: Dict) -> str:
+        body = {k: v for k, v in body.items() if k not in self.ignored_parameters}
+        request = json.dumps(
+            {"method": "POST", "url": url, "body": body}, sort_keys=True
+        )
+        return f"{self.namespace}:{hashlib.sha256(request.encode()).hexdigest()}"
+
+    async def _read(self, key: str, max_age: Optional[int]) -> Optional[Dict]:
+        try:
+            cached = await redis_client.async_client.get(key)
+        except Exception:
+            logger.exception("Reading the skill query cache failed")
+            return None
+        if cached is None:
+            return None
+        cached = json.loads(cached)
+        if max_age is not None and time.time() - cached["created_at"] > max_age:
+            return None
+        return cached
+
+    async def _write(self, key: str, response: httpx.Response, expire_after: int):
+        if expire_after <= 0:
+            return
+        cached = {
+            "created_at": time.time(),
+            "headers": {"content-type": response.headers.get("content-type", "")},
+            "content": response.text,
+        }
+        try:
+            await redis_client.async_client.set(
+                key, json.dumps(cached), ex=expire_after
+            )
+        except Exception:
+            logger.exception("Writing the skill query cache failed")
+
+    async def post(
+        self, url: str, headers: Dict[str, str], json: Dict
+    ) -> httpx.Response:
+        """Sends a POST request or returns the cached response of the same request."""
+        request_directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in request_directives:
+            return await self.session.post(url, headers=headers, json=json)
+
+        key = self.cache_key(url, json)
+        max_age = _max_age(request_directives)
+        if "no-cache" not in request_directives and max_age != 0:
+            cached = await self._read(key, max_age)
+            if cached is not None:
+                logger.debug("Returning cached response for {url}".format(url=url))
+                return httpx.Response(
+                    200,
+                    headers=cached["headers"],
+                    content=cached["content"].encode(),
+                    request=httpx.Request("POST", url),
+                )
+
+        response = await self.session.post(url, headers=headers, json=json)
+        response_directives = parse_cache_control(response.headers.get("Cache-Control"))
+        if response.status_code == 200 and "no-store" not in response_directives:
+            expire_after = _max_age(response_directives)
+            if expire_after is None:
+                expire_after = max_age or self.expire_after
+            await self._write(key, response, expire_after)
+        return response
@@ -5,8 +5,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 
-from skill_manager import mongo_client, redis_client
+from skill_manager import mongo_client, prediction_writer, redis_client
 from skill_manager.routers.api import router
+from skill_manager.routers.skill import session_cache
 
 logger = logging.getLogger(__name__)
 
@@ -58,12 +59,15 @@ app.openapi_schema = add_prefix_to_openapi()
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     mongo_client.connect()
     redis_client.connect()
+    prediction_writer.start()
 
 
 @app.on_event("shutdown")
-def on_shutdown():
+async def on_shutdown():
+    await prediction_writer.close()
+    await session_cache.close()
     mongo_client.close()
-    redis_client.close()
+    await redis_client.close()
@@ -1,4 +1,5 @@
 import pymongo
+from motor.motor_asyncio import AsyncIOMotorClient
 
 from skill_manager.settings.mongo_settings import MongoSettings
 
@@ -7,6 +8,9 @@ class MongoClient:
     def connect(self):
         mongo_settings = MongoSettings()
         self.client = pymongo.MongoClient(mongo_settings.connection_url)
+        # non-blocking client for the request handlers
+        self.async_client = AsyncIOMotorClient(mongo_settings.connection_url)
 
     def close(self):
         self.client.close()
+        self.async_client.close()
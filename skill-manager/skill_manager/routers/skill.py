@@ -15,7 +15,7 @@ from square_auth.utils import is_local_deployment
 from square_skill_api.models.prediction import QueryOutput
 from square_skill_api.models.request import QueryRequest
 
-from skill_manager import mongo_client
+from skill_manager import mongo_client, prediction_writer
 from skill_manager.auth_utils import (
     get_payload_from_token,
     get_skill_if_authorized,
@@ -277,7 +277,7 @@ async def query_skill(
         headers["Cache-Control"] = request.headers.get("Cache-Control")
 
     logger.debug(f"query json={query_request.dict()}")
-    response = session_cache.session.post(
+    response = await session_cache.post(
         f"{skill.url}/query",
         headers=headers,
         json=query_request.dict(),
@@ -300,7 +300,7 @@ async def query_skill(
     if isinstance(queries, str):
         queries = [queries]
 
-    # save prediction to mongodb
+    # save prediction to mongodb in the background
     assert len(predictions.predictions) == len(queries) * topk
     for idx, query in enumerate(queries):
         # indices for topk predictions for each query
@@ -318,13 +318,11 @@ async def query_skill(
         )
         mongo_predictions.append(mongo_prediction.mongo())
         logger.debug(
-            "prediction saved {mongo_prediction}".format(
+            "prediction queued {mongo_prediction}".format(
                 mongo_prediction=str(mongo_prediction.json())[:100],
             )
         )
-    _ = mongo_client.client.skill_manager.predictions.insert_many(
-        mongo_predictions
-    ).inserted_ids
+    await prediction_writer.write(mongo_predictions)
 
     logger.debug(
         "query_skill: query_request: {query_request} predictions: {predictions}".format(
@@ -1,11 +1,14 @@
 import json
+import time
 import uuid
 from datetime import datetime
 from unittest import TestCase
 from unittest.mock import MagicMock
 
+import httpx
 import pytest
 import responses
+import respx
 from fastapi.testclient import TestClient
 from square_skill_api.models.request import QueryRequest
 from testcontainers.mongodb import MongoDbContainer
@@ -34,6 +37,16 @@ app.dependency_overrides[ModelManagementClient] = mock_model_management_client
 client = TestClient(app)
 
 
+def wait_for(condition, timeout=5.0):
+    """Polls `condition` until it returns a truthy value or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = condition()
+        if result or time.monotonic() > deadline:
+            return result
+        time.sleep(0.05)
+
+
 @pytest.fixture(scope="module")
 def pers_client(
     monkeymodule, init_mongo_db: MongoDbContainer, init_redis: RedisContainer
@@ -413,7 +426,7 @@ def test_publish_unpublish(
         assert response.status_code == 403
 
 
-@responses.activate
+@respx.mock(assert_all_called=False)
 @pytest.mark.parametrize(
     "authorized", [True, False], ids=["authorized", "unauthorized"]
 )
@@ -438,11 +451,8 @@ def test_query_skill(
 
     skill_id = response.json()["id"]
 
-    responses.add(
-        responses.POST,
-        url=f"{skill.url}/query",
-        json=skill_prediction_factory(),
-        status=200,
+    respx.post(f"{skill.url}/query").mock(
+        return_value=httpx.Response(200, json=skill_prediction_factory())
     )
 
     query = "a unique query form test_query_skill " + str(uuid.uuid1())
@@ -461,8 +471,11 @@ def test_query_skill(
     )
     if authorized:
         assert response.status_code == 200
-        saved_prediction = mongo_client.client.skill_manager.predictions.find_one(
-            {"query": query}
+        # predictions are saved in the background
+        saved_prediction = wait_for(
+            lambda: mongo_client.client.skill_manager.predictions.find_one(
+                {"query": query}
+            )
         )
 
         response = response.json()
@@ -482,7 +495,7 @@ def test_query_skill(
         assert response.status_code == 403
 
 
-@responses.activate
+@respx.mock
 def test_query_skill_with_default_skill_args(
     pers_client,
     skill_factory,
@@ -513,11 +526,8 @@ def test_query_skill_with_default_skill_args(
     )
     skill_id = response.json()["id"]
 
-    responses.add(
-        responses.POST,
-        url=f"{skill.url}/query",
-        json=skill_prediction_factory(),
-        status=200,
+    respx.post(f"{skill.url}/query").mock(
+        return_value=httpx.Response(200, json=skill_prediction_factory())
     )
 
     query_context = {"context": "hello"}
@@ -533,7 +543,7 @@ def test_query_skill_with_default_skill_args(
         headers=dict(Authorization="Bearer " + token),
     )
 
-    actual_request_body = json.loads(responses.calls[0].request.body)
+    actual_request_body = json.loads(respx.calls[0].request.content)
 
     # model_kwargs is supposed to be removed from the skill_args and parsed separately
     TestCase().assertDictEqual(
@@ -548,7 +558,7 @@ def test_query_skill_with_default_skill_args(
     )
 
 
-@responses.activate
+@respx.mock
 def test_query_skill_with_attributions(
     pers_client,
     skill_factory,
@@ -582,11 +592,10 @@ def test_query_skill_with_attributions(
         "context_tokens": [[0, "hello", 0.2], [1, "world", 0.8]],
     }
 
-    responses.add(
-        responses.POST,
-        url=f"{skill.url}/query",
-        json=skill_prediction_factory(attributions=attributions),
-        status=200,
+    respx.post(f"{skill.url}/query").mock(
+        return_value=httpx.Response(
+            200, json=skill_prediction_factory(attributions=attributions)
+        )
     )
 
     query_context = {"context": "hello"}
@@ -607,7 +616,7 @@ def test_query_skill_with_attributions(
     TestCase().assertDictEqual(response["predictions"][0]["attributions"], attributions)
 
 
-@responses.activate
+@respx.mock
 def test_query_skill_with_cache(
     pers_client,
     skill_factory,
@@ -644,11 +653,10 @@ def test_query_skill_with_cache(
 
     # define the first response of the skill
     prediction_output = {"output": "answer-1", "output_score": "1"}
-    responses.add(
-        responses.POST,
-        url=f"{skill.url}/query",
-        json=skill_prediction_factory(prediction_output=prediction_output),
-        status=200,
+    respx.post(f"{skill.url}/query").mock(
+        return_value=httpx.Response(
+            200, json=skill_prediction_factory(prediction_output=prediction_output)
+        )
     )
     response_1 = pers_client.post(
         f"/api/skill/{skill_id}/query",
@@ -659,11 +667,10 @@ def test_query_skill_with_cache(
     # update the response
     updateded_output = "updated_output"
     prediction_output = {"output": updateded_output, "output_score": "1"}
-    responses.add(
-        responses.POST,
-        url=f"{skill.url}/query",
-        json=skill_prediction_factory(prediction_output=prediction_output),
-        status=200,
+    respx.post(f"{skill.url}/query").mock(
+        return_value=httpx.Response(
+            200, json=skill_prediction_factory(prediction_output=prediction_output)
+        )
     )
     response_2 = pers_client.post(
         f"/api/skill/{skill_id}/query",
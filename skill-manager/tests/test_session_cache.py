@@ -0,0 +1,76 @@
+import httpx
+import pytest
+import respx
+
+from skill_manager import redis_client
+from skill_manager.core.session_cache import SessionCache, parse_cache_control
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+
+@pytest.fixture
+def session_cache(monkeypatch):
+    monkeypatch.setattr(redis_client, "async_client", FakeRedis(), raising=False)
+    return SessionCache()
+
+
+def test_parse_cache_control():
+    assert parse_cache_control("no-cache, max-age=60") == {
+        "no-cache": None,
+        "max-age": "60",
+    }
+    assert parse_cache_control(None) == {}
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_session_cache(session_cache):
+    url = "http://test-skill.square:1234/query"
+    route = respx.post(url).mock(return_value=httpx.Response(200, json={"a": 1}))
+
+    await session_cache.post(url, headers={}, json={"query": "q", "user_id": "u1"})
+    # the user_id is not part of the cache key
+    response = await session_cache.post(
+        url, headers={}, json={"query": "q", "user_id": "u2"}
+    )
+    assert route.call_count == 1
+    assert response.json() == {"a": 1}
+
+    route.mock(return_value=httpx.Response(200, json={"a": 2}))
+    response = await session_cache.post(
+        url, headers={"Cache-Control": "no-cache"}, json={"query": "q"}
+    )
+    assert route.call_count == 2
+    assert response.json() == {"a": 2}
+
+    # no-cache refreshed the cached response
+    response = await session_cache.post(url, headers={}, json={"query": "q"})
+    assert route.call_count == 2
+    assert response.json() == {"a": 2}
+
+    await session_cache.post(
+        url, headers={"Cache-Control": "no-store"}, json={"query": "q"}
+    )
+    assert route.call_count == 3
+    await session_cache.close()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_session_cache_does_not_store_errors(session_cache):
+    url = "http://test-skill.square:1234/query"
+    route = respx.post(url).mock(return_value=httpx.Response(500))
+
+    await session_cache.post(url, headers={}, json={"query": "q"})
+    await session_cache.post(url, headers={}, json={"query": "q"})
+    assert route.call_count == 2
+    await session_cache.close()
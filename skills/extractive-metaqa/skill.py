@@ -1,7 +1,4 @@
 import logging
-import os
-import requests
-import asyncio
 
 from square_skill_api.models import (
     QueryOutput,
@@ -12,6 +9,8 @@ from square_skill_api.models import (
 from square_model_client import SQuAREModelClient
 from square_auth.client_credentials import ClientCredentials
 
+from utils import call_skills, get_agent_prediction
+
 logger = logging.getLogger(__name__)
 
 square_model_client = SQuAREModelClient()
@@ -27,13 +26,12 @@ async def predict(request: QueryRequest) -> QueryOutput:
     list_skills = request.skill_args["list_skills"]
 
     # 1) call the skills in parallel
-    list_skill_responses = await _call_skills(list_skills, request)
+    list_skill_responses = await call_skills(list_skills, request)
     # 2) get the predictions
     list_preds = [["", 0.0]] * 16
     for (skill_idx, skill_response) in enumerate(list_skill_responses):
-        pred = skill_response["predictions"][0]["prediction_output"]["output"]
-        score = skill_response["predictions"][0]["prediction_output"]["output_score"]
-        list_preds[skill_idx] = (pred, score)
+        # failed skills and skills that missed the deadline get an empty prediction
+        list_preds[skill_idx] = get_agent_prediction(skill_response)
 
     # 4) Call MetaQA Model API
     model_request = {
@@ -54,47 +52,6 @@ async def predict(request: QueryRequest) -> QueryOutput:
     return _create_metaqa_output_from_question_answering(request, model_response)
 
 
-async def _call_skills(list_skills, request):
-    """
-    Calls the skills in parallel
-    """
-    list_skill_responses = []
-    for skill_id in list_skills:
-        # how to call the skill without waiting
-        skill_response = _call_skill(skill_id, request)  # only 1 answer per skill
-        list_skill_responses.append(skill_response)
-    list_skill_responses = await asyncio.gather(*list_skill_responses)
-    return list_skill_responses
-
-
-async def _call_skill(skill_id, request):
-    skill_manager_api_url = os.getenv("SQUARE_API_URL") + "/skill-manager"
-    # token = client_credentials()
-
-    input_data = {
-        "query": request.query,
-        "skill_args": {
-            "context": request.skill_args["context"]
-            if "context" in request.skill_args
-            else "",
-            "choices": request.skill_args["choices"]
-            if "choices" in request.skill_args
-            else [],
-        },
-        "skill": {},
-        "user_id": "",
-        "explain_kwargs": {},
-    }
-
-    response = requests.post(
-        url=skill_manager_api_url + "/skill/" + skill_id + "/query",
-        json=input_data,
-        # headers={"Authorization": f"Bearer {token}"},
-        verify=os.getenv("VERIFY_SSL") == "1",
-    )
-    return response.json()
-
-
 def _create_metaqa_output_from_question_answering(request, model_response):
     list_predictions = []
     for answer in model_response["answers"][0]:
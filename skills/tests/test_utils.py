@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from square_skill_api.models import QueryRequest
+
+import utils
+
+
+async def _ok(request):
+    return web.json_response(
+        {
+            "predictions": [
+                {
+                    "prediction_output": {
+                        "output": request.match_info["skill_id"],
+                        "output_score": 0.5,
+                    }
+                }
+            ]
+        }
+    )
+
+
+async def _slow(request):
+    await asyncio.sleep(2)
+    return await _ok(request)
+
+
+async def _error(request):
+    raise web.HTTPInternalServerError()
+
+
+async def _invalid_json(request):
+    return web.Response(text="{not json", content_type="application/json")
+
+
+async def _html(request):
+    return web.Response(text="<html>Bad Gateway</html>", content_type="text/html")
+
+
+SKILLS = {
+    "ok": _ok,
+    "other": _ok,
+    "slow": _slow,
+    "error": _error,
+    "invalid-json": _invalid_json,
+    "html": _html,
+}
+
+
+async def _query(request):
+    return await SKILLS[request.match_info["skill_id"]](request)
+
+
+def _request(**skill_args):
+    return QueryRequest(query="Who?", skill_args=skill_args, user_id="")
+
+
+def _call_skills(monkeypatch, list_skills, request):
+    async def call():
+        app = web.Application()
+        app.router.add_post("/skill-manager/skill/{skill_id}/query", _query)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        monkeypatch.setenv("SQUARE_API_URL", f"http://127.0.0.1:{port}")
+        try:
+            return await utils.call_skills(list_skills, request)
+        finally:
+            await utils._get_session().close()
+            await runner.cleanup()
+
+    return asyncio.run(call())
+
+
+@pytest.fixture(autouse=True)
+def session(monkeypatch):
+    # the shared session belongs to the event loop of a single test
+    monkeypatch.setattr(utils, "_session", None)
+
+
+def test_call_skills_keeps_the_order(monkeypatch):
+    responses = _call_skills(monkeypatch, ["other", "ok"], _request())
+
+    assert [utils.get_agent_prediction(r) for r in responses] == [
+        ("other", 0.5),
+        ("ok", 0.5),
+    ]
+
+
+@pytest.mark.parametrize("failing_skill", ["error", "invalid-json", "html"])
+def test_call_skills_fills_the_slot_of_a_failing_skill(monkeypatch, failing_skill):
+    responses = _call_skills(monkeypatch, ["ok", failing_skill], _request())
+
+    assert responses[1] is None
+    assert [utils.get_agent_prediction(r) for r in responses] == [
+        ("ok", 0.5),
+        utils.EMPTY_PREDICTION,
+    ]
+
+
+def test_call_skills_agent_timeout(monkeypatch):
+    responses = _call_skills(monkeypatch, ["slow", "ok"], _request(agent_timeout=0.2))
+
+    assert responses[0] is None
+    assert utils.get_agent_prediction(responses[1]) == ("ok", 0.5)
+
+
+def test_call_skills_deadline(monkeypatch):
+    loop_time = []
+
+    async def timed(*args):
+        start = asyncio.get_running_loop().time()
+        try:
+            return await call_skill(*args)
+        finally:
+            loop_time.append(asyncio.get_running_loop().time() - start)
+
+    call_skill = utils._call_skill
+    monkeypatch.setattr(utils, "_call_skill", timed)
+    responses = _call_skills(monkeypatch, ["ok", "slow"], _request(deadline=0.5))
+
+    assert utils.get_agent_prediction(responses[0]) == ("ok", 0.5)
+    assert responses[1] is None
+    # the slow skill is cancelled at the deadline instead of running into its timeout
+    assert max(loop_time) < 1.5
+
+
+def test_get_agent_prediction_of_malformed_responses():
+    assert utils.get_agent_prediction(None) == utils.EMPTY_PREDICTION
+    assert utils.get_agent_prediction({}) == utils.EMPTY_PREDICTION
+    assert utils.get_agent_prediction({"predictions": []}) == utils.EMPTY_PREDICTION
+    assert (
+        utils.get_agent_prediction({"predictions": [{"prediction_output": {}}]})
+        == utils.EMPTY_PREDICTION
+    )
@@ -1,7 +1,18 @@
-from typing import Dict
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
 
+import aiohttp
 from square_skill_api.models import QueryRequest
 
+logger = logging.getLogger(__name__)
+
+_session: Optional[aiohttp.ClientSession] = None
+
+# prediction of an agent that failed or did not answer
+EMPTY_PREDICTION = ("", 0.0)
+
 
 def extract_model_kwargs_from_request(request: QueryRequest) -> Dict[str, Dict]:
     """Extracts the kwargs from a QueryRequest"""
@@ -13,3 +24,101 @@ def extract_model_kwargs_from_request(request: QueryRequest) -> Dict[str, Dict]:
         "task_kwargs": request.task_kwargs or {},
         "preprocessing_kwargs": request.preprocessing_kwargs or {},
     }
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """Returns the session shared by all skill calls, so connections are reused."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                ssl=None if os.getenv("VERIFY_SSL") == "1" else False
+            )
+        )
+    return _session
+
+
+async def _call_skill(
+    skill_id: str, input_data: Dict, headers: Dict, timeout: float
+) -> Optional[Dict]:
+    """Queries a skill via the skill-manager. Returns None if the skill failed, did
+    not answer within the timeout or returned a body that is no JSON."""
+    url = os.getenv("SQUARE_API_URL") + "/skill-manager/skill/" + skill_id + "/query"
+    try:
+        async with _get_session().post(
+            url,
+            json=input_data,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+    except asyncio.TimeoutError:
+        logger.warning(f"Skill {skill_id} did not answer within {timeout}s")
+    except aiohttp.ClientError as e:
+        logger.warning(f"Calling skill {skill_id} failed: {e}")
+    except ValueError as e:
+        logger.warning(f"Skill {skill_id} returned an invalid response: {e}")
+    return None
+
+
+async def call_skills(
+    list_skills: List[str],
+    request: QueryRequest,
+    token: Optional[str] = None,
+) -> List[Optional[Dict]]:
+    """Calls the skills in parallel and returns their responses in the order of
+    `list_skills`.
+
+    Each skill has to answer within `agent_timeout` seconds (skill arg or
+    `METAQA_AGENT_TIMEOUT`). If a `deadline` (skill arg or `METAQA_DEADLINE`) is set,
+    the skills that did not answer when it passes are cancelled. The responses of
+    failed, timed out and cancelled skills are None, so that the other responses
+    keep their position.
+    """
+    agent_timeout = float(
+        request.skill_args.get(
+            "agent_timeout", os.getenv("METAQA_AGENT_TIMEOUT", 30)
+        )
+    )
+    deadline = request.skill_args.get("deadline", os.getenv("METAQA_DEADLINE"))
+    deadline = float(deadline) if deadline else None
+
+    input_data = {
+        "query": request.query,
+        "skill_args": {
+            "context": request.skill_args.get("context", ""),
+            "choices": request.skill_args.get("choices", []),
+        },
+        "skill": {},
+        "user_id": "",
+        "explain_kwargs": {},
+    }
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    tasks = [
+        asyncio.create_task(_call_skill(skill_id, input_data, headers, agent_timeout))
+        for skill_id in list_skills
+    ]
+    if not tasks:
+        return []
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(
+            f"{len(pending)} of {len(tasks)} skills did not answer within the "
+            f"deadline of {deadline}s"
+        )
+    return [None if task in pending else task.result() for task in tasks]
+
+
+def get_agent_prediction(skill_response: Optional[Dict]) -> Tuple[str, float]:
+    """Returns the top prediction and its score of a skill response, or
+    `EMPTY_PREDICTION` if the skill did not answer or the response has no
+    prediction."""
+    try:
+        output = skill_response["predictions"][0]["prediction_output"]
+        return output["output"], output["output_score"]
+    except (KeyError, IndexError, TypeError):
+        return EMPTY_PREDICTION